@@ -34,6 +34,30 @@ def create_app():
     # 初始化SocketIO
     socketio.init_app(app, cors_allowed_origins="*")
     
+    # 订阅Docker事件，实时维护容器状态
+    from events import get_event_watcher
+    get_event_watcher().start(socketio)
+    
+    # 耗时的容器操作在后台任务中执行
+    from jobs import get_job_queue
+    get_job_queue().start(socketio)
+    
+    # 后台补足预热容器池
+    from pool import get_warm_pool
+    get_warm_pool().start(socketio)
+    
+    # 空闲容器休眠，有连接时由激活器唤醒
+    from idle import get_idle_manager
+    get_idle_manager().start(socketio)
+    
+    # 容器到期时删除
+    from expiry import get_expiry_reaper
+    get_expiry_reaper().start(socketio)
+    
+    # 主机反向代理路由表，合并域名变化后统一重载 nginx
+    from hostproxy import get_route_table
+    get_route_table().start(socketio)
+    
     return app
 
 def main():
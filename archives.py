@@ -0,0 +1,258 @@
+import io
+import posixpath
+import stat
+import tarfile
+import time
+import zipfile
+import zlib
+from typing import Callable, Iterator, List, Optional
+from engine import IterStream
+
+
+class ArchiveError(Exception):
+    """归档格式无效或超出解压限制"""
+    pass
+
+
+# 支持打包下载的格式及其 MIME 类型
+ARCHIVE_FORMATS = {
+    'tar.gz': 'application/gzip',
+    'zip': 'application/zip'
+}
+
+# zip 中符号链接目标的最大长度(Linux 的 PATH_MAX)
+MAX_LINK_SIZE = 4096
+
+
+class ArchiveEntry:
+    """归档中的一项，kind 为 d(目录)、f(普通文件)或 l(符号链接)
+
+    普通文件的内容由 open() 按块读取，只能在取下一项之前读取一次。
+    """
+
+    def __init__(self, name: str, kind: str, size: int = 0, mode: int = 0o644, mtime: float = 0,
+                 linkname: str = '', open: Optional[Callable[[], Iterator[bytes]]] = None):
+        self.name = name
+        self.kind = kind
+        self.size = size
+        self.mode = mode
+        self.mtime = mtime
+        self.linkname = linkname
+        self._open = open
+
+    def open(self) -> Iterator[bytes]:
+        return self._open() if self._open is not None else iter(())
+
+
+class _Sink(io.RawIOBase):
+    """只写、不可 seek 的缓冲，生成器每写完一段就取走已产生的数据"""
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._parts.append(bytes(b))
+        return len(b)
+
+    def drain(self) -> bytes:
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def _tar_info(entry: ArchiveEntry) -> tarfile.TarInfo:
+    info = tarfile.TarInfo(entry.name)
+    info.mode = entry.mode
+    info.mtime = int(entry.mtime)
+    if entry.kind == 'd':
+        info.type = tarfile.DIRTYPE
+    elif entry.kind == 'l':
+        info.type = tarfile.SYMTYPE
+        info.linkname = entry.linkname
+    else:
+        info.size = entry.size
+    return info
+
+
+def iter_tar(entries: Iterator[ArchiveEntry]) -> Iterator[bytes]:
+    """把归档项边读边封装为 tar 流
+
+    文件实际长度与声明的大小不一致(读取期间被修改)时截断或补零，保证 tar 结构完整。
+    """
+    for entry in entries:
+        yield _tar_info(entry).tobuf(format=tarfile.GNU_FORMAT)
+        if entry.kind != 'f':
+            continue
+        remaining = entry.size
+        for block in entry.open():
+            block = block[:remaining]
+            remaining -= len(block)
+            if block:
+                yield block
+            if not remaining:
+                break
+        if remaining:
+            yield b'\0' * remaining
+        yield b'\0' * (-entry.size % tarfile.BLOCKSIZE)
+    yield b'\0' * (tarfile.BLOCKSIZE * 2)
+
+
+def gzip_stream(chunks: Iterator[bytes], level: int = 6) -> Iterator[bytes]:
+    """以 gzip 格式压缩字节流"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for block in chunks:
+        data = compressor.compress(block)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def iter_zip(entries: Iterator[ArchiveEntry]) -> Iterator[bytes]:
+    """把归档项边读边封装为 zip 流，输出不可 seek，文件大小和校验写在数据描述符中"""
+    sink = _Sink()
+    archive = zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED, allowZip64=True)
+    for entry in entries:
+        # zip 只能表示 1980 年以后的时间
+        info = zipfile.ZipInfo(entry.name + ('/' if entry.kind == 'd' else ''),
+                               date_time=time.localtime(max(entry.mtime, 315532800))[:6])
+        file_type = stat.S_IFDIR if entry.kind == 'd' else stat.S_IFLNK if entry.kind == 'l' else stat.S_IFREG
+        info.external_attr = (file_type | entry.mode) << 16
+        if entry.kind == 'd':
+            info.external_attr |= 0x10
+            archive.writestr(info, b'')
+        elif entry.kind == 'l':
+            archive.writestr(info, entry.linkname)
+        else:
+            info.compress_type = zipfile.ZIP_DEFLATED
+            with archive.open(info, 'w', force_zip64=True) as dst:
+                for block in entry.open():
+                    dst.write(block)
+                    data = sink.drain()
+                    if data:
+                        yield data
+        yield sink.drain()
+    archive.close()
+    yield sink.drain()
+
+
+def build_archive(entries: Iterator[ArchiveEntry], fmt: str) -> Iterator[bytes]:
+    """按格式生成归档流"""
+    if fmt == 'zip':
+        return iter_zip(entries)
+    if fmt == 'tar.gz':
+        return gzip_stream(iter_tar(entries))
+    raise ArchiveError("不支持的归档格式")
+
+
+def _tar_members(tar: tarfile.TarFile) -> Iterator[ArchiveEntry]:
+    for member in tar:
+        if member.isdir():
+            yield ArchiveEntry(member.name, 'd', mode=member.mode, mtime=member.mtime)
+        elif member.issym():
+            yield ArchiveEntry(member.name, 'l', mode=member.mode, mtime=member.mtime,
+                               linkname=member.linkname)
+        elif member.isfile():
+            src = tar.extractfile(member)
+            yield ArchiveEntry(member.name, 'f', member.size, member.mode, member.mtime,
+                               open=lambda src=src: iter(lambda: src.read(1024 * 64), b''))
+        else:
+            # 设备文件、硬链接等
+            yield ArchiveEntry(member.name, '?')
+
+
+def tar_entries(chunks: Iterator[bytes]) -> Iterator[ArchiveEntry]:
+    """逐项读取 tar 流，用于把容器归档接口返回的 tar 转换为其他格式"""
+    with tarfile.open(fileobj=IterStream(chunks), mode='r|') as tar:
+        for entry in _tar_members(tar):
+            if entry.kind != '?':
+                yield entry
+
+
+def safe_member_parts(name: str) -> Optional[List[str]]:
+    """把归档成员名规范为相对路径的各级名称，含 .. 时返回 None，根目录本身返回空列表"""
+    parts = []
+    for part in name.replace('\\', '/').split('/'):
+        if part in ('', '.'):
+            continue
+        if part == '..':
+            return None
+        parts.append(part)
+    return parts
+
+
+def _zip_entries(fileobj) -> Iterator[ArchiveEntry]:
+    with zipfile.ZipFile(fileobj) as archive:
+        for info in archive.infolist():
+            mode = info.external_attr >> 16
+            if info.is_dir():
+                yield ArchiveEntry(info.filename, 'd', mode=stat.S_IMODE(mode) or 0o755)
+            elif stat.S_ISLNK(mode):
+                # 符号链接的目标存放在成员内容中，不经过 counted 计数，先限制大小再读取
+                if info.file_size > MAX_LINK_SIZE:
+                    raise ArchiveError(f"归档中的符号链接无效: {info.filename}")
+                with archive.open(info) as src:
+                    linkname = src.read(MAX_LINK_SIZE + 1)
+                if len(linkname) > MAX_LINK_SIZE:
+                    raise ArchiveError(f"归档中的符号链接无效: {info.filename}")
+                yield ArchiveEntry(info.filename, 'l', mode=0o777, linkname=linkname.decode(errors='replace'))
+            else:
+                yield ArchiveEntry(info.filename, 'f', info.file_size, stat.S_IMODE(mode) or 0o644,
+                                   time.mktime(info.date_time + (0, 0, -1)),
+                                   open=lambda info=info: _read_zip_member(archive, info))
+
+
+def _read_zip_member(archive: zipfile.ZipFile, info: zipfile.ZipInfo) -> Iterator[bytes]:
+    with archive.open(info) as src:
+        while True:
+            block = src.read(1024 * 64)
+            if not block:
+                break
+            yield block
+
+
+_FORMAT_ERRORS = (tarfile.TarError, zipfile.BadZipFile, zlib.error, EOFError, OSError)
+
+
+def read_archive(fileobj, filename: str, max_size: int, max_entries: int) -> Iterator[ArchiveEntry]:
+    """逐项读取上传的归档(zip、tar、tar.gz、tar.bz2、tar.xz)
+
+    成员名规范为安全的相对路径，文件内容边读边计数，
+    解压后总大小超过 max_size 或项数超过 max_entries 时抛出 ArchiveError。
+    zip 需要可 seek 的文件对象。
+    """
+    total = [0]
+
+    def counted(chunks: Iterator[bytes]) -> Iterator[bytes]:
+        try:
+            for block in chunks:
+                total[0] += len(block)
+                if total[0] > max_size:
+                    raise ArchiveError("解压后的大小超过限制")
+                yield block
+        except _FORMAT_ERRORS as e:
+            raise ArchiveError(f"归档文件无效: {str(e)}")
+
+    try:
+        if filename.lower().endswith('.zip'):
+            entries = _zip_entries(fileobj)
+        else:
+            entries = _tar_members(tarfile.open(fileobj=fileobj, mode='r|*'))
+        for count, entry in enumerate(entries, 1):
+            if count > max_entries:
+                raise ArchiveError("归档中的文件数量超过限制")
+            parts = safe_member_parts(entry.name)
+            if parts is None:
+                raise ArchiveError(f"归档中含有不安全的路径: {entry.name}")
+            if not parts:
+                continue
+            entry.name = posixpath.join(*parts)
+            if entry.kind == 'f':
+                if total[0] + entry.size > max_size:
+                    raise ArchiveError("解压后的大小超过限制")
+                entry._open = lambda original=entry._open: counted(original())
+            yield entry
+    except _FORMAT_ERRORS as e:
+        raise ArchiveError(f"归档文件无效: {str(e)}")
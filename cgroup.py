@@ -0,0 +1,118 @@
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+
+def _read_int(path: str) -> Optional[int]:
+    """读取只含一个整数的 cgroup 文件，'max' 返回 None"""
+    with open(path, 'r') as f:
+        value = f.read().strip()
+    return None if value == 'max' else int(value)
+
+
+def _read_keyed(path: str) -> Dict[str, int]:
+    """读取 cpu.stat / memory.stat 这类 'key value' 格式的文件"""
+    result = {}
+    with open(path, 'r') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 2:
+                result[parts[0]] = int(parts[1])
+    return result
+
+
+def _host_memory() -> int:
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+
+
+class CgroupReader:
+    """基于 cgroup v2 的容器资源读取器
+
+    直接读取宿主机上容器 cgroup 目录中的 cpu.stat、memory.current 和
+    memory.max，CPU 使用率由相邻两次采样的 usage_usec 差值计算，
+    与 docker stats 一样以单核为 100%。
+    """
+
+    def __init__(self, root: str = '/sys/fs/cgroup'):
+        self.root = root
+        self._containers = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def detect(cls, root: str = '/sys/fs/cgroup') -> Optional['CgroupReader']:
+        """宿主机使用 cgroup v2 时返回读取器，否则返回 None"""
+        if os.path.exists(os.path.join(root, 'cgroup.controllers')):
+            return cls(root)
+        return None
+
+    def _locate(self, container_id: str, pid: int = 0) -> Optional[str]:
+        candidates = [
+            os.path.join(self.root, 'system.slice', f'docker-{container_id}.scope'),  # systemd 驱动
+            os.path.join(self.root, 'docker', container_id),  # cgroupfs 驱动
+        ]
+        if pid:
+            try:
+                with open(f'/proc/{pid}/cgroup', 'r') as f:
+                    for line in f:
+                        if line.startswith('0::'):
+                            candidates.append(os.path.join(self.root, line[3:].strip().lstrip('/')))
+            except OSError:
+                pass
+        for path in candidates:
+            if os.path.exists(os.path.join(path, 'cpu.stat')):
+                return path
+        return None
+
+    def remember(self, container_name: str, container_id: str, pid: int = 0) -> bool:
+        """记录容器名对应的 cgroup 目录，找不到目录时返回 False"""
+        path = self._locate(container_id, pid)
+        with self._lock:
+            if path is None:
+                self._containers.pop(container_name, None)
+                return False
+            entry = self._containers.get(container_name)
+            if entry is None or entry['path'] != path:
+                self._containers[container_name] = {'path': path, 'last': None}
+        return True
+
+    def forget(self, container_name: str) -> None:
+        with self._lock:
+            self._containers.pop(container_name, None)
+
+    def read_container(self, container_name: str) -> Optional[Dict]:
+        """读取容器的 CPU 与内存使用
+
+        容器未记录或 cgroup 目录已消失(容器停止/被重建)时返回 None，
+        调用方应重新 inspect 后调用 remember。
+        """
+        with self._lock:
+            entry = self._containers.get(container_name)
+        if entry is None:
+            return None
+
+        path = entry['path']
+        try:
+            usage_usec = _read_keyed(os.path.join(path, 'cpu.stat'))['usage_usec']
+            memory_current = _read_int(os.path.join(path, 'memory.current'))
+            memory_max = _read_int(os.path.join(path, 'memory.max'))
+            inactive_file = _read_keyed(os.path.join(path, 'memory.stat')).get('inactive_file', 0)
+        except (OSError, KeyError, ValueError):
+            self.forget(container_name)
+            return None
+
+        now = time.monotonic()
+        cpu_percent = 0.0
+        last = entry['last']
+        if last is not None:
+            wall_usec = (now - last[0]) * 1e6
+            if wall_usec > 0:
+                cpu_percent = max(usage_usec - last[1], 0) / wall_usec * 100
+        entry['last'] = (now, usage_usec)
+
+        return {
+            'cpu_usage': round(cpu_percent, 2),
+            # 与 docker stats 一致，扣除可回收的页缓存
+            'memory_usage': max(memory_current - inactive_file, 0),
+            'memory_limit': memory_max if memory_max is not None else _host_memory()
+        }
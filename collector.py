@@ -0,0 +1,97 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+from utils import get_container_name
+from registry import get_registry
+
+
+class StatsCollector:
+    """容器状态采集器
+
+    由单个后台任务按固定周期采集所有容器的状态并缓存最新快照，
+    再推送到各容器的 Socket.IO 房间。采集开销只与容器数量有关，
+    与打开的管理面板数量无关。
+    """
+
+    def __init__(self, docker_manager, interval: float = 3.0, workers: int = 4):
+        self.docker_manager = docker_manager
+        self.interval = interval
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._snapshots = {}
+        self._lock = threading.Lock()
+        self._socketio = None
+
+    @staticmethod
+    def room(container_id: str) -> str:
+        """容器状态推送的房间名"""
+        return f'container_{container_id}'
+
+    @staticmethod
+    def event(container_id: str) -> str:
+        return f'status_update_{container_id}'
+
+    def start(self, socketio) -> None:
+        """启动后台采集任务，重复调用无副作用"""
+        with self._lock:
+            if self._socketio is not None:
+                return
+            self._socketio = socketio
+        socketio.start_background_task(self._run)
+
+    def get(self, container_id: str, max_age: Optional[float] = None) -> Optional[Dict]:
+        """获取缓存的快照，超过 max_age 秒视为过期"""
+        with self._lock:
+            entry = self._snapshots.get(container_id)
+        if entry is None:
+            return None
+        sampled_at, status = entry
+        if max_age is not None and time.monotonic() - sampled_at > max_age:
+            return None
+        return status
+
+    def sample(self, container_id: str) -> Dict:
+        """立即采集单个容器并更新缓存"""
+        status = self.docker_manager.get_container_status(get_container_name(int(container_id)))
+        with self._lock:
+            self._snapshots[container_id] = (time.monotonic(), status)
+        return status
+
+    def collect_once(self) -> None:
+        """采集所有容器并推送到对应房间"""
+        container_ids = list(get_registry().list_containers().keys())
+        statuses = self._executor.map(self.sample, container_ids)
+        for container_id, status in zip(container_ids, statuses):
+            if self._socketio is not None:
+                self._socketio.emit(self.event(container_id), status, room=self.room(container_id))
+
+        # 清理已删除容器的快照
+        with self._lock:
+            for container_id in set(self._snapshots) - set(container_ids):
+                del self._snapshots[container_id]
+
+    def _run(self) -> None:
+        while True:
+            started = time.monotonic()
+            try:
+                self.collect_once()
+            except Exception as e:
+                print(f"状态采集错误: {str(e)}")
+            elapsed = time.monotonic() - started
+            self._socketio.sleep(max(self.interval - elapsed, 0.1))
+
+
+_collector = None
+_collector_lock = threading.Lock()
+
+
+def get_collector() -> StatsCollector:
+    """获取全局状态采集器"""
+    global _collector
+    if _collector is None:
+        with _collector_lock:
+            if _collector is None:
+                from config import COLLECTOR_INTERVAL, COLLECTOR_WORKERS
+                from models import DockerManager
+                _collector = StatsCollector(DockerManager(), COLLECTOR_INTERVAL, COLLECTOR_WORKERS)
+    return _collector
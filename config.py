@@ -15,6 +15,12 @@ HOST = '0.0.0.0'
 PORT = 8181
 
 # Docker配置
+# 'api': 通过 docker.sock 直接调用 Engine API; 'cli': 调用 docker 命令行
+DOCKER_BACKEND = 'api'
+DOCKER_SOCKET = 'unix:///var/run/docker.sock'
+DOCKER_CLI = ['sudo', 'docker']
+# 启用 userns-remap 时主机 uid 相对容器内 uid 的偏移，未启用为 0
+DOCKER_USERNS_OFFSET = 0
 BASE_HTTP_PORT = 5000
 BASE_SSH_PORT = 5100
 BASE_FTP_PORT = 5200
@@ -23,6 +29,43 @@ BASE_FTP_PORT = 5200
 MAX_MACHINES = 20
 DATA_DIR = "./data/containers"
 
+# 容器注册表配置: 'sqlite' 或 'json'
+# 使用 sqlite 时首次启动会自动从 containers.json 导入
+REGISTRY_BACKEND = 'sqlite'
+REGISTRY_DB = 'containers.db'
+
+# 状态采集配置
+COLLECTOR_INTERVAL = 3  # 采集周期(秒)
+COLLECTOR_WORKERS = 4   # 并发采集数
+
+# cgroup v2 挂载点，用于直接读取容器CPU/内存使用
+CGROUP_ROOT = '/sys/fs/cgroup'
+
+# 磁盘用量统计: 项目配额ID = 基数 + 容器ID; 遍历统计结果的缓存时间(秒)
+DISK_QUOTA_PROJECT_BASE = 10000
+DISK_SCAN_INTERVAL = 60
+
+# 分块上传: 暂存目录(应与 DATA_DIR 在同一文件系统)、分块大小、未完成上传的保留时间(秒)
+UPLOAD_DIR = "./data/uploads"
+UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+UPLOAD_EXPIRE = 24 * 3600
+
+# 文件列表: 默认每页条数、每页最大条数
+LIST_PAGE_SIZE = 200
+LIST_PAGE_MAX = 1000
+
+# 网页终端输出: 合并窗口(秒)、单帧最大字符数、未确认帧上限
+TERMINAL_FLUSH_INTERVAL = 0.02
+TERMINAL_MAX_FRAME = 32 * 1024
+TERMINAL_MAX_INFLIGHT = 4
+
+# 终端会话: 空闲超时(秒)、无连接附加时的保留时间(秒)、
+# 每个会话的回滚缓冲区大小(字节)、每个容器最多保留的会话数
+TERMINAL_IDLE_TIMEOUT = 1800
+TERMINAL_DETACH_TIMEOUT = 600
+TERMINAL_SCROLLBACK = 256 * 1024
+TERMINAL_MAX_SESSIONS = 4
+
 # 容器资源限制
 CONTAINER_LIMITS = {
     'cpu_period': 100000,
@@ -30,3 +73,67 @@ CONTAINER_LIMITS = {
     'mem_limit': '51.2m',
     'storage_size': '3G'
 }
+
+# 在线编辑器: 默认每次读取的字节数、单次读取上限
+EDITOR_READ_SIZE = 1024 * 1024
+EDITOR_READ_MAX = 8 * 1024 * 1024
+
+# 归档解压: 解压后的总大小上限、文件数量上限
+ARCHIVE_MAX_SIZE = 2 * 1024 * 1024 * 1024
+ARCHIVE_MAX_ENTRIES = 20000
+
+# 文件搜索: 结果数上限、耗时上限(秒)、搜索内容的单个文件大小上限
+SEARCH_MAX_RESULTS = 500
+SEARCH_TIME_LIMIT = 10
+SEARCH_MAX_FILE_SIZE = 10 * 1024 * 1024
+
+# 预热容器池: 每种镜像类型预先启动的容器数(0 表示不预热)、池状态文件、补充检查周期(秒)
+WARM_POOL_SIZES = {'base': 1, 'php': 1, 'python': 1}
+WARM_POOL_STATE = "./data/pool.json"
+WARM_POOL_INTERVAL = 30
+
+# 后台任务: 每种任务的并发上限、主机上同时进行的 Docker 重操作数、已结束任务的保留时间(秒)
+JOB_CONCURRENCY = {'create': 2, 'reset': 2, 'power': 4, 'website': 4}
+JOB_DOCKER_CONCURRENCY = 2
+JOB_RETENTION = 3600
+
+# 主机反向代理: 生成的路由配置文件、配置校验和重载命令、
+# 合并域名变化的等待时间(秒)、从注册表重新同步的周期(秒)
+PROXY_ROUTES_CONFIG = "/etc/nginx/vhost.d/dotmachine.conf"
+PROXY_TEST_COMMAND = ['nginx', '-t']
+PROXY_RELOAD_COMMAND = ['nginx', '-s', 'reload']
+PROXY_RELOAD_DEBOUNCE = 2
+PROXY_RESYNC_INTERVAL = 300
+
+# 前端 HTTP 路由(可选，python3 router.py 单独运行): 监听地址、管理接口地址(仅本机)、
+# 上游地址、每个上游保留的空闲连接数、空闲连接超时(秒)、连接上游超时(秒)、
+# 从注册表重新加载域名的周期(秒)、客户端空闲超时(秒)、等待上游响应超时(秒)
+ROUTER_HOST = '0.0.0.0'
+ROUTER_PORT = 8080
+ROUTER_ADMIN_HOST = '127.0.0.1'
+ROUTER_ADMIN_PORT = 8182
+ROUTER_UPSTREAM_HOST = '127.0.0.1'
+ROUTER_UPSTREAM_MAX_IDLE = 8
+ROUTER_UPSTREAM_IDLE_TIMEOUT = 30
+ROUTER_CONNECT_TIMEOUT = 5
+ROUTER_REFRESH_INTERVAL = 2
+ROUTER_CLIENT_TIMEOUT = 60
+ROUTER_UPSTREAM_TIMEOUT = 60
+
+# 前端路由的响应缓存: 总内存上限(字节，0 表示不缓存)、单个域名的上限、单个响应的上限
+ROUTER_CACHE_SIZE = 64 * 1024 * 1024
+ROUTER_CACHE_DOMAIN_SIZE = 8 * 1024 * 1024
+ROUTER_CACHE_MAX_OBJECT = 1024 * 1024
+
+# 空闲休眠: 无网络流量、CPU 低于阈值(%)且没有网页终端的容器，超过该时间(秒)后停止(0 表示不休眠)，
+# 检查周期(秒)、有连接时等待容器内服务就绪的最长时间(秒)
+IDLE_TIMEOUT = 1800
+IDLE_CPU_THRESHOLD = 1.0
+IDLE_CHECK_INTERVAL = 60
+IDLE_WAKE_TIMEOUT = 30
+
+# 过期清理: 并行删除容器的线程数、数据目录的回收目录(应与 DATA_DIR 在同一文件系统)、
+# 从注册表重建过期时间表的周期(秒)
+EXPIRY_WORKERS = 4
+EXPIRY_TRASH_DIR = "./data/trash"
+EXPIRY_RESCAN_INTERVAL = 3600
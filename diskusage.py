@@ -0,0 +1,243 @@
+import os
+import shutil
+import subprocess
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from utils import get_data_dir, parse_storage_size
+
+
+class QuotaExceeded(Exception):
+    """容器存储空间不足"""
+    pass
+
+
+def _find_mount(path: str) -> Optional[Tuple[str, str, str]]:
+    """返回 path 所在的 (挂载点, 文件系统类型, 挂载选项)"""
+    path = os.path.realpath(path)
+    best = None
+    try:
+        with open('/proc/mounts', 'r') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) < 4:
+                    continue
+                mount_point = parts[1].replace('\\040', ' ')
+                if path == mount_point or path.startswith(mount_point.rstrip('/') + '/'):
+                    if best is None or len(mount_point) > len(best[0]):
+                        best = (mount_point, parts[2], parts[3])
+    except OSError:
+        return None
+    return best
+
+
+class ProjectQuotaBackend:
+    """基于 XFS/ext4 项目配额的用量统计与限额
+
+    每个容器的数据目录对应一个项目ID，限额由内核强制执行，
+    用量通过一次配额报告批量获取。
+    """
+
+    def __init__(self, mount_point: str, fstype: str, project_base: int):
+        self.mount_point = mount_point
+        self.fstype = fstype
+        self.project_base = project_base
+
+    @classmethod
+    def detect(cls, path: str, project_base: int) -> Optional['ProjectQuotaBackend']:
+        mount = _find_mount(path)
+        if mount is None:
+            return None
+        mount_point, fstype, options = mount
+        options = options.split(',')
+        if fstype == 'xfs' and ({'prjquota', 'pquota', 'pqnoenforce'} & set(options)) and shutil.which('xfs_quota'):
+            return cls(mount_point, fstype, project_base)
+        if fstype == 'ext4' and 'prjquota' in options and shutil.which('setquota') and shutil.which('repquota'):
+            return cls(mount_point, fstype, project_base)
+        return None
+
+    def project_id(self, container_id: int) -> int:
+        return self.project_base + container_id
+
+    def _xfs(self, command: str) -> str:
+        return subprocess.run(['xfs_quota', '-x', '-c', command, self.mount_point],
+                              check=True, capture_output=True, text=True).stdout
+
+    def setup(self, container_id: int, data_dir: str, limit: int) -> None:
+        """为数据目录设置项目ID和硬限额"""
+        project_id = self.project_id(container_id)
+        limit_kb = str(limit // 1024)
+        if self.fstype == 'xfs':
+            self._xfs(f'project -s -p {data_dir} {project_id}')
+            self._xfs(f'limit -p bhard={limit_kb}k {project_id}')
+        else:
+            subprocess.run(['chattr', '-R', '-p', str(project_id), '+P', data_dir],
+                           check=True, capture_output=True)
+            subprocess.run(['setquota', '-P', str(project_id), '0', limit_kb, '0', '0', self.mount_point],
+                           check=True, capture_output=True)
+
+    def report(self) -> Dict[int, int]:
+        """一次性获取所有项目的已用字节数"""
+        if self.fstype == 'xfs':
+            output = self._xfs('report -p -b -n -N')
+        else:
+            output = subprocess.run(['repquota', '-P', '-n', '-p', self.mount_point],
+                                    check=True, capture_output=True, text=True).stdout
+        usage = {}
+        for line in output.splitlines():
+            parts = line.split()
+            if not parts or not parts[0].startswith('#'):
+                continue
+            try:
+                project_id = int(parts[0][1:])
+                # repquota 在ID后有一列状态标记
+                used_kb = int(parts[1] if self.fstype == 'xfs' else parts[2])
+            except (ValueError, IndexError):
+                continue
+            usage[project_id] = used_kb * 1024
+        return usage
+
+
+class WalkBackend:
+    """遍历数据目录统计用量的兜底实现
+
+    缓存每个目录的条目列表，目录 mtime 未变化时不再 readdir，
+    每次只需对文件做 lstat。
+    """
+
+    def __init__(self):
+        self._listings = {}
+
+    def usage(self, root: str) -> int:
+        total = 0
+        visited = {}
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            try:
+                st = os.lstat(directory)
+            except OSError:
+                continue
+            total += st.st_blocks * 512
+            cached = self._listings.get(directory)
+            if cached is not None and cached[0] == st.st_mtime_ns:
+                entries = cached[1]
+            else:
+                try:
+                    with os.scandir(directory) as it:
+                        entries = [(entry.name, entry.is_dir(follow_symlinks=False)) for entry in it]
+                except OSError:
+                    entries = []
+            visited[directory] = (st.st_mtime_ns, entries)
+            for name, is_dir in entries:
+                path = os.path.join(directory, name)
+                if is_dir:
+                    stack.append(path)
+                    continue
+                try:
+                    total += os.lstat(path).st_blocks * 512
+                except OSError:
+                    pass
+
+        # 只保留本次遍历到的目录，已删除的目录不再占用缓存
+        prefix = root.rstrip('/') + '/'
+        for directory in [d for d in self._listings if d == root or d.startswith(prefix)]:
+            if directory not in visited:
+                del self._listings[directory]
+        self._listings.update(visited)
+        return total
+
+
+class DiskAccounting:
+    """容器数据目录的主机侧磁盘用量统计
+
+    优先使用项目配额(由内核强制限额)，不支持时退回缓存遍历，
+    此时由文件管理的写入路径调用 check_quota 执行限额。
+    全程不进入容器。
+    """
+
+    def __init__(self, data_root: str, limit: int, project_base: int, refresh_interval: float):
+        self.limit = limit
+        self.refresh_interval = refresh_interval
+        self.quota = ProjectQuotaBackend.detect(data_root, project_base)
+        self.walker = WalkBackend()
+        self._usage = {}
+        self._quota_report = (0.0, {})
+        self._lock = threading.Lock()
+
+    @property
+    def enforced_by_kernel(self) -> bool:
+        return self.quota is not None
+
+    def setup(self, container_id: int, data_dir: str) -> None:
+        """新建数据目录后设置限额"""
+        if self.quota is not None:
+            try:
+                self.quota.setup(container_id, data_dir, self.limit)
+            except (OSError, subprocess.CalledProcessError) as e:
+                print(f"设置磁盘配额失败: {str(e)}")
+
+    def _used_bytes(self, container_id: int, max_age: float) -> int:
+        now = time.monotonic()
+        if self.quota is not None:
+            with self._lock:
+                fetched_at, report = self._quota_report
+                if now - fetched_at > max_age:
+                    try:
+                        report = self.quota.report()
+                    except (OSError, subprocess.CalledProcessError):
+                        report = {}
+                    self._quota_report = (now, report)
+            used = report.get(self.quota.project_id(container_id))
+            if used is not None:
+                return used
+
+        with self._lock:
+            cached = self._usage.get(container_id)
+            if cached is not None and now - cached[0] <= max_age:
+                return cached[1]
+            used = self.walker.usage(get_data_dir(container_id))
+            self._usage[container_id] = (now, used)
+            return used
+
+    def usage(self, container_id: int) -> Dict:
+        """返回 {'disk_usage': 已用字节, 'disk_limit': 限额字节}"""
+        return {
+            'disk_usage': self._used_bytes(container_id, self.refresh_interval),
+            'disk_limit': self.limit
+        }
+
+    def check_quota(self, container_id: int, incoming: int = 0) -> None:
+        """写入前检查剩余空间，不足时抛出 QuotaExceeded"""
+        used = self._used_bytes(container_id, self.refresh_interval)
+        if used + incoming > self.limit:
+            raise QuotaExceeded("存储空间不足")
+
+    def remaining(self, container_id: int) -> int:
+        """剩余可用字节数，用于限制解压等写入量事先未知的操作"""
+        return max(self.limit - self._used_bytes(container_id, self.refresh_interval), 0)
+
+    def invalidate(self, container_id: int) -> None:
+        """数据目录发生较大变化后丢弃缓存的用量"""
+        with self._lock:
+            self._usage.pop(container_id, None)
+
+
+_accounting = None
+_accounting_lock = threading.Lock()
+
+
+def get_disk_accounting() -> DiskAccounting:
+    """获取全局磁盘用量统计"""
+    global _accounting
+    if _accounting is None:
+        with _accounting_lock:
+            if _accounting is None:
+                from config import DATA_DIR, CONTAINER_LIMITS, DISK_QUOTA_PROJECT_BASE, DISK_SCAN_INTERVAL
+                _accounting = DiskAccounting(
+                    os.path.abspath(DATA_DIR),
+                    parse_storage_size(CONTAINER_LIMITS['storage_size']),
+                    DISK_QUOTA_PROJECT_BASE,
+                    DISK_SCAN_INTERVAL
+                )
+    return _accounting
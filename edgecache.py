@@ -0,0 +1,183 @@
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+# 可以缓存的响应状态码
+CACHEABLE_STATUS = {200, 203, 204, 301, 404, 410}
+
+
+def parse_cache_control(value: str) -> Dict[str, Optional[str]]:
+    """解析 Cache-Control，返回 {指令: 参数或 None}"""
+    directives = {}
+    for part in value.split(','):
+        name, sep, arg = part.strip().partition('=')
+        if name:
+            directives[name.strip().lower()] = arg.strip().strip('"') if sep else None
+    return directives
+
+
+def _seconds(value: Optional[str]) -> Optional[int]:
+    if value is None or not value.isdigit():
+        return None
+    return int(value)
+
+
+class CacheEntry:
+    """一条缓存的响应：状态行、头部和完整的原始正文"""
+
+    def __init__(self, domain: str, status: int, reason: str, headers: List[Tuple[str, str]],
+                 body: bytes, ttl: float, stale_ttl: float):
+        self.domain = domain
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+        self.stored_at = time.monotonic()
+        self.expires = self.stored_at + ttl
+        self.stale_until = self.expires + stale_ttl
+        self.size = len(body) + sum(len(name) + len(value) + 4 for name, value in headers) + 64
+
+    def age(self) -> int:
+        return int(time.monotonic() - self.stored_at)
+
+
+class DomainCacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.stale = 0
+        self.misses = 0
+        self.entries = 0
+        self.bytes = 0
+
+    def to_dict(self) -> Dict:
+        return {'hits': self.hits, 'stale': self.stale, 'misses': self.misses,
+                'entries': self.entries, 'bytes': self.bytes}
+
+
+class EdgeCache:
+    """按域名区分的响应缓存
+
+    只缓存上游明确声明可共享缓存(s-maxage 或 max-age)的 GET 响应，
+    带 Set-Cookie、private、no-store、no-cache 或 Vary 除 Accept-Encoding 以外头部的响应不缓存。
+    缓存键只区分是否接受 gzip，发往上游的 Accept-Encoding 也相应改写为 gzip 或去掉。
+    过期后在 stale-while-revalidate 允许的时间内继续返回旧内容，由调用方在后台更新。
+    总内存超过 max_bytes 时按最近最少使用淘汰，单个域名最多占用 domain_max_bytes。
+    """
+
+    def __init__(self, max_bytes: int, domain_max_bytes: int, max_object: int):
+        self.max_bytes = max_bytes
+        self.domain_max_bytes = domain_max_bytes
+        self.max_object = max_object
+        self._entries: 'OrderedDict[Tuple, CacheEntry]' = OrderedDict()
+        self._bytes = 0
+        self.stats: Dict[str, DomainCacheStats] = {}
+
+    @staticmethod
+    def key(domain: str, request) -> Optional[Tuple]:
+        """请求的缓存键，不能使用缓存的请求返回 None"""
+        if request.method != 'GET' or request.get('authorization') or request.get('range'):
+            return None
+        encoding = 'gzip' if 'gzip' in request.get('accept-encoding').lower() else ''
+        return (domain, request.target, encoding)
+
+    @staticmethod
+    def bypass(request) -> bool:
+        """客户端要求不使用缓存内容(仍然可以用新响应更新缓存)"""
+        directives = parse_cache_control(request.get('cache-control'))
+        return ('no-cache' in directives or directives.get('max-age') == '0'
+                or 'no-cache' in request.get('pragma').lower())
+
+    def policy(self, response, encoding: str = '') -> Optional[Tuple[int, int]]:
+        """响应可以缓存时返回 (有效期, 过期后可继续使用的时间)，否则返回 None
+
+        encoding 是缓存键中的压缩方式，响应的 Content-Encoding 与之不符时不缓存，
+        以免把其他压缩格式的正文返回给只接受 gzip 的客户端。
+        """
+        if response.status not in CACHEABLE_STATUS or response.get('set-cookie'):
+            return None
+        if response.get('content-encoding').strip().lower() not in ('', 'identity', encoding):
+            return None
+        vary = [token.strip().lower() for token in response.get('vary').split(',') if token.strip()]
+        if any(token != 'accept-encoding' for token in vary):
+            return None
+        directives = parse_cache_control(response.get('cache-control'))
+        if {'private', 'no-store', 'no-cache'} & directives.keys():
+            return None
+        ttl = _seconds(directives.get('s-maxage', directives.get('max-age')))
+        if not ttl:
+            return None
+        return ttl, _seconds(directives.get('stale-while-revalidate')) or 0
+
+    def _domain_stats(self, domain: str) -> DomainCacheStats:
+        stats = self.stats.get(domain)
+        if stats is None:
+            stats = self.stats[domain] = DomainCacheStats()
+        return stats
+
+    def get(self, key: Tuple) -> Tuple[Optional[CacheEntry], bool]:
+        """返回 (缓存项, 是否已过期但仍可使用)；无可用缓存时返回 (None, False)"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None, False
+        now = time.monotonic()
+        if now > entry.stale_until:
+            self._remove(key)
+            return None, False
+        self._entries.move_to_end(key)
+        return entry, now > entry.expires
+
+    def record(self, domain: str, result: str) -> None:
+        stats = self._domain_stats(domain)
+        if result == 'hit':
+            stats.hits += 1
+        elif result == 'stale':
+            stats.stale += 1
+        else:
+            stats.misses += 1
+
+    def put(self, key: Tuple, entry: CacheEntry) -> None:
+        if entry.size > min(self.max_object, self.domain_max_bytes, self.max_bytes):
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = entry
+        self._bytes += entry.size
+        stats = self._domain_stats(entry.domain)
+        stats.entries += 1
+        stats.bytes += entry.size
+        # 先淘汰同一域名中最久未用的，再按全局 LRU 淘汰
+        if stats.bytes > self.domain_max_bytes:
+            for old_key in [k for k in self._entries if k[0] == entry.domain]:
+                if stats.bytes <= self.domain_max_bytes:
+                    break
+                self._remove(old_key)
+        while self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: Tuple) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        stats = self._domain_stats(entry.domain)
+        stats.entries -= 1
+        stats.bytes -= entry.size
+
+    def purge(self, domain: str, prefix: str = '') -> int:
+        """清除域名下(路径以 prefix 开头)的缓存，返回清除的条数"""
+        keys = [key for key in self._entries if key[0] == domain and key[1].startswith(prefix)]
+        for key in keys:
+            self._remove(key)
+        return len(keys)
+
+    def forget(self, domains) -> None:
+        """清除已不再路由的域名的缓存和统计"""
+        for domain in [domain for domain in self.stats if domain not in domains]:
+            self.purge(domain)
+            del self.stats[domain]
+
+    def snapshot(self) -> Dict:
+        return {
+            'bytes': self._bytes,
+            'max_bytes': self.max_bytes,
+            'entries': len(self._entries),
+            'domains': {domain: stats.to_dict() for domain, stats in self.stats.items()}
+        }
@@ -0,0 +1,491 @@
+import io
+import json
+import os
+import re
+import subprocess
+import tarfile
+import tempfile
+import threading
+import time
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+
+class EngineError(Exception):
+    """Docker引擎调用错误"""
+    pass
+
+
+class ExecResult(NamedTuple):
+    """命令执行结果，与 docker-py 的 ExecResult 字段保持一致"""
+    exit_code: int
+    output: bytes
+
+
+_SIZE_UNITS = {
+    'b': 1,
+    'kb': 1000, 'mb': 1000 ** 2, 'gb': 1000 ** 3, 'tb': 1000 ** 4,
+    'kib': 1024, 'mib': 1024 ** 2, 'gib': 1024 ** 3, 'tib': 1024 ** 4,
+}
+
+
+def parse_size(value: str) -> int:
+    """解析 docker CLI 输出的大小字符串，如 '10.5MiB'、'1.2GB'"""
+    match = re.match(r'^\s*([\d.]+)\s*([a-zA-Z]*)\s*$', value)
+    if not match:
+        raise ValueError(f"无法解析大小: {value}")
+    number, unit = match.groups()
+    return int(float(number) * _SIZE_UNITS.get(unit.lower() or 'b', 1))
+
+
+class IterStream(io.RawIOBase):
+    """将字节块迭代器包装为只读文件对象，供 tarfile 流式读取"""
+
+    def __init__(self, chunks: Iterator[bytes]):
+        self._chunks = iter(chunks)
+        self._buffer = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buffer:
+            try:
+                self._buffer = next(self._chunks)
+            except StopIteration:
+                return 0
+        size = min(len(b), len(self._buffer))
+        b[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+def _extract_single_file(chunks: Iterator[bytes], dest_path: str) -> None:
+    """从 tar 流中取出第一个普通文件写入 dest_path"""
+    with tarfile.open(fileobj=IterStream(chunks), mode='r|') as tar:
+        for member in tar:
+            if member.isfile():
+                src = tar.extractfile(member)
+                with open(dest_path, 'wb') as dst:
+                    while True:
+                        block = src.read(1024 * 64)
+                        if not block:
+                            break
+                        dst.write(block)
+                return
+    raise EngineError("归档中没有可下载的文件")
+
+
+class ArchiveFile:
+    """tar 流中的单个文件，边接收边顺序读取，不落盘"""
+
+    def __init__(self, chunks: Iterator[bytes]):
+        self._chunks = chunks
+        self._tar = tarfile.open(fileobj=IterStream(chunks), mode='r|')
+        member = self._tar.next()
+        if member is None or not member.isfile():
+            self.close()
+            raise EngineError("归档中没有可下载的文件")
+        self.name = member.name
+        self.size = member.size
+        self.mtime = member.mtime
+        self._file = self._tar.extractfile(member)
+
+    def read(self, size: int = -1) -> bytes:
+        return self._file.read(size)
+
+    def iter_chunks(self, chunk_size: int = 1024 * 64) -> Iterator[bytes]:
+        """按块读取文件内容，读完或中途放弃时关闭底层流"""
+        try:
+            while True:
+                block = self._file.read(chunk_size)
+                if not block:
+                    break
+                yield block
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        self._tar.close()
+        close = getattr(self._chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+def _pack_single_file(src_path: str, arcname: str):
+    """将单个文件打包为 tar，超过 8MB 时落盘以避免占用过多内存"""
+    archive = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    with tarfile.open(fileobj=archive, mode='w') as tar:
+        tar.add(src_path, arcname=arcname)
+    archive.seek(0)
+    return archive
+
+
+def _tar_header(arcname: str, size: int, mode: int, uid: int, gid: int, mtime: float) -> bytes:
+    info = tarfile.TarInfo(arcname)
+    info.size = size
+    info.mode = mode
+    info.uid = uid
+    info.gid = gid
+    info.mtime = int(mtime)
+    return info.tobuf(format=tarfile.GNU_FORMAT)
+
+
+def _tar_padding(size: int) -> bytes:
+    """文件内容的块对齐填充 + 归档结束标记"""
+    return b'\0' * (-size % tarfile.BLOCKSIZE + tarfile.BLOCKSIZE * 2)
+
+
+def tar_bytes(arcname: str, data: bytes, mode: int = 0o644, uid: int = 0, gid: int = 0) -> bytes:
+    """把一段内容封装为只含一个文件的 tar"""
+    return _tar_header(arcname, len(data), mode, uid, gid, time.time()) + data + _tar_padding(len(data))
+
+
+def tar_file_stream(src_path: str, arcname: str, mode: int = 0o644, uid: int = 0, gid: int = 0,
+                    chunk_size: int = 1024 * 64) -> Iterator[bytes]:
+    """把单个文件边读边封装为 tar 流，属主和权限写在 tar 头中随归档一起生效"""
+    size = os.path.getsize(src_path)
+    yield _tar_header(arcname, size, mode, uid, gid, os.path.getmtime(src_path))
+    with open(src_path, 'rb') as f:
+        while True:
+            block = f.read(chunk_size)
+            if not block:
+                break
+            yield block
+    yield _tar_padding(size)
+
+
+class ApiEngine:
+    """通过 unix socket 直接访问 Docker Engine API
+
+    底层 requests 会话会对 docker.sock 保持长连接并复用连接池，
+    避免每次操作都要 fork sudo 和 docker CLI 进程。
+    """
+
+    def __init__(self, base_url: str, timeout: int = 60, max_pool_size: int = 10):
+        import docker
+        self._errors = docker.errors
+        self.client = docker.APIClient(
+            base_url=base_url,
+            version='auto',
+            timeout=timeout,
+            max_pool_size=max_pool_size
+        )
+
+    def _call(self, func, *args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        except self._errors.DockerException as e:
+            raise EngineError(str(e)) from e
+
+    def image_exists(self, image: str) -> bool:
+        try:
+            self.client.inspect_image(image)
+            return True
+        except self._errors.ImageNotFound:
+            return False
+
+    def build_image(self, tag: str, dockerfile: str, path: str = '.') -> None:
+        for chunk in self._call(self.client.build, path=path, dockerfile=dockerfile,
+                                tag=tag, rm=True, decode=True):
+            if 'error' in chunk:
+                raise EngineError(chunk['error'])
+
+    def run_container(self, name: str, image: str, ports: Dict[int, int],
+                      volumes: Dict[str, str], environment: Dict[str, str],
+                      cpu_period: int, cpu_quota: int, mem_limit: str,
+                      privileged: bool = False, cap_add: Optional[List[str]] = None) -> str:
+        host_config = self.client.create_host_config(
+            port_bindings=ports,
+            binds=[f'{host}:{bind}' for host, bind in volumes.items()],
+            cpu_period=cpu_period,
+            cpu_quota=cpu_quota,
+            mem_limit=mem_limit,
+            privileged=privileged,
+            cap_add=cap_add
+        )
+        container = self._call(
+            self.client.create_container,
+            image,
+            name=name,
+            detach=True,
+            ports=list(ports.keys()),
+            environment=environment,
+            host_config=host_config
+        )
+        self._call(self.client.start, container['Id'])
+        return container['Id']
+
+    def inspect(self, name: str) -> Optional[Dict]:
+        try:
+            return self.client.inspect_container(name)
+        except self._errors.NotFound:
+            return None
+        except self._errors.DockerException as e:
+            raise EngineError(str(e)) from e
+
+    def start(self, name: str) -> None:
+        self._call(self.client.start, name)
+
+    def stop(self, name: str, timeout: int = 10) -> None:
+        self._call(self.client.stop, name, timeout=timeout)
+
+    def restart(self, name: str, timeout: int = 10) -> None:
+        self._call(self.client.restart, name, timeout=timeout)
+
+    def remove(self, name: str, force: bool = False) -> None:
+        self._call(self.client.remove_container, name, force=force)
+
+    def exec_run(self, name: str, cmd: List[str], user: str = '') -> ExecResult:
+        exec_id = self._call(self.client.exec_create, name, cmd, user=user)['Id']
+        output = self._call(self.client.exec_start, exec_id)
+        exit_code = self._call(self.client.exec_inspect, exec_id)['ExitCode']
+        return ExecResult(exit_code, output)
+
+    def exec_attach(self, name: str, cmd: List[str], user: str = '', workdir: Optional[str] = None,
+                    environment: Optional[Dict[str, str]] = None):
+        """以 TTY 模式创建 exec 并劫持其连接，返回 (exec_id, socket)"""
+        exec_id = self._call(self.client.exec_create, name, cmd, stdin=True, tty=True,
+                             user=user, workdir=workdir, environment=environment)['Id']
+        stream = self._call(self.client.exec_start, exec_id, tty=True, socket=True)
+        # unix socket 上返回的是 SocketIO 包装，取出底层 socket 才能注册到 selector
+        sock = getattr(stream, '_sock', stream)
+        return exec_id, sock
+
+    def exec_resize(self, exec_id: str, rows: int, cols: int) -> None:
+        self._call(self.client.exec_resize, exec_id, height=rows, width=cols)
+
+    def exec_inspect(self, exec_id: str) -> Dict:
+        return self._call(self.client.exec_inspect, exec_id)
+
+    def stats(self, name: str) -> Dict:
+        raw = self._call(self.client.stats, name, stream=False)
+        cpu = raw.get('cpu_stats', {})
+        precpu = raw.get('precpu_stats', {})
+        cpu_delta = cpu.get('cpu_usage', {}).get('total_usage', 0) - \
+            precpu.get('cpu_usage', {}).get('total_usage', 0)
+        system_delta = cpu.get('system_cpu_usage', 0) - precpu.get('system_cpu_usage', 0)
+        online_cpus = cpu.get('online_cpus') or len(cpu.get('cpu_usage', {}).get('percpu_usage') or []) or 1
+        cpu_percent = cpu_delta / system_delta * online_cpus * 100 if system_delta > 0 else 0.0
+
+        memory = raw.get('memory_stats', {})
+        # 与 docker CLI 一致，扣除页缓存
+        cache = memory.get('stats', {}).get('inactive_file', memory.get('stats', {}).get('cache', 0))
+        return {
+            'cpu_usage': round(cpu_percent, 2),
+            'memory_usage': max(memory.get('usage', 0) - cache, 0),
+            'memory_limit': memory.get('limit', 0)
+        }
+
+    def list_containers(self, name_prefix: str) -> List[Dict]:
+        """列出名称以 name_prefix 开头的容器: [{'id', 'name', 'state'}]"""
+        result = []
+        for item in self._call(self.client.containers, all=True, filters={'name': name_prefix}):
+            name = item['Names'][0].lstrip('/') if item.get('Names') else ''
+            if name.startswith(name_prefix):
+                result.append({'id': item['Id'], 'name': name, 'state': item.get('State', '')})
+        return result
+
+    def events(self, filters: Dict, since: Optional[int] = None) -> Iterator[Dict]:
+        """订阅事件流，返回阻塞的事件迭代器；给出 since(Unix 时间)时先补发此后已发生的事件"""
+        return self._call(self.client.events, filters=filters, since=since, decode=True)
+
+    def get_archive(self, name: str, path: str, chunk_size: int = 1024 * 64) -> Iterator[bytes]:
+        """以 tar 流的形式读取容器内的路径"""
+        stream, _ = self._call(self.client.get_archive, name, path, chunk_size=chunk_size)
+        return stream
+
+    def copy_from(self, name: str, path: str, dest_path: str) -> None:
+        _extract_single_file(self.get_archive(name, path), dest_path)
+
+    def put_archive(self, name: str, path: str, data) -> None:
+        """把 tar 流(字节、文件对象或字节块迭代器)解压到容器内的目录"""
+        if not self._call(self.client.put_archive, name, path, data):
+            raise EngineError(f"写入 {path} 失败")
+
+    def copy_to(self, name: str, src_path: str, dest_path: str) -> None:
+        with _pack_single_file(src_path, os.path.basename(dest_path)) as archive:
+            if not self._call(self.client.put_archive, name, os.path.dirname(dest_path) or '/', archive):
+                raise EngineError(f"写入 {dest_path} 失败")
+
+
+class CliEngine:
+    """通过 docker CLI 操作容器，兼容无法访问 docker.sock 的部署"""
+
+    def __init__(self, command: List[str]):
+        self.command = list(command)
+
+    def _run(self, *args: str, text: bool = True) -> subprocess.CompletedProcess:
+        try:
+            return subprocess.run(self.command + list(args), check=True, capture_output=True, text=text)
+        except subprocess.CalledProcessError as e:
+            stderr = e.stderr.decode(errors='replace') if isinstance(e.stderr, bytes) else e.stderr
+            raise EngineError(stderr.strip() if stderr else str(e)) from e
+
+    def image_exists(self, image: str) -> bool:
+        try:
+            self._run('image', 'inspect', image)
+            return True
+        except EngineError:
+            return False
+
+    def build_image(self, tag: str, dockerfile: str, path: str = '.') -> None:
+        self._run('build', '-t', tag, '-f', dockerfile, path)
+
+    def run_container(self, name: str, image: str, ports: Dict[int, int],
+                      volumes: Dict[str, str], environment: Dict[str, str],
+                      cpu_period: int, cpu_quota: int, mem_limit: str,
+                      privileged: bool = False, cap_add: Optional[List[str]] = None) -> str:
+        args = ['run', '-d', '--name', name]
+        if privileged:
+            args.append('--privileged')
+        for cap in cap_add or []:
+            args.append(f'--cap-add={cap}')
+        for container_port, host_port in ports.items():
+            args.extend(['-p', f'{host_port}:{container_port}'])
+        for host, bind in volumes.items():
+            args.extend(['-v', f'{host}:{bind}'])
+        args.extend([
+            '--cpu-period', str(cpu_period),
+            '--cpu-quota', str(cpu_quota),
+            '--memory', mem_limit.replace('m', 'M')
+        ])
+        for key, value in environment.items():
+            args.extend(['-e', f'{key}={value}'])
+        args.append(image)
+        return self._run(*args).stdout.strip()
+
+    def inspect(self, name: str) -> Optional[Dict]:
+        try:
+            return json.loads(self._run('inspect', name).stdout)[0]
+        except EngineError:
+            return None
+
+    def start(self, name: str) -> None:
+        self._run('start', name)
+
+    def stop(self, name: str, timeout: int = 10) -> None:
+        self._run('stop', '-t', str(timeout), name)
+
+    def restart(self, name: str, timeout: int = 10) -> None:
+        self._run('restart', '-t', str(timeout), name)
+
+    def remove(self, name: str, force: bool = False) -> None:
+        self._run('rm', *(['-f'] if force else []), name)
+
+    def exec_run(self, name: str, cmd: List[str], user: str = '') -> ExecResult:
+        args = self.exec_args(name, cmd, user=user)
+        result = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        return ExecResult(result.returncode, result.stdout)
+
+    def exec_args(self, name: str, cmd: List[str], user: str = '', workdir: Optional[str] = None,
+                  environment: Optional[Dict[str, str]] = None, tty: bool = False) -> List[str]:
+        """返回 docker exec 的完整命令行，供需要自行管理进程的调用方使用"""
+        args = self.command + ['exec'] + (['-it'] if tty else [])
+        if user:
+            args.extend(['-u', user])
+        if workdir:
+            args.extend(['-w', workdir])
+        for key, value in (environment or {}).items():
+            args.extend(['-e', f'{key}={value}'])
+        return args + [name] + list(cmd)
+
+    def stats(self, name: str) -> Dict:
+        stats = json.loads(self._run('stats', name, '--no-stream', '--format', '{{json .}}').stdout)
+        usage, limit = stats['MemUsage'].split('/')
+        return {
+            'cpu_usage': float(stats['CPUPerc'].strip('%')),
+            'memory_usage': parse_size(usage),
+            'memory_limit': parse_size(limit)
+        }
+
+    def list_containers(self, name_prefix: str) -> List[Dict]:
+        output = self._run('ps', '-a', '--no-trunc', '--filter', f'name={name_prefix}',
+                           '--format', '{{json .}}').stdout
+        result = []
+        for line in output.splitlines():
+            item = json.loads(line)
+            if item['Names'].startswith(name_prefix):
+                result.append({'id': item['ID'], 'name': item['Names'], 'state': item.get('State', '')})
+        return result
+
+    def events(self, filters: Dict, since: Optional[int] = None) -> Iterator[Dict]:
+        args = self.command + ['events', '--format', '{{json .}}']
+        if since is not None:
+            args.extend(['--since', str(since)])
+        for key, value in filters.items():
+            for item in (value if isinstance(value, list) else [value]):
+                args.extend(['--filter', f'{key}={item}'])
+        process = subprocess.Popen(args, stdout=subprocess.PIPE, text=True)
+        try:
+            for line in process.stdout:
+                if line.strip():
+                    yield json.loads(line)
+        finally:
+            process.kill()
+            process.wait()
+
+    def get_archive(self, name: str, path: str, chunk_size: int = 1024 * 64) -> Iterator[bytes]:
+        process = subprocess.Popen(self.command + ['cp', f'{name}:{path}', '-'],
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        try:
+            while True:
+                block = process.stdout.read(chunk_size)
+                if not block:
+                    break
+                yield block
+            if process.wait() != 0:
+                raise EngineError(process.stderr.read().decode(errors='replace').strip())
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            process.stdout.close()
+            process.stderr.close()
+
+    def copy_from(self, name: str, path: str, dest_path: str) -> None:
+        self._run('cp', f'{name}:{path}', dest_path)
+
+    def put_archive(self, name: str, path: str, data) -> None:
+        process = subprocess.Popen(self.command + ['cp', '-', f'{name}:{path}'],
+                                   stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        try:
+            if isinstance(data, bytes):
+                data = [data]
+            elif hasattr(data, 'read'):
+                src = data
+                data = iter(lambda: src.read(64 * 1024), b'')
+            for block in data:
+                process.stdin.write(block)
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+        except BaseException:
+            # 数据源出错时终止 docker cp，避免解压不完整的归档
+            process.kill()
+            process.wait()
+            process.stderr.close()
+            raise
+        if process.wait() != 0:
+            raise EngineError(process.stderr.read().decode(errors='replace').strip() or f"写入 {path} 失败")
+        process.stderr.close()
+
+    def copy_to(self, name: str, src_path: str, dest_path: str) -> None:
+        self._run('cp', src_path, f'{name}:{dest_path}')
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """根据配置获取全局Docker引擎客户端"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                from config import DOCKER_BACKEND, DOCKER_SOCKET, DOCKER_CLI
+                if DOCKER_BACKEND == 'cli':
+                    _engine = CliEngine(DOCKER_CLI)
+                else:
+                    _engine = ApiEngine(DOCKER_SOCKET)
+    return _engine
@@ -0,0 +1,145 @@
+import threading
+import time
+from typing import Dict, Optional
+from engine import get_engine, EngineError
+from collector import StatsCollector
+from utils import get_container_id
+
+CONTAINER_PREFIX = 'dotm-'
+
+# 关心的容器事件(stop、kill 之后总会有 die，不单独订阅)
+WATCHED_ACTIONS = ['start', 'die', 'oom', 'restart', 'pause', 'unpause', 'destroy', 'health_status']
+
+
+class EventWatcher:
+    """Docker 事件订阅器
+
+    长期订阅 Docker 事件流，维护 dotm-* 容器的内存状态表，
+    状态变化时立即推送到容器的 Socket.IO 房间，
+    页面和状态采集都不必再逐个 inspect 容器。
+    """
+
+    def __init__(self, engine=None, retry_interval: float = 5.0):
+        self.engine = engine or get_engine()
+        self.retry_interval = retry_interval
+        self._states = {}
+        self._lock = threading.Lock()
+        self._socketio = None
+        self._synced = False
+
+    @staticmethod
+    def event(container_id: str) -> str:
+        """容器状态变化的推送事件名"""
+        return f'container_state_{container_id}'
+
+    def start(self, socketio) -> None:
+        """启动后台订阅任务，重复调用无副作用"""
+        with self._lock:
+            if self._socketio is not None:
+                return
+            self._socketio = socketio
+        socketio.start_background_task(self._run)
+
+    @property
+    def synced(self) -> bool:
+        """状态表是否已与 Docker 同步，未同步时调用方应自行 inspect"""
+        return self._synced
+
+    def get(self, container_name: str) -> Optional[Dict]:
+        """获取容器的最新状态"""
+        with self._lock:
+            state = self._states.get(container_name)
+            return dict(state) if state else None
+
+    def _set(self, container_name: str, **changes) -> Dict:
+        with self._lock:
+            state = self._states.setdefault(container_name, {
+                'status': 'unknown',
+                'health': None,
+                'oom_killed': False,
+                'exit_code': None,
+                'updated_at': None
+            })
+            state.update(changes)
+            state['updated_at'] = time.time()
+            return dict(state)
+
+    def _sync(self) -> None:
+        """以容器列表初始化状态表"""
+        states = {}
+        for item in self.engine.list_containers(CONTAINER_PREFIX):
+            states[item['name']] = {
+                'status': 'running' if item['state'] == 'running' else
+                          'paused' if item['state'] == 'paused' else 'stopped',
+                'health': None,
+                'oom_killed': False,
+                'exit_code': None,
+                'updated_at': time.time()
+            }
+        with self._lock:
+            self._states = states
+
+    def handle_event(self, event: Dict) -> Optional[Dict]:
+        """根据一条事件更新状态表，返回更新后的状态"""
+        attributes = event.get('Actor', {}).get('Attributes', {})
+        name = attributes.get('name', '')
+        if not name.startswith(CONTAINER_PREFIX):
+            return None
+        action = event.get('Action', event.get('status', ''))
+
+        if action in ('start', 'restart', 'unpause'):
+            state = self._set(name, status='running', oom_killed=False, exit_code=None)
+        elif action == 'die':
+            exit_code = attributes.get('exitCode')
+            state = self._set(name, status='stopped',
+                              exit_code=int(exit_code) if exit_code is not None else None)
+        elif action == 'oom':
+            state = self._set(name, oom_killed=True)
+        elif action == 'pause':
+            state = self._set(name, status='paused')
+        elif action == 'destroy':
+            with self._lock:
+                self._states.pop(name, None)
+            state = {'status': 'removed'}
+        elif action.startswith('health_status'):
+            state = self._set(name, health=action.split(':', 1)[-1].strip())
+        else:
+            return None
+
+        if self._socketio is not None:
+            try:
+                container_id = str(get_container_id(name))
+            except ValueError:
+                return state
+            self._socketio.emit(self.event(container_id), state, room=StatsCollector.room(container_id))
+        return state
+
+    def _run(self) -> None:
+        while True:
+            try:
+                # 从同步前的时间开始订阅，同步期间发生的事件会被补发
+                since = int(time.time())
+                self._sync()
+                self._synced = True
+                for event in self.engine.events({'type': 'container', 'event': WATCHED_ACTIONS}, since=since):
+                    self.handle_event(event)
+            except (EngineError, OSError, ValueError) as e:
+                print(f"Docker事件订阅中断: {str(e)}")
+            except Exception as e:
+                print(f"Docker事件处理错误: {str(e)}")
+            self._synced = False
+            self._socketio.sleep(self.retry_interval)
+
+
+_watcher = None
+_watcher_lock = threading.Lock()
+
+
+def get_event_watcher() -> EventWatcher:
+    """获取全局事件订阅器"""
+    global _watcher
+    if _watcher is None:
+        with _watcher_lock:
+            if _watcher is None:
+                _watcher = EventWatcher()
+    return _watcher
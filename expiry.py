@@ -0,0 +1,190 @@
+import heapq
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from engine import EngineError
+from hostproxy import get_route_table
+from idle import get_idle_manager
+from utils import get_container_name, get_data_dir, parse_expiry
+
+
+class ExpiryReaper:
+    """过期容器清理
+
+    按过期时间维护一个最小堆，容器创建或续期时调用 schedule 更新，
+    后台任务睡眠到堆顶的过期时间再处理，不需要定期扫描全部容器。
+    过期容器交给有界的线程池并行删除；数据目录先移动到回收目录，再由 rm -rf 子进程删除。
+    eventlet 下线程池中的线程是协程，直接 rmtree 大目录不会让出执行权，会阻塞整个工作进程，
+    而等待子进程时可以让出。
+    堆中的旧记录(已续期或已删除)在出堆时丢弃；到期时再与注册表核对一次，
+    以处理其他进程的修改，并每隔 rescan_interval 秒从注册表重建一次。
+    """
+
+    def __init__(self, docker_manager, registry, workers: int, trash_dir: str, rescan_interval: float = 3600):
+        self.docker = docker_manager
+        self.registry = registry
+        self.trash_dir = trash_dir
+        self.rescan_interval = rescan_interval
+        self._heap: List[Tuple[float, str]] = []
+        self._expiry: Dict[str, float] = {}
+        self._removing = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._socketio = None
+
+    def start(self, socketio) -> None:
+        """启动后台任务，重复调用无副作用"""
+        with self._lock:
+            if self._socketio is not None:
+                return
+            self._socketio = socketio
+        self.load()
+        self._executor.submit(self.empty_trash)
+        socketio.start_background_task(self._run)
+
+    def load(self) -> None:
+        """从注册表重建堆"""
+        entries = {}
+        for container_id, info in self.registry.list_containers().items():
+            if info.get('expires_at'):
+                entries[container_id] = parse_expiry(info['expires_at'])
+        with self._lock:
+            self._expiry = entries
+            self._heap = [(expires, container_id) for container_id, expires in entries.items()]
+            heapq.heapify(self._heap)
+        self._wakeup.set()
+
+    def schedule(self, container_id: str, expires_at: str) -> None:
+        """登记或更新容器的过期时间"""
+        expires = parse_expiry(expires_at)
+        with self._lock:
+            self._expiry[container_id] = expires
+            heapq.heappush(self._heap, (expires, container_id))
+            earliest = self._heap[0][0] == expires
+        if earliest:
+            self._wakeup.set()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            next_due = min(self._expiry.values()) if self._expiry else None
+            return {'scheduled': len(self._expiry), 'removing': len(self._removing), 'next_due': next_due}
+
+    def _pop_due(self, now: float) -> List[str]:
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                expires, container_id = heapq.heappop(self._heap)
+                if self._expiry.get(container_id) != expires:
+                    continue
+                del self._expiry[container_id]
+                due.append(container_id)
+        return due
+
+    def reap_due(self) -> List[Future]:
+        """把已到期的容器交给线程池删除，返回各删除任务"""
+        now = time.time()
+        futures = []
+        for container_id in self._pop_due(now):
+            # 与注册表核对，其他进程可能已续期或删除
+            info = self.registry.get_container(container_id)
+            if info is None or not info.get('expires_at'):
+                continue
+            expires = parse_expiry(info['expires_at'])
+            if expires > now:
+                self.schedule(container_id, info['expires_at'])
+                continue
+            with self._lock:
+                if container_id in self._removing:
+                    continue
+                self._removing.add(container_id)
+            futures.append(self._executor.submit(self._remove, container_id))
+        return futures
+
+    def _remove(self, container_id: str) -> None:
+        container_name = get_container_name(int(container_id))
+        try:
+            get_idle_manager().release(container_id)
+            try:
+                self.docker.engine.remove(container_name, force=True)
+            except EngineError:
+                if self.docker.engine.inspect(container_name) is not None:
+                    raise
+            self.registry.delete_container(container_id)
+            get_route_table().schedule()
+            self._trash(get_data_dir(int(container_id)))
+            print(f"已删除过期容器: {container_name}")
+        except Exception as e:
+            print(f"删除容器 {container_name} 时出错: {str(e)}")
+        finally:
+            with self._lock:
+                self._removing.discard(container_id)
+
+    def _trash(self, data_dir: str) -> None:
+        """把数据目录移到回收目录后在后台删除，不在同一文件系统时直接在后台删除"""
+        if not os.path.exists(data_dir):
+            return
+        os.makedirs(self.trash_dir, exist_ok=True)
+        target = os.path.join(self.trash_dir, f'{os.path.basename(data_dir)}-{int(time.time())}')
+        try:
+            os.rename(data_dir, target)
+        except OSError:
+            target = data_dir
+        self._executor.submit(self._delete, target)
+
+    @staticmethod
+    def _delete(path: str) -> None:
+        """在子进程中删除目录树"""
+        subprocess.run(['rm', '-rf', '--', path], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def empty_trash(self) -> None:
+        """删除回收目录中残留的数据目录(上次运行中断时留下的)"""
+        try:
+            names = os.listdir(self.trash_dir)
+        except OSError:
+            return
+        for name in names:
+            self._delete(os.path.join(self.trash_dir, name))
+
+    def _next_timeout(self, last_load: float) -> float:
+        now = time.time()
+        with self._lock:
+            next_due = self._heap[0][0] if self._heap else None
+        timeout = self.rescan_interval - (time.monotonic() - last_load)
+        if next_due is not None:
+            timeout = min(timeout, next_due - now)
+        return max(timeout, 0)
+
+    def _run(self) -> None:
+        last_load = time.monotonic()
+        while True:
+            try:
+                if time.monotonic() - last_load >= self.rescan_interval:
+                    last_load = time.monotonic()
+                    self.load()
+                self.reap_due()
+            except Exception as e:
+                print(f"过期清理错误: {str(e)}")
+            self._wakeup.wait(self._next_timeout(last_load))
+            self._wakeup.clear()
+
+
+_reaper = None
+_reaper_lock = threading.Lock()
+
+
+def get_expiry_reaper() -> ExpiryReaper:
+    """获取全局过期清理器"""
+    global _reaper
+    if _reaper is None:
+        with _reaper_lock:
+            if _reaper is None:
+                from config import EXPIRY_WORKERS, EXPIRY_TRASH_DIR, EXPIRY_RESCAN_INTERVAL
+                from models import DockerManager
+                from registry import get_registry
+                _reaper = ExpiryReaper(DockerManager(), get_registry(), EXPIRY_WORKERS,
+                                       EXPIRY_TRASH_DIR, EXPIRY_RESCAN_INTERVAL)
+    return _reaper
@@ -49,33 +49,7 @@ server {
 }
 EOF
 
-# 生成主机上的nginx配置
-CONTAINER_NAME=\$(hostname)
-CONTAINER_PORT=\$(docker port \$CONTAINER_NAME 80 2>/dev/null | cut -d ':' -f 2)
-
-if [ ! -z "\$CONTAINER_PORT" ]; then
-    # 在主机上创建nginx配置目录
-    mkdir -p /etc/nginx/vhost.d
-
-    # 生成反向代理配置
-    cat > "/etc/nginx/vhost.d/$DOMAIN.conf" <<EOF
-server {
-    listen 80;
-    server_name $DOMAIN;
-
-    location / {
-        proxy_pass http://127.0.0.1:\$CONTAINER_PORT;
-        proxy_set_header Host \$host;
-        proxy_set_header X-Real-IP \$remote_addr;
-        proxy_set_header X-Forwarded-For \$proxy_add_x_forwarded_for;
-        proxy_set_header X-Forwarded-Proto \$scheme;
-    }
-}
-EOF
-
-    # 重新加载主机nginx配置
-    systemctl reload nginx || nginx -s reload
-fi
+# 主机上的反向代理由面板根据注册表统一生成，这里只处理容器内的配置
 
 # 重新加载nginx配置
 nginx -s reload
@@ -0,0 +1,969 @@
+import errno
+import hashlib
+import itertools
+import os
+import posixpath
+import stat
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from engine import EngineError, tar_bytes
+from archives import (ArchiveEntry, ARCHIVE_FORMATS, build_archive, gzip_stream, iter_tar,
+                      read_archive, tar_entries)
+from utils import get_data_dir
+
+# 容器数据目录在容器内的挂载点
+DATA_MOUNT = '/data'
+
+
+class PathOutsideJail(ValueError):
+    """路径解析后超出容器数据目录"""
+    pass
+
+
+class SymlinkInPath(PathOutsideJail):
+    """路径中包含符号链接，主机侧不跟随，应交由容器内处理"""
+    pass
+
+
+class FileOpError(Exception):
+    """文件操作失败"""
+    pass
+
+
+class FileConflict(FileOpError):
+    """文件内容与客户端提供的哈希不一致，已被其他人修改"""
+
+    def __init__(self, current_sha256: Optional[str]):
+        super().__init__("文件已被修改")
+        self.current_sha256 = current_sha256
+
+
+def is_binary(data: bytes) -> bool:
+    """开头 8KB 中出现 NUL 字节视为二进制文件"""
+    return b'\0' in data[:8192]
+
+
+def trim_utf8(data: bytes) -> bytes:
+    """去掉末尾被截断的 UTF-8 多字节字符，下一段从完整字符开始"""
+    for i in range(1, min(4, len(data)) + 1):
+        byte = data[-i]
+        if byte & 0xC0 == 0x80:
+            continue
+        need = 4 if byte >= 0xF0 else 3 if byte >= 0xE0 else 2 if byte >= 0xC0 else 1
+        return data if need <= i else data[:-i]
+    return data
+
+
+def normalize_patches(patches: List[Dict], size: int) -> List[Tuple[int, int, bytes]]:
+    """校验补丁 [{'offset', 'length', 'text'}]，偏移均为原文件中的字节位置
+
+    返回按偏移排序的 (offset, length, 新内容)，范围越界或重叠时抛出 FileOpError。
+    """
+    result = []
+    for patch in patches:
+        offset = int(patch['offset'])
+        length = int(patch.get('length', 0))
+        if offset < 0 or length < 0 or offset + length > size:
+            raise FileOpError("补丁范围无效")
+        result.append((offset, length, patch.get('text', '').encode()))
+    result.sort(key=lambda item: item[0])
+    for previous, current in zip(result, result[1:]):
+        if previous[0] + previous[1] > current[0]:
+            raise FileOpError("补丁范围重叠")
+    return result
+
+
+def apply_patches(data: bytes, patches: List[Tuple[int, int, bytes]]) -> bytes:
+    """在内存中应用已校验的补丁"""
+    parts = []
+    position = 0
+    for offset, length, text in patches:
+        parts.append(data[position:offset])
+        parts.append(text)
+        position = offset + length
+    parts.append(data[position:])
+    return b''.join(parts)
+
+
+def slice_lines(chunks: Iterator[bytes], start: int, count: int, max_bytes: int) -> Tuple[bytes, int, bool]:
+    """从字节块流中取出第 start 行(从 1 开始)起的 count 行
+
+    返回 (内容, 内容在文件中的起始字节偏移, 之后是否还有内容)，内容不超过 max_bytes。
+    """
+    line = 1
+    position = 0
+    begin = None
+    collected = bytearray()
+    taken = 0
+    for chunk in chunks:
+        index = 0
+        while index < len(chunk):
+            if begin is None:
+                if line >= start:
+                    begin = position + index
+                    continue
+                newline = chunk.find(b'\n', index)
+                if newline < 0:
+                    break
+                index = newline + 1
+                line += 1
+                continue
+            newline = chunk.find(b'\n', index)
+            end = len(chunk) if newline < 0 else newline + 1
+            if len(collected) + end - index > max_bytes:
+                collected += chunk[index:index + max_bytes - len(collected)]
+                return bytes(collected), begin, True
+            collected += chunk[index:end]
+            index = end
+            if newline >= 0:
+                taken += 1
+                if taken >= count:
+                    return bytes(collected), begin, index < len(chunk) or next(chunks, b'') != b''
+        position += len(chunk)
+    return bytes(collected), begin if begin is not None else position, False
+
+
+def to_data_relative(path: str) -> Optional[str]:
+    """把容器内路径转换为相对于 /data 的路径，不在 /data 下时返回 None"""
+    path = posixpath.normpath(posixpath.join('/', path or ''))
+    if path == DATA_MOUNT:
+        return ''
+    if path.startswith(DATA_MOUNT + '/'):
+        return path[len(DATA_MOUNT) + 1:]
+    return None
+
+
+def resolve_host_path(container_id: int, path: str) -> Optional[str]:
+    """把容器内 /data 下的路径映射到主机上的数据目录
+
+    不在 /data 下时返回 None；解析符号链接后超出数据目录时抛出 PathOutsideJail。
+    """
+    relative = to_data_relative(path)
+    if relative is None:
+        return None
+    root = os.path.realpath(get_data_dir(container_id))
+    host_path = os.path.realpath(os.path.join(root, relative))
+    if host_path != root and not host_path.startswith(root + os.sep):
+        raise PathOutsideJail(path)
+    return host_path
+
+
+class UserNames:
+    """容器内 uid/gid 到用户名、组名的映射
+
+    从容器的 /etc/passwd 和 /etc/group 读取并缓存，userns_offset 为启用
+    userns-remap 时主机 uid 相对容器 uid 的偏移。
+    """
+
+    def __init__(self, docker_manager, userns_offset: int = 0, ttl: float = 300):
+        self.docker_manager = docker_manager
+        self.userns_offset = userns_offset
+        self.ttl = ttl
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def _read_table(self, container_name: str, path: str) -> Dict[int, str]:
+        try:
+            archive = self.docker_manager.open_file(container_name, path)
+            try:
+                content = archive.read().decode(errors='replace')
+            finally:
+                archive.close()
+        except EngineError:
+            return {}
+        table = {}
+        for line in content.splitlines():
+            parts = line.split(':')
+            if len(parts) >= 3 and parts[2].isdigit():
+                table[int(parts[2])] = parts[0]
+        return table
+
+    def _tables(self, container_name: str) -> Tuple[Dict[int, str], Dict[int, str]]:
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(container_name)
+        if cached is not None and now - cached[0] < self.ttl:
+            return cached[1], cached[2]
+        users = self._read_table(container_name, '/etc/passwd')
+        groups = self._read_table(container_name, '/etc/group')
+        with self._lock:
+            self._cache[container_name] = (now, users, groups)
+        return users, groups
+
+    def owner(self, container_name: str, host_uid: int, host_gid: int) -> Tuple[str, str]:
+        """返回主机上的属主在容器内对应的 (用户名, 组名)"""
+        users, groups = self._tables(container_name)
+        uid = host_uid - self.userns_offset
+        gid = host_gid - self.userns_offset
+        return users.get(uid, str(uid)), groups.get(gid, str(gid))
+
+
+class DataDir:
+    """容器 /data 在主机上的视图
+
+    每次访问都从数据目录的 fd 出发逐级以 O_NOFOLLOW 打开，
+    遇到符号链接即抛出 SymlinkInPath，容器内的用户无法借助符号链接
+    (包括检查与使用之间替换路径的竞争)让操作落到数据目录以外。
+    新建的文件和目录继承所在目录的属主。
+    """
+
+    def __init__(self, container_id: int):
+        self.root = get_data_dir(container_id)
+
+    @staticmethod
+    def _parts(relative: str) -> List[str]:
+        return [part for part in relative.split('/') if part]
+
+    def _open_dir(self, parts: List[str]) -> int:
+        fd = os.open(self.root, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            for part in parts:
+                try:
+                    next_fd = os.open(part, os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW, dir_fd=fd)
+                except OSError as e:
+                    if e.errno in (errno.ELOOP, errno.ENOTDIR) and \
+                            stat.S_ISLNK(os.stat(part, dir_fd=fd, follow_symlinks=False).st_mode):
+                        raise SymlinkInPath(part)
+                    raise
+                os.close(fd)
+                fd = next_fd
+        except BaseException:
+            os.close(fd)
+            raise
+        return fd
+
+    def _open_parent(self, relative: str) -> Tuple[int, str]:
+        """打开路径的父目录，返回 (目录fd, 文件名)"""
+        parts = self._parts(relative)
+        if not parts:
+            raise FileOpError("不能对数据根目录执行该操作")
+        return self._open_dir(parts[:-1]), parts[-1]
+
+    @staticmethod
+    def _check_not_symlink(dir_fd: int, name: str) -> Optional[os.stat_result]:
+        try:
+            st = os.stat(name, dir_fd=dir_fd, follow_symlinks=False)
+        except FileNotFoundError:
+            return None
+        if stat.S_ISLNK(st.st_mode):
+            raise SymlinkInPath(name)
+        return st
+
+    @staticmethod
+    def _open_regular(dir_fd: int, name: str, flags: int, mode: int = 0o644) -> int:
+        """以 O_NONBLOCK 打开并确认是普通文件后再恢复阻塞模式，返回 fd
+
+        容器内的用户可以创建 FIFO 或设备文件，直接打开会在系统调用中阻塞整个工作进程。
+        """
+        try:
+            fd = os.open(name, flags | os.O_NOFOLLOW | os.O_NONBLOCK, mode, dir_fd=dir_fd)
+        except OSError as e:
+            if e.errno == errno.ENXIO:
+                # 没有读端的 FIFO 以只写方式打开
+                raise FileOpError("只能操作普通文件")
+            raise
+        try:
+            st = os.fstat(fd)
+            if stat.S_ISDIR(st.st_mode):
+                raise IsADirectoryError(name)
+            if not stat.S_ISREG(st.st_mode):
+                raise FileOpError("只能操作普通文件")
+            os.set_blocking(fd, True)
+        except BaseException:
+            os.close(fd)
+            raise
+        return fd
+
+    @staticmethod
+    def _inherit_owner(fd: int, parent_fd: int) -> None:
+        st = os.fstat(parent_fd)
+        try:
+            os.fchown(fd, st.st_uid, st.st_gid)
+        except PermissionError:
+            pass
+
+    def version(self, relative: str) -> str:
+        """目录的版本号，目录内增删改名都会改变 mtime"""
+        fd = self._open_dir(self._parts(relative))
+        try:
+            st = os.fstat(fd)
+        finally:
+            os.close(fd)
+        return f'{st.st_ino:x}-{st.st_mtime_ns:x}'
+
+    def scandir(self, relative: str) -> List[Tuple[str, os.stat_result]]:
+        """列出目录，返回 [(名称, lstat结果)]"""
+        fd = self._open_dir(self._parts(relative))
+        try:
+            entries = []
+            with os.scandir(fd) as it:
+                for entry in it:
+                    try:
+                        entries.append((entry.name, entry.stat(follow_symlinks=False)))
+                    except OSError:
+                        continue
+            return entries
+        finally:
+            os.close(fd)
+
+    def open_file(self, relative: str, flags: int = os.O_RDONLY) -> int:
+        """打开普通文件，返回 fd；目标是目录时抛出 IsADirectoryError，是其他特殊文件时抛出 FileOpError"""
+        parent_fd, name = self._open_parent(relative)
+        try:
+            self._check_not_symlink(parent_fd, name)
+            return self._open_regular(parent_fd, name, flags)
+        finally:
+            os.close(parent_fd)
+
+    def iter_file(self, relative: str, offset: int = 0, chunk_size: int = 1024 * 64) -> Iterator[bytes]:
+        """从 offset 开始按块读取文件"""
+        fd = self.open_file(relative)
+        try:
+            while True:
+                block = os.pread(fd, chunk_size, offset)
+                if not block:
+                    break
+                offset += len(block)
+                yield block
+        finally:
+            os.close(fd)
+
+    def read_file(self, relative: str) -> bytes:
+        return b''.join(self.iter_file(relative))
+
+    def read_range(self, relative: str, offset: int, length: int) -> Tuple[bytes, int]:
+        """读取 [offset, offset + length) 的内容，返回 (内容, 文件大小)"""
+        fd = self.open_file(relative)
+        try:
+            return os.pread(fd, length, offset), os.fstat(fd).st_size
+        finally:
+            os.close(fd)
+
+    def digest(self, relative: str) -> str:
+        """文件内容的 SHA-256"""
+        digest = hashlib.sha256()
+        for block in self.iter_file(relative):
+            digest.update(block)
+        return digest.hexdigest()
+
+    def _replace(self, parent_fd: int, name: str, existing: Optional[os.stat_result], mode: int,
+                 write: Callable[[int], None]) -> None:
+        """由 write 写入临时文件后原子替换，已存在的文件保留原有权限和属主"""
+        tmp_name = self._tmp_name(name)
+        fd = os.open(tmp_name, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_NOFOLLOW, mode, dir_fd=parent_fd)
+        try:
+            try:
+                write(fd)
+                if existing is not None:
+                    os.fchmod(fd, stat.S_IMODE(existing.st_mode))
+                    try:
+                        os.fchown(fd, existing.st_uid, existing.st_gid)
+                    except PermissionError:
+                        pass
+                else:
+                    os.fchmod(fd, mode)
+                    self._inherit_owner(fd, parent_fd)
+            finally:
+                os.close(fd)
+            os.replace(tmp_name, name, src_dir_fd=parent_fd, dst_dir_fd=parent_fd)
+        except BaseException:
+            try:
+                os.unlink(tmp_name, dir_fd=parent_fd)
+            except OSError:
+                pass
+            raise
+
+    @staticmethod
+    def _tmp_name(name: str) -> str:
+        return f'.{name}.{os.getpid()}.{threading.get_ident()}.tmp'
+
+    @staticmethod
+    def _write_all(fd: int, data: bytes) -> None:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+
+    def write_file(self, relative: str, data: bytes, mode: int = 0o644) -> None:
+        """写入临时文件后原子替换"""
+        parent_fd, name = self._open_parent(relative)
+        try:
+            existing = self._check_not_symlink(parent_fd, name)
+            if existing is not None and stat.S_ISDIR(existing.st_mode):
+                raise FileOpError("目标路径是一个目录")
+            self._replace(parent_fd, name, existing, mode, lambda fd: self._write_all(fd, data))
+        finally:
+            os.close(parent_fd)
+
+    def install_file(self, relative: str, src_path: str, mode: int = 0o644) -> None:
+        """把主机上的暂存文件放到 relative，设置权限 mode，属主继承所在目录
+
+        暂存文件与数据目录在同一文件系统时改名到目标目录中再原子替换，否则复制内容。
+        """
+        parent_fd, name = self._open_parent(relative)
+        try:
+            existing = self._check_not_symlink(parent_fd, name)
+            if existing is not None and stat.S_ISDIR(existing.st_mode):
+                raise FileOpError("目标路径是一个目录")
+            tmp_name = self._tmp_name(name)
+            try:
+                os.rename(src_path, tmp_name, dst_dir_fd=parent_fd)
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+                src = os.open(src_path, os.O_RDONLY)
+                try:
+                    def write(fd: int) -> None:
+                        while os.sendfile(fd, src, None, 1024 * 1024):
+                            pass
+                    self._replace(parent_fd, name, None, mode, write)
+                finally:
+                    os.close(src)
+                os.unlink(src_path)
+                return
+            try:
+                fd = self._open_regular(parent_fd, tmp_name, os.O_RDONLY)
+                try:
+                    os.fchmod(fd, mode)
+                    self._inherit_owner(fd, parent_fd)
+                finally:
+                    os.close(fd)
+                os.replace(tmp_name, name, src_dir_fd=parent_fd, dst_dir_fd=parent_fd)
+            except BaseException:
+                try:
+                    os.unlink(tmp_name, dir_fd=parent_fd)
+                except OSError:
+                    pass
+                raise
+        finally:
+            os.close(parent_fd)
+
+    def patch_file(self, relative: str, patches: List[Dict], expected_sha256: str) -> str:
+        """对文件应用补丁，返回新内容的 SHA-256
+
+        先流式计算当前内容的哈希并与 expected_sha256 比较，不一致时抛出 FileConflict；
+        之后边复制未修改的区间边写入补丁内容，内存占用与文件大小无关。
+        """
+        parent_fd, name = self._open_parent(relative)
+        try:
+            existing = self._check_not_symlink(parent_fd, name)
+            if existing is None:
+                raise FileNotFoundError(relative)
+            src = self._open_regular(parent_fd, name, os.O_RDONLY)
+            try:
+                st = os.fstat(src)
+                current = hashlib.sha256()
+                offset = 0
+                while True:
+                    block = os.pread(src, 1024 * 64, offset)
+                    if not block:
+                        break
+                    current.update(block)
+                    offset += len(block)
+                if current.hexdigest() != expected_sha256:
+                    raise FileConflict(current.hexdigest())
+                normalized = normalize_patches(patches, st.st_size)
+                result = hashlib.sha256()
+
+                def write(fd: int) -> None:
+                    def copy(start: int, end: int) -> None:
+                        while start < end:
+                            block = os.pread(src, min(1024 * 64, end - start), start)
+                            if not block:
+                                break
+                            result.update(block)
+                            self._write_all(fd, block)
+                            start += len(block)
+                    position = 0
+                    for patch_offset, length, text in normalized:
+                        copy(position, patch_offset)
+                        result.update(text)
+                        self._write_all(fd, text)
+                        position = patch_offset + length
+                    copy(position, st.st_size)
+
+                self._replace(parent_fd, name, existing, stat.S_IMODE(existing.st_mode), write)
+                return result.hexdigest()
+            finally:
+                os.close(src)
+        finally:
+            os.close(parent_fd)
+
+    def lstat(self, relative: str) -> os.stat_result:
+        """路径本身的 lstat，路径经过符号链接时抛出 SymlinkInPath"""
+        parts = self._parts(relative)
+        fd = self._open_dir(parts[:-1])
+        try:
+            return os.stat(parts[-1], dir_fd=fd, follow_symlinks=False) if parts else os.fstat(fd)
+        finally:
+            os.close(fd)
+
+    def create_file(self, relative: str, mode: int = 0o644) -> int:
+        """创建或截断文件用于写入，返回 fd；新建的文件属主继承所在目录"""
+        parent_fd, name = self._open_parent(relative)
+        try:
+            existing = self._check_not_symlink(parent_fd, name)
+            fd = self._open_regular(parent_fd, name, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+            if existing is None:
+                self._inherit_owner(fd, parent_fd)
+            return fd
+        finally:
+            os.close(parent_fd)
+
+    def walk(self, relative: str) -> Iterator[Tuple[str, os.stat_result, Optional[Callable[[], Iterator[bytes]]]]]:
+        """深度优先遍历目录树，不跟随符号链接
+
+        立即检查起始目录(路径无效时在调用处抛出异常)，返回 (相对路径, lstat, 读取器) 的迭代器；
+        普通文件的读取器按块返回内容，须在取下一项之前使用。
+        """
+        os.close(self._open_dir(self._parts(relative)))
+        return self._walk_from(relative)
+
+    def _walk_from(self, relative: str):
+        yield from self._walk(self._open_dir(self._parts(relative)), '')
+
+    def _walk(self, fd: int, prefix: str):
+        try:
+            for name in sorted(os.listdir(fd)):
+                try:
+                    st = os.stat(name, dir_fd=fd, follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+                path = prefix + name
+                if stat.S_ISREG(st.st_mode):
+                    yield path, st, lambda name=name: self._read_at(fd, name)
+                    continue
+                yield path, st, None
+                if stat.S_ISDIR(st.st_mode):
+                    try:
+                        child = os.open(name, os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW, dir_fd=fd)
+                    except OSError:
+                        continue
+                    yield from self._walk(child, path + '/')
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def _read_at(dir_fd: int, name: str, chunk_size: int = 1024 * 64) -> Iterator[bytes]:
+        fd = DataDir._open_regular(dir_fd, name, os.O_RDONLY)
+        try:
+            while True:
+                block = os.read(fd, chunk_size)
+                if not block:
+                    break
+                yield block
+        finally:
+            os.close(fd)
+
+    def readlink(self, relative: str) -> str:
+        parent_fd, name = self._open_parent(relative)
+        try:
+            return os.readlink(name, dir_fd=parent_fd)
+        finally:
+            os.close(parent_fd)
+
+    def make_dir(self, relative: str, mode: int = 0o755) -> None:
+        """逐级创建目录(mkdir -p)"""
+        fd = os.open(self.root, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            for part in self._parts(relative):
+                try:
+                    os.mkdir(part, mode, dir_fd=fd)
+                    created = True
+                except FileExistsError:
+                    created = False
+                self._check_not_symlink(fd, part)
+                next_fd = os.open(part, os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW, dir_fd=fd)
+                if created:
+                    self._inherit_owner(next_fd, fd)
+                os.close(fd)
+                fd = next_fd
+        finally:
+            os.close(fd)
+
+    @classmethod
+    def _remove_tree(cls, parent_fd: int, name: str) -> None:
+        st = os.stat(name, dir_fd=parent_fd, follow_symlinks=False)
+        if not stat.S_ISDIR(st.st_mode):
+            os.unlink(name, dir_fd=parent_fd)
+            return
+        fd = os.open(name, os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW, dir_fd=parent_fd)
+        try:
+            with os.scandir(fd) as it:
+                children = [entry.name for entry in it]
+            for child in children:
+                cls._remove_tree(fd, child)
+        finally:
+            os.close(fd)
+        os.rmdir(name, dir_fd=parent_fd)
+
+    def delete(self, relative: str) -> None:
+        """删除文件或目录(rm -rf)，符号链接只删除链接本身"""
+        parent_fd, name = self._open_parent(relative)
+        try:
+            try:
+                self._remove_tree(parent_fd, name)
+            except FileNotFoundError:
+                pass
+        finally:
+            os.close(parent_fd)
+
+
+def _entry_type(mode: int) -> str:
+    if stat.S_ISDIR(mode):
+        return 'd'
+    if stat.S_ISLNK(mode):
+        return 'l'
+    return 'f'
+
+
+def format_entry(name: str, st: os.stat_result, owner: str, group: str) -> Dict:
+    """把 lstat 结果转换为文件列表条目"""
+    return {
+        'name': name,
+        'type': _entry_type(st.st_mode),
+        'size': st.st_size,
+        'mtime': st.st_mtime,
+        'mode': stat.S_IMODE(st.st_mode),
+        'permissions': stat.filemode(st.st_mode),
+        'is_symlink': stat.S_ISLNK(st.st_mode),
+        'owner': owner,
+        'group': group
+    }
+
+
+# 目录列表排序字段，目录总是排在前面
+SORT_KEYS = {
+    'name': lambda entry: entry['name'].lower(),
+    'size': lambda entry: entry['size'],
+    'mtime': lambda entry: entry['mtime'],
+    'type': lambda entry: (entry['type'], entry['name'].lower())
+}
+
+
+def page_entries(entries: List[Dict], sort: str = 'name', reverse: bool = False, query: str = '',
+                 offset: int = 0, limit: int = 200) -> Dict:
+    """对目录条目筛选、排序并分页
+
+    cursor 为下一页的起始位置，没有更多条目时为 None。
+    """
+    if query:
+        query = query.lower()
+        entries = [entry for entry in entries if query in entry['name'].lower()]
+    key = SORT_KEYS.get(sort, SORT_KEYS['name'])
+    entries = sorted(entries, key=key, reverse=reverse)
+    entries.sort(key=lambda entry: entry['type'] != 'd')
+    page = entries[offset:offset + limit]
+    return {
+        'files': page,
+        'total': len(entries),
+        'next_cursor': str(offset + limit) if offset + limit < len(entries) else None
+    }
+
+
+class ListingCache:
+    """目录列表缓存，以目录的 inode 和 mtime 作为版本，目录未变化时不再 readdir/lstat"""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version: str) -> Optional[List[Dict]]:
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is None or cached[0] != version:
+                return None
+            self._cache.move_to_end(key)
+            return cached[1]
+
+    def put(self, key, version: str, entries: List[Dict]) -> None:
+        with self._lock:
+            self._cache[key] = (version, entries)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+
+class ContainerFiles:
+    """文件管理操作
+
+    /data 下的路径直接在主机上的数据目录中用系统调用完成，
+    其他路径(以及 /data 中经由符号链接的路径)通过 exec 在容器内执行。
+    """
+
+    def __init__(self, docker_manager, container_id: int, container_name: str, user_names: UserNames,
+                 listings: ListingCache):
+        self.docker_manager = docker_manager
+        self.container_name = container_name
+        self.user_names = user_names
+        self.listings = listings
+        self.data = DataDir(container_id)
+
+    def _host(self, path: str, operation, *args):
+        """在主机侧执行操作，路径不在 /data 下或包含符号链接时返回 (False, None)"""
+        relative = to_data_relative(path)
+        if relative is None:
+            return False, None
+        try:
+            return True, operation(relative, *args)
+        except SymlinkInPath:
+            return False, None
+        except FileNotFoundError:
+            raise FileOpError("文件或目录不存在")
+        except NotADirectoryError:
+            raise FileOpError("不是一个目录")
+        except IsADirectoryError:
+            raise FileOpError("目标路径是一个目录")
+        except PermissionError:
+            raise FileOpError("没有权限")
+        except OSError as e:
+            raise FileOpError(e.strerror or str(e))
+
+    def _exec(self, cmd: List[str], error: str) -> bytes:
+        try:
+            return self.docker_manager.check_exec(self.container_name, cmd)
+        except EngineError:
+            raise FileOpError(error)
+
+    def _list_host(self, relative: str) -> Tuple[List[Dict], str]:
+        version = self.data.version(relative)
+        key = (self.data.root, relative)
+        files = self.listings.get(key, version)
+        if files is None:
+            files = []
+            for name, st in self.data.scandir(relative):
+                owner, group = self.user_names.owner(self.container_name, st.st_uid, st.st_gid)
+                files.append(format_entry(name, st, owner, group))
+            self.listings.put(key, version, files)
+        return files, version
+
+    def directory_etag(self, path: str) -> Optional[str]:
+        """目录的版本号(inode + mtime)，只需一次 stat；不在主机侧处理的路径返回 None"""
+        _, version = self._host(path, self.data.version)
+        return version
+
+    def list_dir(self, path: str) -> Tuple[List[Dict], str]:
+        """列出目录，返回 (条目列表, 版本号)"""
+        handled, result = self._host(path, self._list_host)
+        if handled:
+            return result
+        # find 以 NUL 分隔输出，文件名中的空格和换行不会被截断
+        output = self._exec(['find', '-H', path, '-mindepth', '1', '-maxdepth', '1',
+                             '-printf', '%y\\t%s\\t%T@\\t%m\\t%u\\t%g\\t%P\\0'], '获取目录列表失败')
+        files = []
+        for record in output.split(b'\0'):
+            parts = record.decode(errors='replace').split('\t', 6)
+            if len(parts) != 7:
+                continue
+            kind, size, mtime, mode, owner, group, name = parts
+            mode = int(mode, 8)
+            type_bits = {'d': stat.S_IFDIR, 'l': stat.S_IFLNK}.get(kind, stat.S_IFREG)
+            files.append({
+                'name': name,
+                'type': kind if kind in ('d', 'l') else 'f',
+                'size': int(size),
+                'mtime': float(mtime),
+                'mode': mode,
+                'permissions': stat.filemode(type_bits | mode),
+                'is_symlink': kind == 'l',
+                'owner': owner,
+                'group': group
+            })
+        return files, hashlib.sha1(output).hexdigest()
+
+    def read_file(self, path: str) -> bytes:
+        handled, content = self._host(path, self.data.read_file)
+        if handled:
+            return content
+        return self._exec(['cat', path], '读取文件失败')
+
+    def read_range(self, path: str, offset: int, length: int) -> Tuple[bytes, int]:
+        """读取文件的一个字节区间，返回 (内容, 文件大小)"""
+        handled, result = self._host(path, self.data.read_range, offset, length)
+        if handled:
+            return result
+        size = int(self._exec(['stat', '-L', '-c', '%s', path], '读取文件失败').strip())
+        data = self._exec(['dd', f'if={path}', 'bs=65536', 'iflag=skip_bytes,count_bytes',
+                           f'skip={offset}', f'count={length}', 'status=none'], '读取文件失败')
+        return data, size
+
+    def read_lines(self, path: str, start: int, count: int, max_bytes: int) -> Tuple[bytes, Optional[int], bool]:
+        """读取第 start 行起的 count 行，返回 (内容, 起始字节偏移, 是否还有更多)"""
+        handled, result = self._host(path, lambda relative: slice_lines(
+            self.data.iter_file(relative), start, count, max_bytes))
+        if handled:
+            return result
+        output = self._exec(['sed', '-n', f'{start},{start + count}p', path], '读取文件失败')
+        lines = output.split(b'\n')
+        more = len(lines) > count + 1 or (len(lines) == count + 1 and lines[-1] != b'')
+        content = b'\n'.join(lines[:count]) + (b'\n' if len(lines) > count else b'')
+        return content[:max_bytes], None, more or len(content) > max_bytes
+
+    def file_hash(self, path: str) -> Optional[str]:
+        """文件内容的 SHA-256，文件不存在时返回 None"""
+        try:
+            handled, digest = self._host(path, self.data.digest)
+            if handled:
+                return digest
+            return self._exec(['sha256sum', path], '读取文件失败').split()[0].decode()
+        except FileOpError:
+            return None
+
+    def _check_expected(self, path: str, expected_sha256: Optional[str]) -> None:
+        if expected_sha256 is not None:
+            current = self.file_hash(path)
+            if current != expected_sha256:
+                raise FileConflict(current)
+
+    def write_file(self, path: str, data: bytes, expected_sha256: Optional[str] = None) -> str:
+        """写入文件，提供 expected_sha256 时先检查文件未被修改；返回新内容的 SHA-256"""
+        self._check_expected(path, expected_sha256)
+        handled, _ = self._host(path, self.data.write_file, data)
+        if not handled:
+            try:
+                self.docker_manager.put_archive(self.container_name, posixpath.dirname(path) or '/',
+                                                tar_bytes(posixpath.basename(path), data))
+            except EngineError:
+                raise FileOpError('写入文件失败')
+        return hashlib.sha256(data).hexdigest()
+
+    def patch_file(self, path: str, patches: List[Dict], expected_sha256: str) -> str:
+        """以补丁方式修改文件，返回新内容的 SHA-256"""
+        handled, digest = self._host(path, self.data.patch_file, patches, expected_sha256)
+        if handled:
+            return digest
+        data = self.read_file(path)
+        if hashlib.sha256(data).hexdigest() != expected_sha256:
+            raise FileConflict(hashlib.sha256(data).hexdigest())
+        return self.write_file(path, apply_patches(data, normalize_patches(patches, len(data))))
+
+    def _host_entries(self, relative: str, walker) -> Iterator[ArchiveEntry]:
+        root = posixpath.basename(relative.rstrip('/')) or 'data'
+        for path, st, reader in walker:
+            name = f'{root}/{path}'
+            mode = stat.S_IMODE(st.st_mode)
+            if stat.S_ISDIR(st.st_mode):
+                yield ArchiveEntry(name, 'd', mode=mode, mtime=st.st_mtime)
+            elif stat.S_ISLNK(st.st_mode):
+                try:
+                    linkname = self.data.readlink(posixpath.join(relative, path))
+                except OSError:
+                    continue
+                yield ArchiveEntry(name, 'l', mode=mode, mtime=st.st_mtime, linkname=linkname)
+            elif reader is not None:
+                yield ArchiveEntry(name, 'f', st.st_size, mode, st.st_mtime, open=reader)
+
+    def archive(self, path: str, fmt: str) -> Iterator[bytes]:
+        """把目录打包为 tar.gz 或 zip 流，边读边压缩，内存占用与目录大小无关"""
+        if fmt not in ARCHIVE_FORMATS:
+            raise FileOpError("不支持的归档格式")
+        relative = to_data_relative(path)
+        handled, walker = self._host(path, self.data.walk)
+        if handled:
+            root = posixpath.basename(relative.rstrip('/')) or 'data'
+            _, st = self._host(path, self.data.lstat)
+            first = ArchiveEntry(root, 'd', mode=stat.S_IMODE(st.st_mode), mtime=st.st_mtime)
+            return build_archive(itertools.chain([first], self._host_entries(relative, walker)), fmt)
+        try:
+            chunks = self.docker_manager.get_archive(self.container_name, path)
+        except EngineError:
+            raise FileOpError('打包目录失败')
+        # 容器归档接口本身就是 tar 流，tar.gz 只需压缩
+        if fmt == 'tar.gz':
+            return gzip_stream(chunks)
+        return build_archive(tar_entries(chunks), fmt)
+
+    def walk(self, path: str):
+        """遍历 /data 下的目录树(不跟随符号链接)，见 DataDir.walk"""
+        handled, walker = self._host(path, self.data.walk)
+        if not handled:
+            raise FileOpError("只能在 /data 下的目录中搜索")
+        return walker
+
+    def _extract_host(self, relative: str, entries: Iterator[ArchiveEntry]) -> Tuple[int, int]:
+        created = set()
+        extracted = skipped = 0
+        for entry in entries:
+            target = posixpath.join(relative, entry.name)
+            if entry.kind == 'd':
+                self.data.make_dir(target)
+                created.add(target)
+            elif entry.kind == 'f':
+                parent = posixpath.dirname(target)
+                if parent not in created:
+                    self.data.make_dir(parent)
+                    created.add(parent)
+                fd = self.data.create_file(target, (entry.mode & 0o777) or 0o644)
+                try:
+                    for block in entry.open():
+                        DataDir._write_all(fd, block)
+                finally:
+                    os.close(fd)
+            else:
+                # 主机侧不创建符号链接和特殊文件
+                skipped += 1
+                continue
+            extracted += 1
+        return extracted, skipped
+
+    def _extract_container(self, path: str, entries: Iterator[ArchiveEntry]) -> Tuple[int, int]:
+        counts = [0, 0]
+
+        def accepted():
+            for entry in entries:
+                if entry.kind in ('d', 'f', 'l'):
+                    counts[0] += 1
+                    yield entry
+                else:
+                    counts[1] += 1
+
+        self._exec(['mkdir', '-p', path], '创建文件夹失败')
+        try:
+            self.docker_manager.put_archive(self.container_name, path, iter_tar(accepted()))
+        except EngineError:
+            raise FileOpError('解压失败')
+        return counts[0], counts[1]
+
+    def extract(self, path: str, fileobj, filename: str, max_size: int, max_entries: int) -> Tuple[int, int]:
+        """把上传的归档流式解压到目录 path，返回 (解压的项数, 跳过的项数)
+
+        归档格式无效或超出限制时抛出 ArchiveError，已解压的部分保留。
+        """
+        entries = read_archive(fileobj, filename, max_size, max_entries)
+        handled, _ = self._host(path, self.data.make_dir)
+        if handled:
+            try:
+                return self._extract_host(to_data_relative(path), entries)
+            except SymlinkInPath as e:
+                raise FileOpError(f"路径中含有符号链接: {str(e)}")
+            except OSError as e:
+                raise FileOpError(e.strerror or str(e))
+        return self._extract_container(path, entries)
+
+    def make_dir(self, path: str) -> None:
+        handled, _ = self._host(path, self.data.make_dir)
+        if not handled:
+            self._exec(['mkdir', '-p', path], '创建文件夹失败')
+
+    def delete(self, path: str) -> None:
+        handled, _ = self._host(path, self.data.delete)
+        if not handled:
+            self._exec(['rm', '-rf', path], '删除失败')
+
+
+_user_names = None
+_user_names_lock = threading.Lock()
+_listings = ListingCache()
+
+
+def get_container_files(docker_manager, container_id: int, container_name: str) -> ContainerFiles:
+    """获取容器的文件操作对象"""
+    global _user_names
+    if _user_names is None:
+        with _user_names_lock:
+            if _user_names is None:
+                from config import DOCKER_USERNS_OFFSET
+                _user_names = UserNames(docker_manager, DOCKER_USERNS_OFFSET)
+    return ContainerFiles(docker_manager, container_id, container_name, _user_names, _listings)
@@ -0,0 +1,177 @@
+import os
+import subprocess
+import threading
+import time
+from typing import Dict, List, Optional
+from utils import merge_routes, validate_domain
+
+
+def render_routes(routes: Dict[str, int]) -> str:
+    """把 域名 → 容器HTTP端口 的路由表渲染为一份 nginx 配置
+
+    域名只出现在 map 中，由一个 server 块统一转发，未登记的域名返回 404。
+    域名数量增加时只有 map 变大，不会产生大量 server 块。
+    nginx 的 map 键不区分大小写，重复的键会使 nginx -t 失败，因此域名按小写合并，
+    不同大小写写法指向不同端口的域名不路由，只在配置中注明。
+    """
+    lines = ['# 由 DotMachine 根据容器注册表生成，请勿手动修改', '']
+    routes, conflicts = merge_routes([(domain, port) for domain, port in routes.items() if validate_domain(domain)])
+    if conflicts:
+        lines.append(f"# 以下域名被多个实例以不同大小写登记，未路由: {' '.join(conflicts)}")
+        lines.append('')
+    domains = sorted(routes)
+    if not domains:
+        return '\n'.join(lines) + '\n'
+    lines.append('map $host $dotmachine_upstream {')
+    lines.append('    hostnames;')
+    lines.append('    default "";')
+    for domain in domains:
+        lines.append(f'    {domain} 127.0.0.1:{int(routes[domain])};')
+    lines.append('}')
+    lines.append('')
+    lines.append('server {')
+    lines.append('    listen 80;')
+    lines.append('    server_name ~.;')
+    lines.append('')
+    lines.append('    if ($dotmachine_upstream = "") {')
+    lines.append('        return 404;')
+    lines.append('    }')
+    lines.append('')
+    lines.append('    location / {')
+    lines.append('        proxy_pass http://$dotmachine_upstream;')
+    lines.append('        proxy_set_header Host $host;')
+    lines.append('        proxy_set_header X-Real-IP $remote_addr;')
+    lines.append('        proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;')
+    lines.append('        proxy_set_header X-Forwarded-Proto $scheme;')
+    lines.append('    }')
+    lines.append('}')
+    return '\n'.join(lines) + '\n'
+
+
+class RouteTable:
+    """主机反向代理路由表
+
+    路由由注册表中各容器绑定的域名和 HTTP 端口生成，写入一份 nginx 配置。
+    域名变化时调用 schedule()，在 debounce 秒内的多次变化合并为一次生成和重载；
+    新配置先经 nginx -t 校验，失败时恢复旧配置，不重载。
+    另外每隔 resync_interval 秒重新生成一次，以覆盖其他进程(如过期清理脚本)的修改；
+    内容未变化时不重载。
+    """
+
+    def __init__(self, registry, config_path: str, test_command: List[str], reload_command: List[str],
+                 debounce: float = 2.0, resync_interval: float = 300):
+        self.registry = registry
+        self.config_path = config_path
+        self.test_command = test_command
+        self.reload_command = reload_command
+        self.debounce = debounce
+        self.resync_interval = resync_interval
+        self._dirty_since: Optional[float] = None
+        self._apply_lock = threading.Lock()
+        self._socketio = None
+        self.reloads = 0
+        self.last_error: Optional[str] = None
+
+    def start(self, socketio) -> None:
+        """启动后台任务，启动时先同步一次，重复调用无副作用"""
+        if self._socketio is not None:
+            return
+        self._socketio = socketio
+        self._dirty_since = time.monotonic() - self.debounce
+        socketio.start_background_task(self._run)
+
+    def routes(self) -> Dict[str, int]:
+        """从注册表生成 域名 → 容器HTTP端口"""
+        routes = {}
+        for info in self.registry.list_containers().values():
+            for domain in info.get('websites', []):
+                routes[domain] = info['http_port']
+        return routes
+
+    def schedule(self) -> None:
+        """标记路由已变化，稍后合并生成"""
+        if self._dirty_since is None:
+            self._dirty_since = time.monotonic()
+        if self._socketio is None:
+            self.apply()
+
+    def _read_current(self) -> Optional[str]:
+        try:
+            with open(self.config_path, 'r') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write(self, content: Optional[str]) -> None:
+        if content is None:
+            try:
+                os.unlink(self.config_path)
+            except FileNotFoundError:
+                pass
+            return
+        tmp_path = self.config_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(content)
+        os.replace(tmp_path, self.config_path)
+
+    def apply(self) -> bool:
+        """生成配置，有变化时校验并重载 nginx，返回是否重载"""
+        with self._apply_lock:
+            self._dirty_since = None
+            content = render_routes(self.routes())
+            previous = self._read_current()
+            if content == previous:
+                return False
+            os.makedirs(os.path.dirname(self.config_path), exist_ok=True)
+            self._write(content)
+            try:
+                result = subprocess.run(self.test_command, capture_output=True, text=True)
+            except FileNotFoundError:
+                self.last_error = 'nginx 不可用，只写入了配置'
+                print(f"路由配置未校验: {self.last_error}")
+                return False
+            if result.returncode != 0:
+                self._write(previous)
+                self.last_error = result.stderr.strip()
+                print(f"路由配置校验失败，已恢复旧配置: {self.last_error}")
+                return False
+            result = subprocess.run(self.reload_command, capture_output=True, text=True)
+            if result.returncode != 0:
+                self.last_error = result.stderr.strip()
+                print(f"nginx 重载失败: {self.last_error}")
+                return False
+            self.last_error = None
+            self.reloads += 1
+            return True
+
+    def _run(self) -> None:
+        last_sync = time.monotonic()
+        while True:
+            now = time.monotonic()
+            dirty_since = self._dirty_since
+            if (dirty_since is not None and now - dirty_since >= self.debounce) or \
+                    now - last_sync >= self.resync_interval:
+                last_sync = now
+                try:
+                    self.apply()
+                except Exception as e:
+                    print(f"路由配置生成错误: {str(e)}")
+            self._socketio.sleep(0.5)
+
+
+_routes = None
+_routes_lock = threading.Lock()
+
+
+def get_route_table() -> RouteTable:
+    """获取全局路由表"""
+    global _routes
+    if _routes is None:
+        with _routes_lock:
+            if _routes is None:
+                from config import (PROXY_ROUTES_CONFIG, PROXY_TEST_COMMAND, PROXY_RELOAD_COMMAND,
+                                    PROXY_RELOAD_DEBOUNCE, PROXY_RESYNC_INTERVAL)
+                from registry import get_registry
+                _routes = RouteTable(get_registry(), PROXY_ROUTES_CONFIG, PROXY_TEST_COMMAND,
+                                     PROXY_RELOAD_COMMAND, PROXY_RELOAD_DEBOUNCE, PROXY_RESYNC_INTERVAL)
+    return _routes
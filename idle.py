@@ -0,0 +1,324 @@
+import socket
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from engine import EngineError
+from registry import RegistryError
+from utils import get_container_name, CONTAINER_PORT_TARGETS
+
+
+def read_net_bytes(pid: int) -> Optional[int]:
+    """读取容器网络命名空间中除 lo 外所有网卡的收发字节数之和"""
+    try:
+        with open(f'/proc/{pid}/net/dev', 'r') as f:
+            lines = f.readlines()[2:]
+    except OSError:
+        return None
+    total = 0
+    for line in lines:
+        name, _, fields = line.partition(':')
+        if name.strip() == 'lo':
+            continue
+        values = fields.split()
+        total += int(values[0]) + int(values[8])
+    return total
+
+
+def container_address(info: Dict) -> Optional[str]:
+    """从 inspect 结果中取容器的 IP 地址"""
+    settings = info.get('NetworkSettings', {})
+    if settings.get('IPAddress'):
+        return settings['IPAddress']
+    for network in (settings.get('Networks') or {}).values():
+        if network.get('IPAddress'):
+            return network['IPAddress']
+    return None
+
+
+def _pipe(src: socket.socket, dst: socket.socket) -> None:
+    try:
+        while True:
+            data = src.recv(64 * 1024)
+            if not data:
+                break
+            dst.sendall(data)
+    except OSError:
+        pass
+    finally:
+        try:
+            dst.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+
+
+class Activator:
+    """休眠容器的端口占位
+
+    容器停止后 Docker 释放其主机端口，由激活器在这些端口上监听。
+    收到第一个连接时通过 wake 唤醒容器，唤醒前接受所有排队的连接后关闭监听，让 Docker 重新绑定端口；
+    已接受的连接在容器就绪后直接转发到容器内的对应端口。
+    关闭监听到 Docker 重新绑定之间新到的连接会被拒绝，客户端重试即可。
+    """
+
+    def __init__(self, wake: Callable[[str], Optional[str]], wake_timeout: float = 30):
+        self.wake = wake
+        self.wake_timeout = wake_timeout
+        self._listeners: Dict[str, List[Tuple[socket.socket, int]]] = {}
+        self._lock = threading.Lock()
+        self._socketio = None
+
+    def start(self, socketio) -> None:
+        self._socketio = socketio
+
+    def watch(self, container_id: str, ports: Dict[str, int]) -> None:
+        """在容器的主机端口上监听，端口被占用时跳过"""
+        listeners = []
+        for key, host_port in ports.items():
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            try:
+                sock.bind(('0.0.0.0', host_port))
+                sock.listen(64)
+            except OSError as e:
+                sock.close()
+                print(f"激活器无法监听端口 {host_port}: {str(e)}")
+                continue
+            listeners.append((sock, CONTAINER_PORT_TARGETS[key]))
+        with self._lock:
+            self._listeners[container_id] = listeners
+        for sock, target_port in listeners:
+            self._socketio.start_background_task(self._accept, container_id, sock, target_port)
+
+    def release(self, container_id: str, drain: bool = False) -> bool:
+        """关闭容器的监听，返回之前是否在监听；drain 为真时先接受已排队的连接"""
+        with self._lock:
+            listeners = self._listeners.pop(container_id, None)
+        for sock, target_port in listeners or []:
+            if drain:
+                self._drain(container_id, sock, target_port)
+            sock.close()
+        return listeners is not None
+
+    def _drain(self, container_id: str, sock: socket.socket, target_port: int) -> None:
+        sock.setblocking(False)
+        while True:
+            try:
+                conn, _ = sock.accept()
+            except OSError:
+                return
+            conn.setblocking(True)
+            self._socketio.start_background_task(self._handle, container_id, conn, target_port)
+
+    def watched(self) -> List[str]:
+        with self._lock:
+            return list(self._listeners)
+
+    def _accept(self, container_id: str, sock: socket.socket, target_port: int) -> None:
+        while True:
+            try:
+                conn, _ = sock.accept()
+            except OSError:
+                return
+            self._socketio.start_background_task(self._handle, container_id, conn, target_port)
+
+    def _connect(self, address: str, port: int) -> Optional[socket.socket]:
+        """容器内服务启动需要时间，在 wake_timeout 内重试连接"""
+        deadline = time.monotonic() + self.wake_timeout
+        while time.monotonic() < deadline:
+            try:
+                return socket.create_connection((address, port), timeout=5)
+            except OSError:
+                self._socketio.sleep(0.2)
+        return None
+
+    def _handle(self, container_id: str, conn: socket.socket, target_port: int) -> None:
+        upstream = None
+        try:
+            address = self.wake(container_id)
+            upstream = self._connect(address, target_port) if address else None
+            if upstream is None:
+                return
+            upstream.settimeout(None)
+            finished = threading.Event()
+
+            def reverse():
+                _pipe(upstream, conn)
+                finished.set()
+
+            self._socketio.start_background_task(reverse)
+            _pipe(conn, upstream)
+            finished.wait()
+        except Exception as e:
+            print(f"唤醒容器 {container_id} 失败: {str(e)}")
+        finally:
+            conn.close()
+            if upstream is not None:
+                upstream.close()
+
+
+class IdleManager:
+    """空闲容器休眠
+
+    定期检查每个运行中的容器：网卡收发字节数有变化、CPU 使用率(来自状态采集器)
+    超过阈值或有打开的网页终端时视为活跃。连续 idle_timeout 秒不活跃的容器被停止
+    并标记为休眠，其 HTTP、SSH、FTP 主机端口交给激活器，有连接时自动启动。
+    用户手动启动、停止或删除容器前调用 release 取消休眠。
+    """
+
+    def __init__(self, docker_manager, registry, collector, multiplexer, idle_timeout: float,
+                 cpu_threshold: float = 1.0, check_interval: float = 60, wake_timeout: float = 30):
+        self.docker = docker_manager
+        self.registry = registry
+        self.collector = collector
+        self.multiplexer = multiplexer
+        self.idle_timeout = idle_timeout
+        self.cpu_threshold = cpu_threshold
+        self.check_interval = check_interval
+        self.activator = Activator(self.wake, wake_timeout)
+        self._activity: Dict[str, Dict] = {}
+        self._wake_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._socketio = None
+
+    def start(self, socketio) -> None:
+        """启动后台检查，并为上次运行时休眠的容器重新监听端口；重复调用无副作用"""
+        if self._socketio is not None:
+            return
+        self._socketio = socketio
+        self.activator.start(socketio)
+        for container_id, info in self.registry.list_containers().items():
+            if info.get('suspended') and not self._is_running(container_id):
+                self.activator.watch(container_id, self._ports(info))
+        if self.idle_timeout > 0:
+            socketio.start_background_task(self._run)
+
+    @staticmethod
+    def _ports(info: Dict) -> Dict[str, int]:
+        return {key: info[key] for key in CONTAINER_PORT_TARGETS if info.get(key)}
+
+    def _is_running(self, container_id: str) -> bool:
+        container_name = get_container_name(int(container_id))
+        if self.docker.states.synced:
+            state = self.docker.states.get(container_name)
+            return state is not None and state['status'] == 'running'
+        try:
+            info = self.docker.engine.inspect(container_name)
+        except EngineError:
+            return False
+        return info is not None and info.get('State', {}).get('Running', False)
+
+    def _net_bytes(self, container_id: str, activity: Dict) -> Optional[int]:
+        """读取容器网卡计数，缓存容器主进程 PID，容器重启后重新 inspect"""
+        pid = activity.get('pid')
+        value = read_net_bytes(pid) if pid else None
+        if value is None:
+            info = self.docker.engine.inspect(get_container_name(int(container_id)))
+            pid = info.get('State', {}).get('Pid') if info else None
+            activity['pid'] = pid
+            value = read_net_bytes(pid) if pid else None
+        return value
+
+    def _is_active(self, container_id: str, activity: Dict) -> bool:
+        active = False
+        net = self._net_bytes(container_id, activity)
+        if net is None or net != activity.get('net'):
+            active = True
+        activity['net'] = net
+        status = self.collector.get(container_id)
+        if status is not None and status.get('cpu_usage', 0) > self.cpu_threshold:
+            active = True
+        if self.multiplexer.find(container_id=container_id):
+            active = True
+        return active
+
+    def check_once(self) -> List[str]:
+        """检查所有容器，返回本次休眠的容器ID"""
+        now = time.monotonic()
+        containers = self.registry.list_containers()
+        suspended = []
+
+        # 已删除的容器不再监听
+        for container_id in self.activator.watched():
+            if container_id not in containers:
+                self.activator.release(container_id)
+        for container_id in set(self._activity) - set(containers):
+            del self._activity[container_id]
+
+        for container_id, info in containers.items():
+            if info.get('suspended') or not self._is_running(container_id):
+                self._activity.pop(container_id, None)
+                continue
+            activity = self._activity.get(container_id)
+            if activity is None:
+                # 新发现的容器从现在开始计时
+                activity = self._activity[container_id] = {'last_active': now}
+            if self._is_active(container_id, activity):
+                activity['last_active'] = now
+            elif now - activity['last_active'] >= self.idle_timeout:
+                try:
+                    self.suspend(container_id, info)
+                    suspended.append(container_id)
+                except (EngineError, RegistryError) as e:
+                    print(f"休眠容器 {container_id} 失败: {str(e)}")
+        return suspended
+
+    def suspend(self, container_id: str, info: Dict) -> None:
+        """停止容器并由激活器接管端口"""
+        self.docker.engine.stop(get_container_name(int(container_id)))
+        self.registry.update_container(container_id, {'suspended': True})
+        self._activity.pop(container_id, None)
+        self.activator.watch(container_id, self._ports(info))
+
+    def _wake_lock(self, container_id: str) -> threading.Lock:
+        with self._lock:
+            return self._wake_locks.setdefault(container_id, threading.Lock())
+
+    def wake(self, container_id: str) -> Optional[str]:
+        """启动休眠的容器，返回容器 IP；同一容器的并发唤醒只启动一次"""
+        container_name = get_container_name(int(container_id))
+        with self._wake_lock(container_id):
+            if self.activator.release(container_id, drain=True):
+                self.docker.engine.start(container_name)
+                try:
+                    self.registry.update_container(container_id, {'suspended': None})
+                except RegistryError:
+                    pass
+            info = self.docker.engine.inspect(container_name)
+        return container_address(info) if info else None
+
+    def release(self, container_id: str) -> None:
+        """取消容器的休眠状态(用户手动操作容器前调用)"""
+        with self._wake_lock(container_id):
+            self.activator.release(container_id)
+            info = self.registry.get_container(container_id)
+            if info is not None and info.get('suspended'):
+                self.registry.update_container(container_id, {'suspended': None})
+
+    def _run(self) -> None:
+        while True:
+            try:
+                for container_id in self.check_once():
+                    print(f"容器 {container_id} 空闲，已休眠")
+            except Exception as e:
+                print(f"空闲检查错误: {str(e)}")
+            self._socketio.sleep(self.check_interval)
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_idle_manager() -> IdleManager:
+    """获取全局空闲容器管理器"""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                from config import IDLE_TIMEOUT, IDLE_CPU_THRESHOLD, IDLE_CHECK_INTERVAL, IDLE_WAKE_TIMEOUT
+                from collector import get_collector
+                from models import DockerManager
+                from ptymux import get_multiplexer
+                from registry import get_registry
+                _manager = IdleManager(DockerManager(), get_registry(), get_collector(), get_multiplexer(),
+                                       IDLE_TIMEOUT, IDLE_CPU_THRESHOLD, IDLE_CHECK_INTERVAL, IDLE_WAKE_TIMEOUT)
+    return _manager
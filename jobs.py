@@ -0,0 +1,162 @@
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+
+class JobError(Exception):
+    """任务失败，消息直接展示给用户"""
+    pass
+
+
+class Job:
+    """一个后台任务，状态依次为 queued、running、succeeded 或 failed"""
+
+    def __init__(self, kind: str, user_id: str, title: str, result_url: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.user_id = user_id
+        self.title = title
+        self.result_url = result_url
+        self.status = 'queued'
+        self.progress = 0
+        self.message = '排队中'
+        self.result: Optional[Dict] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in ('succeeded', 'failed')
+
+    def to_dict(self) -> Dict:
+        return {
+            'job_id': self.id,
+            'kind': self.kind,
+            'title': self.title,
+            'status': self.status,
+            'progress': self.progress,
+            'message': self.message,
+            'result_url': self.result_url
+        }
+
+
+class JobContext:
+    """传给任务函数，用于报告进度和申请 Docker 操作配额"""
+
+    def __init__(self, queue: 'JobQueue', job: Job):
+        self.queue = queue
+        self.job = job
+
+    def progress(self, percent: int, message: str) -> None:
+        self.queue._update(self.job, progress=percent, message=message)
+
+    @contextmanager
+    def docker(self):
+        """主机级 Docker 限流：同时进行的重操作(构建、创建、删除容器)不超过配额"""
+        if not self.queue._docker_slots.acquire(blocking=False):
+            self.progress(self.job.progress, '等待 Docker 空闲')
+            self.queue._docker_slots.acquire()
+        try:
+            yield
+        finally:
+            self.queue._docker_slots.release()
+
+
+class JobQueue:
+    """进程内的后台任务队列
+
+    路由提交任务后立即返回任务ID，任务在后台协程中执行，
+    进度推送到 Socket.IO 房间 job_<ID>。每种任务有独立的并发上限，
+    任务内的 Docker 重操作另受主机级配额限制。已结束的任务保留 retention 秒供查询结果。
+    """
+
+    def __init__(self, concurrency: Dict[str, int], docker_concurrency: int, retention: float = 3600):
+        self._slots = {kind: threading.BoundedSemaphore(limit) for kind, limit in concurrency.items()}
+        self._docker_slots = threading.BoundedSemaphore(docker_concurrency)
+        self.retention = retention
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._socketio = None
+
+    @staticmethod
+    def room(job_id: str) -> str:
+        return f'job_{job_id}'
+
+    def start(self, socketio) -> None:
+        self._socketio = socketio
+
+    def submit(self, job: Job, func: Callable[[JobContext], Optional[Dict]]) -> Job:
+        """提交任务，func 接收 JobContext 并返回结果字典；未启动时同步执行"""
+        with self._lock:
+            self._cleanup()
+            self._jobs[job.id] = job
+        if self._socketio is None:
+            self._execute(job, func)
+        else:
+            self._socketio.start_background_task(self._execute, job, func)
+        return job
+
+    def get(self, job_id: str, user_id: str) -> Optional[Job]:
+        """获取用户自己的任务"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None or job.user_id != user_id:
+            return None
+        return job
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return {status: sum(1 for job in jobs if job.status == status)
+                for status in ('queued', 'running', 'succeeded', 'failed')}
+
+    def _cleanup(self) -> None:
+        now = time.time()
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.done and now - job.finished_at > self.retention]:
+            del self._jobs[job_id]
+
+    def _update(self, job: Job, **changes) -> None:
+        for key, value in changes.items():
+            setattr(job, key, value)
+        if self._socketio is not None:
+            self._socketio.emit('job_progress', job.to_dict(), room=self.room(job.id))
+
+    def _execute(self, job: Job, func: Callable[[JobContext], Optional[Dict]]) -> None:
+        slots = self._slots.get(job.kind)
+        if slots is not None:
+            slots.acquire()
+        try:
+            self._update(job, status='running', message='开始执行')
+            try:
+                result = func(JobContext(self, job))
+            except JobError as e:
+                job.finished_at = time.time()
+                self._update(job, status='failed', message=str(e))
+            except Exception as e:
+                job.finished_at = time.time()
+                self._update(job, status='failed', message=f'{job.title}失败: {str(e)}')
+            else:
+                job.result = result or {}
+                job.finished_at = time.time()
+                self._update(job, status='succeeded', progress=100, message='完成')
+        finally:
+            if slots is not None:
+                slots.release()
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """获取全局任务队列"""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                from config import JOB_CONCURRENCY, JOB_DOCKER_CONCURRENCY, JOB_RETENTION
+                _queue = JobQueue(JOB_CONCURRENCY, JOB_DOCKER_CONCURRENCY, JOB_RETENTION)
+    return _queue
@@ -1,105 +1,167 @@
-from typing import Dict, List, Optional, Tuple
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 from datetime import datetime
-import subprocess
-import json
-from config import CONTAINER_LIMITS
+from config import CONTAINER_LIMITS, CGROUP_ROOT
 import random
 import os
+from engine import get_engine, EngineError, ExecResult, ArchiveFile
+from cgroup import CgroupReader
+from diskusage import get_disk_accounting
+from events import get_event_watcher
 from utils import (
     get_container_name,
     get_container_ports,
+    get_container_id,
     ensure_data_dir,
     calculate_expiry,
-    load_config,
-    save_config,
-    validate_user_container
+    validate_user_container,
+    CONTAINER_PORT_TARGETS
 )
+from registry import get_registry, RegistryError
+from pool import get_warm_pool
+from hostproxy import get_route_table
+from idle import get_idle_manager
+from expiry import get_expiry_reaper
+
+class Container:
+    """容器句柄，操作都转发给 DockerManager
+
+    启动、停止、重启和删除是用户的手动操作，执行前先取消空闲休眠。
+    """
+    def __init__(self, manager: 'DockerManager', name: str):
+        self.manager = manager
+        self.name = name
+
+    def _release_idle(self) -> None:
+        get_idle_manager().release(str(get_container_id(self.name)))
+
+    def exec_run(self, cmd: List[str], user: str = '') -> ExecResult:
+        return self.manager.exec_run(self.name, cmd, user=user)
+
+    def start(self) -> None:
+        self._release_idle()
+        self.manager.engine.start(self.name)
+
+    def stop(self) -> None:
+        self._release_idle()
+        self.manager.engine.stop(self.name)
+
+    def restart(self) -> None:
+        self._release_idle()
+        self.manager.engine.restart(self.name)
+
+    def remove(self) -> None:
+        self._release_idle()
+        self.manager.engine.remove(self.name)
 
 class DockerManager:
     """Docker容器管理类"""
     def __init__(self):
-        pass
+        self.engine = get_engine()
+        self.cgroups = CgroupReader.detect(CGROUP_ROOT)
+        self.disk = get_disk_accounting()
+        self.states = get_event_watcher()
 
     def create_container(self, container_id: int, username: str, password: str, container_type: str = 'base', user_id: str = None) -> str:
         """创建新容器"""
+        container_name = self.start_container(container_id, container_type, {
+            'CONTAINER_USER': username,
+            'CONTAINER_PASSWORD': password
+        })
+        self.setup_user(container_name, username, password)
+        return container_name
+
+    def start_container(self, container_id: int, container_type: str = 'base',
+                        environment: Optional[Dict[str, str]] = None) -> str:
+        """创建并启动容器(含数据目录和端口)，不创建用户，供预热池提前创建"""
         container_name = get_container_name(container_id)
         image_name = f'dotmachine-{container_type}'
         ports = get_container_ports(container_id)
         data_dir = ensure_data_dir(container_id)
+        self.disk.setup(container_id, data_dir)
 
         # 确保镜像存在
-        try:
-            subprocess.run(['sudo', 'docker', 'image', 'inspect', image_name], check=True, capture_output=True)
-        except subprocess.CalledProcessError:
-            subprocess.run(['sudo', 'docker', 'build', '-t', image_name, '-f', f'Dockerfile.{container_type}', '.'], check=True)
+        if not self.engine.image_exists(image_name):
+            self.engine.build_image(image_name, f'Dockerfile.{container_type}')
 
         # 创建并启动容器
-        cmd = [
-            'sudo', 'docker', 'run', '-d',
-            '--name', container_name,
-            '--privileged',  # 添加特权模式
-            '--cap-add=NET_ADMIN',  # 添加网络管理权限
-            '--cap-add=NET_RAW',    # 添加原始网络权限
-            '-p', f'{ports["ssh_port"]}:22',
-            '-p', f'{ports["ftp_port"]}:21',
-            '-p', f'{ports["http_port"]}:9000',
-            '-v', f'{os.path.abspath(data_dir)}:/data:rw',
-            '--cpu-period', str(CONTAINER_LIMITS["cpu_period"]),
-            '--cpu-quota', str(CONTAINER_LIMITS["cpu_quota"]),
-            '--memory', CONTAINER_LIMITS["mem_limit"].replace('m', 'M'),
-            '-e', f'CONTAINER_USER={username}',
-            '-e', f'CONTAINER_PASSWORD={password}',
-            image_name
-        ]
-
-        subprocess.run(cmd, check=True)
-
-        # 在容器中创建用户
-        subprocess.run(['sudo', 'docker', 'exec', container_name, '/usr/local/bin/create_user.sh', username, password], check=True)
-        
-        # 修改用户的.bashrc
+        self.engine.run_container(
+            name=container_name,
+            image=image_name,
+            ports={target: ports[key] for key, target in CONTAINER_PORT_TARGETS.items()},
+            volumes={os.path.abspath(data_dir): '/data:rw'},
+            environment=environment or {},
+            cpu_period=CONTAINER_LIMITS['cpu_period'],
+            cpu_quota=CONTAINER_LIMITS['cpu_quota'],
+            mem_limit=CONTAINER_LIMITS['mem_limit'],
+            privileged=True,  # 特权模式
+            cap_add=['NET_ADMIN', 'NET_RAW']  # 网络管理及原始网络权限
+        )
+        return container_name
+
+    def setup_user(self, container_name: str, username: str, password: str) -> None:
+        """在容器中创建用户并追加欢迎信息，只需一次 exec"""
+        bashecho_content = ''
         if os.path.exists('.bashecho'):
             with open('.bashecho', 'r') as f:
                 bashecho_content = f.read()
-            
-            # 创建临时文件并添加到.bashrc
-            subprocess.run(['sudo', 'docker', 'exec', container_name, 'sh', '-c', f'echo "{bashecho_content}" > /tmp/bashecho'], check=True)
-            subprocess.run(['sudo', 'docker', 'exec', container_name, 'sh', '-c', f'echo "\n# DotMachine welcome message" >> /home/{username}/.bashrc'], check=True)
-            subprocess.run(['sudo', 'docker', 'exec', container_name, 'sh', '-c', f'cat /tmp/bashecho >> /home/{username}/.bashrc'], check=True)
-            subprocess.run(['sudo', 'docker', 'exec', container_name, 'rm', '/tmp/bashecho'], check=True)
-        
-        return container_name
+        # 参数通过位置参数传入，不拼接进脚本
+        script = ('/usr/local/bin/create_user.sh "$1" "$2" && '
+                  'if [ -n "$3" ]; then printf "\\n# DotMachine welcome message\\n%s\\n" "$3" >> "/home/$1/.bashrc"; fi')
+        self.check_exec(container_name, ['sh', '-c', script, 'sh', username, password, bashecho_content])
 
     def remove_container(self, container_name: str) -> None:
         """删除容器"""
         try:
-            subprocess.run(['sudo', 'docker', 'stop', container_name], check=True)
-            subprocess.run(['sudo', 'docker', 'rm', container_name], check=True)
-        except subprocess.CalledProcessError:
+            self.engine.stop(container_name)
+            self.engine.remove(container_name)
+        except EngineError:
             pass
 
-    def get_container(self, container_name: str) -> Optional[str]:
+    def get_container(self, container_name: str) -> Optional[Container]:
         """获取容器实例"""
-        try:
-            subprocess.run(['sudo', 'docker', 'inspect', container_name], check=True, capture_output=True)
-            return container_name
-        except subprocess.CalledProcessError:
+        if self.engine.inspect(container_name) is None:
             return None
+        return Container(self, container_name)
+
+    def exec_run(self, container_name: str, cmd: List[str], user: str = '') -> ExecResult:
+        """在容器中执行命令"""
+        return self.engine.exec_run(container_name, cmd, user=user)
+
+    def check_exec(self, container_name: str, cmd: List[str], user: str = '') -> bytes:
+        """在容器中执行命令，失败时抛出 EngineError"""
+        result = self.engine.exec_run(container_name, cmd, user=user)
+        if result.exit_code != 0:
+            raise EngineError(result.output.decode(errors='replace').strip() or f"命令执行失败: {cmd[0]}")
+        return result.output
+
+    def copy_from_container(self, container_name: str, path: str, dest_path: str) -> None:
+        """从容器复制文件到主机"""
+        self.engine.copy_from(container_name, path, dest_path)
+
+    def open_file(self, container_name: str, path: str) -> ArchiveFile:
+        """以流的方式打开容器中的文件，失败时抛出 EngineError"""
+        return ArchiveFile(self.engine.get_archive(container_name, path))
+
+    def get_archive(self, container_name: str, path: str) -> Iterator[bytes]:
+        """以 tar 流读取容器内的文件或目录"""
+        return self.engine.get_archive(container_name, path)
+
+    def put_archive(self, container_name: str, path: str, data) -> None:
+        """把 tar 流解压到容器内的目录"""
+        self.engine.put_archive(container_name, path, data)
+
+    def copy_to_container(self, container_name: str, src_path: str, path: str) -> None:
+        """从主机复制文件到容器"""
+        self.engine.copy_to(container_name, src_path, path)
             
     def get_container_status(self, container_name: str) -> Dict:
         """获取容器状态信息"""
         try:
-            # 获取容器运行状态
-            inspect_result = subprocess.run(
-                ['sudo', 'docker', 'inspect', container_name],
-                check=True, capture_output=True, text=True
-            )
-            container_info = json.loads(inspect_result.stdout)[0]
-            running = container_info['State']['Running']
-            
-            if not running:
+            # 事件订阅已同步时，未运行的容器直接由状态表得出
+            state = self.states.get(container_name) if self.states.synced else None
+            if state is not None and state['status'] != 'running':
                 return {
-                    'status': 'stopped',
+                    'status': 'paused' if state['status'] == 'paused' else 'stopped',
                     'cpu_usage': 0,
                     'memory_usage': 0,
                     'memory_limit': 0,
@@ -107,33 +169,45 @@ class DockerManager:
                     'disk_limit': 0
                 }
             
-            # 获取容器统计信息
-            stats_result = subprocess.run(
-                ['sudo', 'docker', 'stats', container_name, '--no-stream', '--format', '{{json .}}'],
-                check=True, capture_output=True, text=True
-            )
-            stats = json.loads(stats_result.stdout)
+            # 已知 cgroup 目录的运行中容器直接读取资源使用，无需访问docker
+            stats = self.cgroups.read_container(container_name) if self.cgroups else None
             
-            # 获取容器磁盘使用情况
-            df_result = subprocess.run(
-                ['sudo', 'docker', 'exec', container_name, 'df', '-B1', '/data'],
-                check=True, capture_output=True, text=True
-            )
-            df_lines = df_result.stdout.strip().split('\n')
-            disk_info = df_lines[1].split()
-            disk_total = int(disk_info[1])
-            disk_used = int(disk_info[2])
+            if stats is None:
+                # 获取容器运行状态
+                container_info = self.engine.inspect(container_name)
+                if container_info is None:
+                    raise EngineError(f"容器 {container_name} 不存在")
+                running = container_info['State']['Running']
+                
+                if not running:
+                    return {
+                        'status': 'stopped',
+                        'cpu_usage': 0,
+                        'memory_usage': 0,
+                        'memory_limit': 0,
+                        'disk_usage': 0,
+                        'disk_limit': 0
+                    }
+                
+                # 获取容器统计信息，没有 cgroup v2 时退回 Engine stats
+                if self.cgroups and self.cgroups.remember(container_name, container_info['Id'], container_info['State']['Pid']):
+                    stats = self.cgroups.read_container(container_name)
+                if stats is None:
+                    stats = self.engine.stats(container_name)
+            
+            # 获取容器磁盘使用情况(在主机侧统计数据目录)
+            disk = self.disk.usage(get_container_id(container_name))
             
             return {
                 'status': 'running',
-                'cpu_usage': float(stats['CPUPerc'].strip('%')),
-                'memory_usage': int(stats['MemUsage'].split('/')[0].strip().replace('MiB', '')) * 1024 * 1024,
-                'memory_limit': int(stats['MemUsage'].split('/')[1].strip().replace('MiB', '')) * 1024 * 1024,
-                'disk_usage': disk_used,
-                'disk_limit': disk_total
+                'cpu_usage': stats['cpu_usage'],
+                'memory_usage': stats['memory_usage'],
+                'memory_limit': stats['memory_limit'],
+                'disk_usage': disk['disk_usage'],
+                'disk_limit': disk['disk_limit']
             }
             
-        except subprocess.CalledProcessError as e:
+        except EngineError as e:
             return {
                 'status': 'error',
                 'error': str(e)
@@ -148,63 +222,85 @@ class ContainerManager:
     """容器管理类"""
     def __init__(self):
         self.docker = DockerManager()
+        self.registry = get_registry()
+        self.pool = get_warm_pool()
+        self.reaper = get_expiry_reaper()
 
-    def create_container(self, user_id: str, username: str, container_type: str = 'base') -> Tuple[Dict, str]:
-        """创建新容器并更新配置"""
-        config = load_config()
-        
-        # 检查用户是否已有容器
-        for info in config['containers'].values():
-            if info.get('user_id') == user_id:
-                raise ValueError("用户已经创建了一个实例")
-
-        # 生成容器信息
-        container_id = config['next_id']
+    def create_container(self, user_id: str, username: str, container_type: str = 'base',
+                         progress: Optional[Callable[[int, str], None]] = None) -> Tuple[Dict, str]:
+        """创建新容器并更新配置，progress(百分比, 说明) 用于报告进度"""
         from utils import generate_password
         password = generate_password()
+        progress = progress or (lambda percent, message: None)
+
+        def build_info(container_id: int) -> Dict:
+            return {
+                'name': get_container_name(container_id),
+                'username': username,
+                'password': password,
+                'user_id': user_id,
+                'type': container_type,
+                **get_container_ports(container_id),
+                'websites': [],
+                'created_at': datetime.utcnow().isoformat() + 'Z',
+                'expires_at': calculate_expiry()
+            }
+
+        # 优先从预热池领取已启动的容器，只需创建用户
+        if self.registry.find_by_user(user_id)[0] is None:
+            warm_id = self.pool.claim(container_type)
+            if warm_id is not None:
+                progress(50, '正在创建用户')
+                try:
+                    container_id, container_info = self.registry.reserve_container(user_id, build_info, warm_id)
+                except RegistryError as e:
+                    self.pool.release(warm_id, container_type)
+                    raise ValueError(str(e))
+                try:
+                    self.docker.setup_user(container_info['name'], username, password)
+                except Exception:
+                    self.registry.delete_container(container_id)
+                    self.pool.discard(warm_id)
+                    raise
+                self.reaper.schedule(container_id, container_info['expires_at'])
+                return container_info, password
+
+        # 原子地分配容器ID和端口，同时检查用户是否已有容器
+        try:
+            container_id, container_info = self.registry.reserve_container(user_id, build_info)
+        except RegistryError as e:
+            raise ValueError(str(e))
         
-        # 创建容器
-        container = self.docker.create_container(
-            container_id=container_id,
-            username=username,
-            password=password,
-            container_type=container_type,
-            user_id=user_id
-        )
-        
-        # 更新配置
-        ports = get_container_ports(container_id)
-        container_info = {
-            'name': get_container_name(container_id),
-            'username': username,
-            'password': password,
-            'user_id': user_id,
-            'type': container_type,
-            **ports,
-            'websites': [],
-            'created_at': datetime.utcnow().isoformat() + 'Z',
-            'expires_at': calculate_expiry()
-        }
-        
-        config['containers'][str(container_id)] = container_info
-        config['next_id'] = container_id + 1
-        save_config(config)
+        # 创建容器，失败时释放已分配的记录
+        progress(20, '正在创建容器')
+        try:
+            self.docker.create_container(
+                container_id=int(container_id),
+                username=username,
+                password=password,
+                container_type=container_type,
+                user_id=user_id
+            )
+        except Exception:
+            self.registry.delete_container(container_id)
+            raise
         
+        self.reaper.schedule(container_id, container_info['expires_at'])
         return container_info, password
 
     def remove_container(self, container_id: str, user_id: str) -> None:
         """删除容器并更新配置"""
-        config = load_config()
-        
         # 验证容器属于用户
-        container_info = config['containers'].get(container_id)
-        if not container_info or container_info.get('user_id') != user_id:
+        if not validate_user_container(container_id, user_id):
             raise ValueError("无权操作此容器")
         
-        # 删除容器
+        # 删除容器，休眠中的容器先释放激活器占用的端口
+        get_idle_manager().release(container_id)
         container_name = get_container_name(int(container_id))
         self.docker.remove_container(container_name)
         
         # 更新配置
-        del config['containers'][container_id]
-        save_config(config)
+        self.registry.delete_container(container_id)
+        
+        # 移除该实例绑定的域名路由
+        get_route_table().schedule()
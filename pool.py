@@ -0,0 +1,158 @@
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Dict, List, Optional
+from engine import EngineError
+from utils import get_container_name, get_data_dir
+
+
+class WarmPool:
+    """预热容器池
+
+    按类型提前创建并启动未分配的容器(已占用容器ID、端口和数据目录，但没有用户)，
+    创建实例时直接领取一个，只需一次 exec 创建用户。领取后在后台补足。
+    池中的容器ID记录在 state_path 中，重启后校验容器仍在运行再继续使用。
+    """
+
+    def __init__(self, docker_manager, registry, sizes: Dict[str, int], state_path: str,
+                 max_machines: int, refill_interval: float = 30):
+        self.docker = docker_manager
+        self.registry = registry
+        self.sizes = dict(sizes)
+        self.state_path = state_path
+        self.max_machines = max_machines
+        self.refill_interval = refill_interval
+        self._ready: Dict[str, List[int]] = {container_type: [] for container_type in self.sizes}
+        self._lock = threading.Lock()
+        self._socketio = None
+        self._refill_due = True
+        self._load()
+
+    def start(self, socketio) -> None:
+        """启动后台补充任务，重复调用无副作用"""
+        with self._lock:
+            if self._socketio is not None:
+                return
+            self._socketio = socketio
+        socketio.start_background_task(self._run)
+
+    def _load(self) -> None:
+        try:
+            with open(self.state_path, 'r') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        for container_type, ids in state.items():
+            for container_id in ids:
+                if container_type in self._ready and self._is_running(container_id):
+                    self._ready[container_type].append(container_id)
+                else:
+                    self.discard(container_id)
+
+    def _save(self) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(self.state_path)), exist_ok=True)
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self._ready, f)
+        os.replace(tmp_path, self.state_path)
+
+    def _is_running(self, container_id: int) -> bool:
+        container_name = get_container_name(container_id)
+        states = self.docker.states
+        if states.synced:
+            state = states.get(container_name)
+            return state is not None and state['status'] == 'running'
+        try:
+            info = self.docker.engine.inspect(container_name)
+        except EngineError:
+            return False
+        return info is not None and info.get('State', {}).get('Running', False)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {container_type: {'ready': len(ids), 'target': self.sizes[container_type]}
+                    for container_type, ids in self._ready.items()}
+
+    def claim(self, container_type: str) -> Optional[int]:
+        """领取一个已启动的容器，返回容器ID；池中没有可用容器时返回 None"""
+        while True:
+            with self._lock:
+                ids = self._ready.get(container_type)
+                if not ids:
+                    return None
+                container_id = ids.pop(0)
+                self._save()
+                self._refill_due = True
+            if self._is_running(container_id):
+                return container_id
+            self.discard(container_id)
+
+    def release(self, container_id: int, container_type: str) -> None:
+        """归还领取后未使用(尚未创建用户)的容器"""
+        with self._lock:
+            if container_type in self._ready:
+                self._ready[container_type].insert(0, container_id)
+                self._save()
+                return
+        self.discard(container_id)
+
+    def discard(self, container_id: int) -> None:
+        """删除池中的容器及其数据目录"""
+        try:
+            self.docker.engine.remove(get_container_name(container_id), force=True)
+        except EngineError:
+            pass
+        shutil.rmtree(get_data_dir(container_id), ignore_errors=True)
+
+    def _has_capacity(self) -> bool:
+        with self._lock:
+            pooled = sum(len(ids) for ids in self._ready.values())
+        return self.registry.count() + pooled < self.max_machines
+
+    def refill(self) -> None:
+        """为每种类型补足容器，容器总数不超过 max_machines"""
+        for container_type, size in self.sizes.items():
+            while len(self._ready[container_type]) < size and self._has_capacity():
+                container_id = self.registry.allocate_id()
+                try:
+                    self.docker.start_container(container_id, container_type)
+                except Exception:
+                    self.discard(container_id)
+                    raise
+                with self._lock:
+                    self._ready[container_type].append(container_id)
+                    self._save()
+
+    def _run(self) -> None:
+        last_refill = 0.0
+        while True:
+            if self._refill_due or time.monotonic() - last_refill > self.refill_interval:
+                self._refill_due = False
+                last_refill = time.monotonic()
+                try:
+                    self.refill()
+                except (EngineError, OSError) as e:
+                    print(f"预热容器创建失败: {str(e)}")
+                except Exception as e:
+                    print(f"预热池补充错误: {str(e)}")
+            self._socketio.sleep(1)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_warm_pool() -> WarmPool:
+    """获取全局预热容器池"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                from config import WARM_POOL_SIZES, WARM_POOL_STATE, WARM_POOL_INTERVAL, MAX_MACHINES
+                from models import DockerManager
+                from registry import get_registry
+                _pool = WarmPool(DockerManager(), get_registry(), WARM_POOL_SIZES, WARM_POOL_STATE,
+                                 MAX_MACHINES, WARM_POOL_INTERVAL)
+    return _pool
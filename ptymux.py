@@ -0,0 +1,500 @@
+import errno
+import fcntl
+import os
+import pty
+import selectors
+import signal
+import socket
+import struct
+import subprocess
+import termios
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional
+from termio import OutputPipeline, ScrollbackRing
+from engine import ApiEngine, EngineError
+
+
+def set_winsize(fd: int, rows: int, cols: int, xpix: int = 0, ypix: int = 0) -> None:
+    """设置终端窗口大小"""
+    winsize = struct.pack('HHHH', rows, cols, xpix, ypix)
+    fcntl.ioctl(fd, termios.TIOCSWINSZ, winsize)
+
+
+def _make_controlling_tty():
+    """子进程中执行：新建会话并以伪终端作为控制终端，关闭主端时子进程会收到 SIGHUP"""
+    os.setsid()
+    fcntl.ioctl(0, termios.TIOCSCTTY, 0)
+
+
+class PtyChannel:
+    """主机伪终端 + 子进程(如 docker exec -it)"""
+
+    def __init__(self, cmd: List[str], rows: int, cols: int):
+        master_fd, slave_fd = pty.openpty()
+        set_winsize(master_fd, rows, cols)
+        try:
+            self.process = subprocess.Popen(
+                cmd,
+                stdin=slave_fd,
+                stdout=slave_fd,
+                stderr=slave_fd,
+                preexec_fn=_make_controlling_tty,
+                close_fds=True
+            )
+        finally:
+            # 父进程不保留从端，子进程退出后读主端才能得到 EOF/EIO
+            os.close(slave_fd)
+        os.set_blocking(master_fd, False)
+        self.fd = master_fd
+
+    def fileno(self) -> int:
+        return self.fd
+
+    def read(self, size: int) -> Optional[bytes]:
+        """读取输出；暂无数据返回 None，对端已关闭返回 b''"""
+        try:
+            return os.read(self.fd, size)
+        except BlockingIOError:
+            return None
+        except OSError as e:
+            if e.errno == errno.EIO:
+                return b''
+            raise
+
+    def write(self, data: bytes) -> None:
+        os.write(self.fd, data)
+
+    def resize(self, rows: int, cols: int) -> None:
+        set_winsize(self.fd, rows, cols)
+
+    def close(self) -> None:
+        try:
+            os.close(self.fd)
+        except OSError:
+            pass
+        try:
+            os.killpg(self.process.pid, signal.SIGHUP)
+        except OSError:
+            pass
+
+    def reap(self, force: bool = False) -> bool:
+        """回收子进程，返回是否已退出；force 时发送 SIGKILL"""
+        if self.process.poll() is not None:
+            return True
+        if force:
+            try:
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except OSError:
+                try:
+                    self.process.kill()
+                except OSError:
+                    pass
+        return self.process.poll() is not None
+
+
+def _namespace_pid(host_pid: int) -> Optional[int]:
+    """把宿主机上的进程号换算为容器 PID 命名空间内的进程号"""
+    try:
+        with open(f'/proc/{host_pid}/status', 'r') as f:
+            for line in f:
+                if line.startswith('NSpid:'):
+                    return int(line.split()[-1])
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+class ExecChannel:
+    """通过 Docker Engine API 的 exec 接口打开的终端
+
+    exec 以 TTY 模式启动并劫持 HTTP 连接，输入输出直接走这条 socket，
+    窗口大小通过 exec resize 接口调整，宿主机上不需要伪终端和子进程。
+    """
+
+    def __init__(self, engine: ApiEngine, container_name: str, cmd: List[str], rows: int, cols: int,
+                 user: str = '', workdir: Optional[str] = None,
+                 environment: Optional[Dict[str, str]] = None):
+        self.engine = engine
+        self.container_name = container_name
+        self.exec_id, self.sock = engine.exec_attach(container_name, cmd, user=user,
+                                                     workdir=workdir, environment=environment)
+        self.resize(rows, cols)
+
+    def fileno(self) -> int:
+        return self.sock.fileno()
+
+    def read(self, size: int) -> Optional[bytes]:
+        """读取输出；对端已关闭返回 b''"""
+        try:
+            return self.sock.recv(size)
+        except BlockingIOError:
+            return None
+        except OSError:
+            return b''
+
+    def write(self, data: bytes) -> None:
+        self.sock.sendall(data)
+
+    def resize(self, rows: int, cols: int) -> None:
+        try:
+            self.engine.exec_resize(self.exec_id, rows, cols)
+        except EngineError as e:
+            print(f"调整终端大小失败: {str(e)}")
+
+    def close(self) -> None:
+        # 断开连接后 shell 的标准输入收到 EOF，空闲的 shell 会自行退出
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+    def reap(self, force: bool = False) -> bool:
+        """宽限期过后仍在运行的 exec 进程(如前台程序未退出)向其发送 SIGHUP"""
+        if not force:
+            return False
+        try:
+            info = self.engine.exec_inspect(self.exec_id)
+            if info.get('Running') and info.get('Pid'):
+                pid = _namespace_pid(info['Pid'])
+                if pid is not None:
+                    self.engine.exec_run(self.container_name, ['kill', '-HUP', str(pid)])
+                else:
+                    os.kill(info['Pid'], signal.SIGHUP)
+        except (EngineError, OSError) as e:
+            print(f"结束终端进程失败: {str(e)}")
+        return True
+
+
+def open_terminal(engine, container_name: str, username: str, rows: int, cols: int):
+    """以容器用户身份打开登录 shell
+
+    API 后端使用 exec 接口直接连接，CLI 后端退回宿主机伪终端 + docker exec -it。
+    """
+    cmd = ['/bin/bash', '-l']
+    workdir = f'/home/{username}'
+    environment = {'TERM': 'xterm-256color'}
+    if isinstance(engine, ApiEngine):
+        return ExecChannel(engine, container_name, cmd, rows, cols,
+                           user=username, workdir=workdir, environment=environment)
+    return PtyChannel(engine.exec_args(container_name, cmd, user=username, workdir=workdir,
+                                       environment=environment, tty=True), rows, cols)
+
+
+class TerminalViewer:
+    """附加到会话上的一个客户端连接，拥有独立的输出管线和读取进度"""
+
+    def __init__(self, sid: str, pipeline: OutputPipeline):
+        self.sid = sid
+        self.pipeline = pipeline
+
+    @property
+    def offset(self) -> int:
+        return self.pipeline.position
+
+
+class TerminalSession:
+    """一个终端会话：终端通道(PtyChannel/ExecChannel) + 回滚缓冲区 + 若干观看者
+
+    会话与 Socket.IO 连接解耦，连接断开后会话继续运行，
+    客户端可凭会话ID重新附加，多个连接可以共享同一个会话。
+    """
+
+    def __init__(self, channel, scrollback: int,
+                 on_close: Optional[Callable[['TerminalSession', str], None]] = None, **info):
+        self.key = uuid.uuid4().hex
+        self.channel = channel
+        self.ring = ScrollbackRing(scrollback)
+        self.viewers: Dict[str, TerminalViewer] = {}
+        self.on_close = on_close
+        self.info = info
+        self.created_at = time.monotonic()
+        self.last_activity = self.created_at
+        self.detached_at = self.created_at
+        self.closed = False
+
+    def has_viewer(self, sid: str) -> bool:
+        return sid in self.viewers
+
+    def lag(self) -> int:
+        """最慢的观看者落后的字节数"""
+        if not self.viewers:
+            return 0
+        return self.ring.end - min(viewer.offset for viewer in self.viewers.values())
+
+
+class TerminalMultiplexer:
+    """终端多路复用器
+
+    所有会话的文件描述符注册在同一个 selector(epoll) 上，由单个后台任务
+    统一读取、合并发送、处理空闲超时，关闭时终止并回收子进程，
+    不再为每个终端创建线程。
+
+    终端输出先写入会话的回滚缓冲区，再按各观看者的进度分别发送；
+    任一观看者落后到即将被覆盖时暂停读取该终端。
+    """
+
+    READ_SIZE = 1024 * 20
+
+    def __init__(self, idle_timeout: float = 1800, detach_timeout: float = 600,
+                 reap_grace: float = 5.0):
+        self.idle_timeout = idle_timeout
+        self.detach_timeout = detach_timeout
+        self.reap_grace = reap_grace
+        self._selector = selectors.DefaultSelector()
+        self._sessions: Dict[str, TerminalSession] = {}
+        self._paused = set()
+        self._reaping = []
+        self._commands = []
+        self._lock = threading.Lock()
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        os.set_blocking(self._wakeup_r, False)
+        os.set_blocking(self._wakeup_w, False)
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ, None)
+        self._socketio = None
+
+    def start(self, socketio) -> None:
+        """启动后台任务，重复调用无副作用"""
+        with self._lock:
+            if self._socketio is not None:
+                return
+            self._socketio = socketio
+        socketio.start_background_task(self._run)
+
+    # ---- 对外接口(可在任意线程/协程调用) ----
+
+    def open(self, session: TerminalSession) -> None:
+        """注册新会话"""
+        self._submit(('open', session))
+
+    def attach(self, key: str, viewer: TerminalViewer, offset: int = 0) -> None:
+        """把连接附加到会话，从 offset 开始补发回滚缓冲区中的输出"""
+        self._submit(('attach', key, viewer, offset))
+
+    def detach(self, key: str, sid: str) -> None:
+        """连接离开会话，会话继续运行"""
+        self._submit(('detach', key, sid))
+
+    def detach_all(self, sid: str) -> None:
+        """连接断开时离开其附加的所有会话"""
+        self._submit(('detach_all', sid))
+
+    def get(self, key: str) -> Optional[TerminalSession]:
+        with self._lock:
+            return self._sessions.get(key)
+
+    def find(self, **info) -> List[TerminalSession]:
+        """按会话附加信息筛选会话"""
+        with self._lock:
+            return [session for session in self._sessions.values()
+                    if all(session.info.get(k) == v for k, v in info.items())]
+
+    def write(self, key: str, data: bytes) -> bool:
+        session = self.get(key)
+        if session is None or session.closed:
+            return False
+        session.last_activity = time.monotonic()
+        try:
+            session.channel.write(data)
+        except OSError:
+            return False
+        return True
+
+    def resize(self, key: str, rows: int, cols: int) -> bool:
+        session = self.get(key)
+        if session is None or session.closed:
+            return False
+        session.channel.resize(rows, cols)
+        return True
+
+    def close(self, key: str, reason: str = 'closed') -> None:
+        self._submit(('close', key, reason))
+
+    def stats(self, **info) -> Dict:
+        """会话数量统计；给出 info 时只统计附加信息匹配的会话，不含全局的待回收数"""
+        with self._lock:
+            sessions = [session for session in self._sessions.values()
+                        if all(session.info.get(k) == v for k, v in info.items())]
+            stats = {
+                'sessions': len(sessions),
+                'detached': sum(1 for session in sessions if not session.viewers),
+                'viewers': sum(len(session.viewers) for session in sessions),
+                'paused': sum(1 for session in sessions if session.key in self._paused)
+            }
+            if not info:
+                stats['reaping'] = len(self._reaping)
+            return stats
+
+    def _submit(self, command) -> None:
+        with self._lock:
+            self._commands.append(command)
+        try:
+            os.write(self._wakeup_w, b'\0')
+        except BlockingIOError:
+            pass
+
+    # ---- 后台任务 ----
+
+    def _process_commands(self) -> None:
+        with self._lock:
+            commands, self._commands = self._commands, []
+        for command in commands:
+            action = command[0]
+            if action == 'open':
+                session = command[1]
+                with self._lock:
+                    self._sessions[session.key] = session
+                self._selector.register(session.channel.fileno(), selectors.EVENT_READ, session)
+            elif action == 'attach':
+                _, key, viewer, offset = command
+                session = self.get(key)
+                if session is None or session.closed:
+                    continue
+                # 只补发客户端缺失的部分，已被覆盖的部分从缓冲区起点开始
+                viewer.pipeline.position = session.ring.read(offset, 0)[0]
+                session.viewers[viewer.sid] = viewer
+            elif action == 'detach':
+                session = self.get(command[1])
+                if session is not None:
+                    self._remove_viewer(session, command[2])
+            elif action == 'detach_all':
+                with self._lock:
+                    sessions = list(self._sessions.values())
+                for session in sessions:
+                    self._remove_viewer(session, command[1])
+            elif action == 'close':
+                self._close_session(command[1], command[2])
+
+    def _remove_viewer(self, session: TerminalSession, sid: str) -> None:
+        if session.viewers.pop(sid, None) is not None and not session.viewers:
+            session.detached_at = time.monotonic()
+
+    def _close_session(self, key: str, reason: str) -> None:
+        with self._lock:
+            session = self._sessions.pop(key, None)
+            self._paused.discard(key)
+        if session is None or session.closed:
+            return
+        session.closed = True
+        try:
+            self._selector.unregister(session.channel.fileno())
+        except (KeyError, ValueError):
+            pass
+        for viewer in session.viewers.values():
+            try:
+                self._pump(session, viewer)
+                viewer.pipeline.flush(final=True)
+            except Exception:
+                pass
+        session.channel.close()
+        self._reaping.append((session.channel, time.monotonic()))
+        if session.on_close is not None:
+            try:
+                session.on_close(session, reason)
+            except Exception as e:
+                print(f"终端关闭回调错误: {str(e)}")
+
+    def _read_size(self, session: TerminalSession) -> int:
+        return min(self.READ_SIZE, session.ring.capacity // 2)
+
+    def _read(self, session: TerminalSession) -> None:
+        try:
+            data = session.channel.read(self._read_size(session))
+        except OSError as e:
+            print(f"读取终端输出错误: {str(e)}")
+            data = b''
+        if data is None:
+            return
+        if not data:
+            self._close_session(session.key, 'exited')
+            return
+        session.last_activity = time.monotonic()
+        session.ring.write(data)
+
+    def _pump(self, session: TerminalSession, viewer: TerminalViewer) -> None:
+        """把回滚缓冲区中该观看者尚未收到的输出送入其管线"""
+        pipeline = viewer.pipeline
+        while viewer.offset < session.ring.end and not pipeline.paused:
+            offset, data = session.ring.read(viewer.offset, pipeline.max_frame)
+            # 落后过多的部分已被覆盖，直接跳过
+            pipeline.position = offset
+            pipeline.feed(data)
+            if pipeline.due():
+                pipeline.flush()
+
+    def _tick(self) -> float:
+        """分发输出、处理背压、空闲超时与进程回收，返回下一次等待时间"""
+        now = time.monotonic()
+        timeout = 1.0
+        with self._lock:
+            sessions = list(self._sessions.values())
+        for session in sessions:
+            for viewer in list(session.viewers.values()):
+                pipeline = viewer.pipeline
+                self._pump(session, viewer)
+                if pipeline.due():
+                    pipeline.flush()
+                if pipeline.has_pending:
+                    timeout = min(timeout, pipeline.timeout())
+                if pipeline.paused:
+                    timeout = min(timeout, pipeline.flush_interval)
+
+            # 最慢的观看者即将被覆盖时从 selector 移除，不再读取
+            paused = session.lag() + self._read_size(session) > session.ring.capacity
+            if paused and session.key not in self._paused:
+                self._selector.unregister(session.channel.fileno())
+                self._paused.add(session.key)
+            elif not paused and session.key in self._paused:
+                self._selector.register(session.channel.fileno(), selectors.EVENT_READ, session)
+                self._paused.discard(session.key)
+
+            if self.idle_timeout and now - session.last_activity > self.idle_timeout:
+                self._close_session(session.key, 'idle')
+            elif self.detach_timeout and not session.viewers and now - session.detached_at > self.detach_timeout:
+                self._close_session(session.key, 'detached')
+
+        still_running = []
+        for channel, closed_at in self._reaping:
+            if not channel.reap(force=now - closed_at > self.reap_grace):
+                still_running.append((channel, closed_at))
+        self._reaping = still_running
+        if self._reaping:
+            timeout = min(timeout, 0.5)
+        return timeout
+
+    def _run(self) -> None:
+        timeout = 1.0
+        while True:
+            try:
+                for key, _ in self._selector.select(timeout):
+                    if key.data is None:
+                        try:
+                            while os.read(self._wakeup_r, 512):
+                                pass
+                        except BlockingIOError:
+                            pass
+                    else:
+                        self._read(key.data)
+                self._process_commands()
+                timeout = self._tick()
+            except Exception as e:
+                print(f"终端多路复用错误: {str(e)}")
+                self._socketio.sleep(0.1)
+
+
+_multiplexer = None
+_multiplexer_lock = threading.Lock()
+
+
+def get_multiplexer() -> TerminalMultiplexer:
+    """获取全局终端多路复用器"""
+    global _multiplexer
+    if _multiplexer is None:
+        with _multiplexer_lock:
+            if _multiplexer is None:
+                from config import TERMINAL_IDLE_TIMEOUT, TERMINAL_DETACH_TIMEOUT
+                _multiplexer = TerminalMultiplexer(idle_timeout=TERMINAL_IDLE_TIMEOUT,
+                                                   detach_timeout=TERMINAL_DETACH_TIMEOUT)
+    return _multiplexer
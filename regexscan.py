@@ -0,0 +1,53 @@
+import json
+import re
+import sys
+
+# 单行最多返回的字符数
+MAX_LINE_LENGTH = 200
+
+
+def scan_lines(pattern, data: bytes, line: int, matches: list, limit: int) -> int:
+    """在以整行结尾的 data 中查找匹配行追加到 matches(最多 limit 条)，返回下一块的起始行号"""
+    position = 0
+    last_end = -1
+    for match in pattern.finditer(data):
+        start = data.rfind(b'\n', 0, match.start()) + 1
+        if start <= last_end:
+            continue
+        end = data.find(b'\n', match.start())
+        end = len(data) if end < 0 else end
+        line += data.count(b'\n', position, start)
+        position = start
+        last_end = end
+        matches.append({'line': line, 'text': data[start:end].decode(errors='replace')[:MAX_LINE_LENGTH]})
+        if len(matches) >= limit:
+            break
+    return line + data.count(b'\n', position)
+
+
+def main() -> None:
+    """以子进程运行时的入口，由 search.RegexProcess 启动
+
+    用户提供的正则表达式可能因回溯耗时极长，且匹配在 C 代码中执行、无法中途打断，
+    因此放在子进程中匹配，超时后直接终止子进程；本模块只依赖标准库。
+    第一行为 JSON {"pattern", "flags"}，之后每个请求为一行 "字节数 起始行号 最多匹配数" 加对应字节的内容，
+    每个请求回复一行 JSON {"line": 下一块的起始行号, "matches": [...]}。
+    """
+    stdin = sys.stdin.buffer
+    stdout = sys.stdout.buffer
+    options = json.loads(stdin.readline())
+    pattern = re.compile(options['pattern'].encode(), options['flags'])
+    while True:
+        header = stdin.readline()
+        if not header:
+            break
+        size, line, limit = (int(value) for value in header.split())
+        data = stdin.read(size)
+        matches = []
+        line = scan_lines(pattern, data, line, matches, limit)
+        stdout.write(json.dumps({'line': line, 'matches': matches}).encode() + b'\n')
+        stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
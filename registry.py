@@ -0,0 +1,486 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Tuple, Union
+from store import StateStore, get_store
+
+# containers 表中的固定列，其余字段存入 extra
+CONTAINER_COLUMNS = (
+    'name', 'username', 'password', 'user_id', 'type',
+    'http_port', 'ssh_port', 'ftp_port', 'created_at', 'expires_at'
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    username TEXT
+);
+CREATE TABLE IF NOT EXISTS containers (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    username TEXT,
+    password TEXT,
+    user_id TEXT UNIQUE REFERENCES users(user_id),
+    type TEXT,
+    http_port INTEGER UNIQUE,
+    ssh_port INTEGER UNIQUE,
+    ftp_port INTEGER UNIQUE,
+    created_at TEXT,
+    expires_at TEXT,
+    extra TEXT NOT NULL DEFAULT '{}'
+);
+CREATE INDEX IF NOT EXISTS idx_containers_expires_at ON containers(expires_at);
+CREATE TABLE IF NOT EXISTS websites (
+    domain TEXT PRIMARY KEY COLLATE NOCASE,
+    container_id INTEGER NOT NULL REFERENCES containers(id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS idx_websites_container ON websites(container_id);
+"""
+
+Updater = Union[Dict, Callable[[Dict], Dict]]
+
+
+class RegistryError(ValueError):
+    """注册表操作错误"""
+    pass
+
+
+class Registry:
+    """容器注册表接口
+
+    所有修改都是针对单个容器的原子操作，不再对整个配置做读-改-写。
+    """
+
+    # ---- 读取 ----
+
+    def get_container(self, container_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def owner_of(self, container_id: str) -> Optional[str]:
+        info = self.get_container(container_id)
+        return info.get('user_id') if info else None
+
+    def find_by_user(self, user_id: str) -> Tuple[Optional[str], Optional[Dict]]:
+        raise NotImplementedError
+
+    def find_by_domain(self, domain: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def find_by_name(self, name: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def list_containers(self) -> Dict[str, Dict]:
+        raise NotImplementedError
+
+    def count(self) -> int:
+        return len(self.list_containers())
+
+    def snapshot(self) -> Dict:
+        """以 containers.json 的格式返回完整文档"""
+        raise NotImplementedError
+
+    # ---- 修改 ----
+
+    def allocate_id(self) -> int:
+        """原子地预留一个容器ID(及其端口)但不写入容器记录，供预热池提前创建容器"""
+        raise NotImplementedError
+
+    def reserve_container(self, user_id: str, build_info: Callable[[int], Dict],
+                          container_id: Optional[int] = None) -> Tuple[str, Dict]:
+        """原子地分配容器ID(及其端口)并写入容器记录
+
+        build_info 接收新分配的ID，返回容器信息。用户已有容器时抛出 RegistryError。
+        container_id 为 allocate_id 预留的ID时直接使用该ID。
+        """
+        raise NotImplementedError
+
+    def update_container(self, container_id: str, updates: Updater) -> Dict:
+        """原子地更新容器字段
+
+        updates 可以是字段字典，也可以是接收当前信息并返回字段字典的函数。
+        值为 None 的非固定字段会被删除。
+        """
+        raise NotImplementedError
+
+    def delete_container(self, container_id: str) -> bool:
+        raise NotImplementedError
+
+    def add_website(self, container_id: str, domain: str) -> bool:
+        """绑定域名，已被其他容器占用时抛出 RegistryError"""
+        raise NotImplementedError
+
+    def remove_website(self, container_id: str, domain: str) -> bool:
+        raise NotImplementedError
+
+    def save_snapshot(self, doc: Dict) -> None:
+        """以整个文档覆盖注册表，仅用于兼容旧代码"""
+        raise NotImplementedError
+
+
+def _resolve_updates(info: Dict, updates: Updater) -> Dict:
+    return updates(info) if callable(updates) else updates
+
+
+class JsonRegistry(Registry):
+    """基于 containers.json 状态存储的注册表"""
+
+    def __init__(self, store: Optional[StateStore] = None):
+        self.store = store or get_store()
+
+    def get_container(self, container_id):
+        return self.store.get_container(container_id)
+
+    def owner_of(self, container_id):
+        return self.store.owner_of(container_id)
+
+    def find_by_user(self, user_id):
+        return self.store.find_by_user(user_id)
+
+    def find_by_domain(self, domain):
+        return self.store.find_by_domain(domain)
+
+    def find_by_name(self, name):
+        return self.store.find_by_name(name)
+
+    def list_containers(self):
+        return self.store.snapshot()['containers']
+
+    def count(self):
+        return self.store.count()
+
+    def snapshot(self):
+        return self.store.snapshot()
+
+    def allocate_id(self):
+        with self.store.transaction() as doc:
+            container_id = doc['next_id']
+            doc['next_id'] = container_id + 1
+        return container_id
+
+    def reserve_container(self, user_id, build_info, container_id=None):
+        with self.store.transaction() as doc:
+            if self.store.find_by_user(user_id)[0] is not None:
+                raise RegistryError("用户已经创建了一个实例")
+            if container_id is None:
+                container_id = doc['next_id']
+                doc['next_id'] = container_id + 1
+            elif str(container_id) in doc['containers'] or container_id >= doc['next_id']:
+                raise RegistryError("容器ID无效")
+            info = build_info(container_id)
+            doc['containers'][str(container_id)] = info
+        return str(container_id), info
+
+    def update_container(self, container_id, updates):
+        with self.store.transaction() as doc:
+            info = doc['containers'].get(container_id)
+            if info is None:
+                raise RegistryError("容器不存在")
+            for key, value in _resolve_updates(info, updates).items():
+                if value is None and key not in CONTAINER_COLUMNS:
+                    info.pop(key, None)
+                else:
+                    info[key] = value
+        return info
+
+    def delete_container(self, container_id):
+        with self.store.transaction() as doc:
+            return doc['containers'].pop(container_id, None) is not None
+
+    def add_website(self, container_id, domain):
+        domain = domain.lower()
+        with self.store.transaction() as doc:
+            owner = self.store.find_by_domain(domain)
+            if owner is not None and owner != container_id:
+                raise RegistryError("域名已被其他实例绑定")
+            info = doc['containers'].get(container_id)
+            if info is None:
+                raise RegistryError("容器不存在")
+            websites = info.setdefault('websites', [])
+            if domain in (website.lower() for website in websites):
+                return False
+            websites.append(domain)
+            return True
+
+    def remove_website(self, container_id, domain):
+        with self.store.transaction() as doc:
+            info = doc['containers'].get(container_id)
+            if not info or domain not in info.get('websites', []):
+                return False
+            info['websites'].remove(domain)
+            return True
+
+    def save_snapshot(self, doc):
+        self.store.save(doc)
+
+
+class SqliteRegistry(Registry):
+    """基于 SQLite (WAL 模式) 的注册表
+
+    使用单个连接并以锁串行化访问；写操作使用 BEGIN IMMEDIATE，
+    多进程(如过期清理脚本)同时访问时由 SQLite 负责加锁。
+    """
+
+    def __init__(self, path: str, json_path: Optional[str] = None):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None,
+                                     check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('PRAGMA foreign_keys=ON')
+        self._conn.executescript(SCHEMA)
+        if json_path and os.path.exists(json_path) and self._get_meta('migrated_from') is None:
+            with open(json_path, 'r') as f:
+                self._import(json.load(f), source=json_path)
+
+    # ---- 内部工具 ----
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            else:
+                self._conn.execute('COMMIT')
+
+    def _get_meta(self, key: str, default=None):
+        row = self._conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return json.loads(row['value']) if row else default
+
+    def _set_meta(self, conn, key: str, value) -> None:
+        conn.execute('INSERT INTO meta (key, value) VALUES (?, ?) '
+                     'ON CONFLICT(key) DO UPDATE SET value = excluded.value',
+                     (key, json.dumps(value)))
+
+    def _row_to_info(self, row: sqlite3.Row, websites) -> Dict:
+        info = {column: row[column] for column in CONTAINER_COLUMNS if row[column] is not None}
+        info['websites'] = websites
+        info.update(json.loads(row['extra']))
+        return info
+
+    def _websites(self, container_id: int):
+        rows = self._conn.execute(
+            'SELECT domain FROM websites WHERE container_id = ? ORDER BY rowid',
+            (container_id,)
+        ).fetchall()
+        return [row['domain'] for row in rows]
+
+    def _fetch(self, where: str, params: Tuple) -> Tuple[Optional[str], Optional[Dict]]:
+        with self._lock:
+            row = self._conn.execute(f'SELECT * FROM containers WHERE {where}', params).fetchone()
+            if row is None:
+                return None, None
+            return str(row['id']), self._row_to_info(row, self._websites(row['id']))
+
+    def _write_container(self, conn, container_id: int, info: Dict) -> None:
+        columns = {column: info.get(column) for column in CONTAINER_COLUMNS}
+        extra = {k: v for k, v in info.items()
+                 if k not in CONTAINER_COLUMNS and k != 'websites'}
+        if columns['user_id'] is not None:
+            conn.execute('INSERT OR IGNORE INTO users (user_id, username) VALUES (?, ?)',
+                         (columns['user_id'], columns['username']))
+        conn.execute(
+            f'INSERT INTO containers (id, {", ".join(CONTAINER_COLUMNS)}, extra) '
+            f'VALUES (?, {", ".join("?" * len(CONTAINER_COLUMNS))}, ?) '
+            f'ON CONFLICT(id) DO UPDATE SET '
+            + ', '.join(f'{c} = excluded.{c}' for c in CONTAINER_COLUMNS + ('extra',)),
+            (container_id, *columns.values(), json.dumps(extra))
+        )
+        if 'websites' in info:
+            conn.execute('DELETE FROM websites WHERE container_id = ?', (container_id,))
+            conn.executemany('INSERT INTO websites (domain, container_id) VALUES (?, ?)',
+                             [(domain, container_id) for domain in info['websites']])
+
+    def _import(self, doc: Dict, source: str) -> None:
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM websites')
+            conn.execute('DELETE FROM containers')
+            for cid, info in doc.get('containers', {}).items():
+                self._write_container(conn, int(cid), info)
+            for key, value in doc.items():
+                if key != 'containers':
+                    self._set_meta(conn, key, value)
+            self._set_meta(conn, 'migrated_from', source)
+
+    # ---- 读取 ----
+
+    def get_container(self, container_id):
+        try:
+            return self._fetch('id = ?', (int(container_id),))[1]
+        except (TypeError, ValueError):
+            return None
+
+    def owner_of(self, container_id):
+        try:
+            container_id = int(container_id)
+        except (TypeError, ValueError):
+            return None
+        with self._lock:
+            row = self._conn.execute('SELECT user_id FROM containers WHERE id = ?',
+                                     (container_id,)).fetchone()
+        return row['user_id'] if row else None
+
+    def find_by_user(self, user_id):
+        return self._fetch('user_id = ?', (user_id,))
+
+    def find_by_domain(self, domain):
+        with self._lock:
+            row = self._conn.execute('SELECT container_id FROM websites WHERE domain = ? COLLATE NOCASE',
+                                     (domain,)).fetchone()
+        return str(row['container_id']) if row else None
+
+    def find_by_name(self, name):
+        with self._lock:
+            row = self._conn.execute('SELECT id FROM containers WHERE name = ?', (name,)).fetchone()
+        return str(row['id']) if row else None
+
+    def list_containers(self):
+        with self._lock:
+            websites = {}
+            for row in self._conn.execute('SELECT domain, container_id FROM websites ORDER BY rowid'):
+                websites.setdefault(row['container_id'], []).append(row['domain'])
+            return {
+                str(row['id']): self._row_to_info(row, websites.get(row['id'], []))
+                for row in self._conn.execute('SELECT * FROM containers ORDER BY id')
+            }
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM containers').fetchone()[0]
+
+    def snapshot(self):
+        with self._lock:
+            doc = {
+                row['key']: json.loads(row['value'])
+                for row in self._conn.execute('SELECT key, value FROM meta')
+                if row['key'] != 'migrated_from'
+            }
+            doc.setdefault('next_id', 0)
+            doc['containers'] = self.list_containers()
+            return doc
+
+    # ---- 修改 ----
+
+    def allocate_id(self):
+        with self._transaction() as conn:
+            container_id = self._get_meta('next_id', 0)
+            self._set_meta(conn, 'next_id', container_id + 1)
+        return container_id
+
+    def reserve_container(self, user_id, build_info, container_id=None):
+        with self._transaction() as conn:
+            if conn.execute('SELECT 1 FROM containers WHERE user_id = ?', (user_id,)).fetchone():
+                raise RegistryError("用户已经创建了一个实例")
+            if container_id is None:
+                container_id = self._get_meta('next_id', 0)
+                self._set_meta(conn, 'next_id', container_id + 1)
+            elif container_id >= self._get_meta('next_id', 0) or \
+                    conn.execute('SELECT 1 FROM containers WHERE id = ?', (container_id,)).fetchone():
+                raise RegistryError("容器ID无效")
+            info = build_info(container_id)
+            self._write_container(conn, container_id, info)
+        return str(container_id), info
+
+    def update_container(self, container_id, updates):
+        with self._transaction() as conn:
+            row = conn.execute('SELECT * FROM containers WHERE id = ?', (int(container_id),)).fetchone()
+            if row is None:
+                raise RegistryError("容器不存在")
+            info = self._row_to_info(row, self._websites(row['id']))
+            for key, value in _resolve_updates(info, updates).items():
+                if value is None and key not in CONTAINER_COLUMNS:
+                    info.pop(key, None)
+                else:
+                    info[key] = value
+            self._write_container(conn, row['id'], info)
+        return info
+
+    def delete_container(self, container_id):
+        with self._transaction() as conn:
+            cursor = conn.execute('DELETE FROM containers WHERE id = ?', (int(container_id),))
+            return cursor.rowcount > 0
+
+    def add_website(self, container_id, domain):
+        # 域名不区分大小写，旧库的表没有 NOCASE 排序规则，查询时显式指定
+        domain = domain.lower()
+        with self._transaction() as conn:
+            row = conn.execute('SELECT container_id FROM websites WHERE domain = ? COLLATE NOCASE',
+                               (domain,)).fetchone()
+            if row is not None:
+                if str(row['container_id']) != str(container_id):
+                    raise RegistryError("域名已被其他实例绑定")
+                return False
+            if not conn.execute('SELECT 1 FROM containers WHERE id = ?', (int(container_id),)).fetchone():
+                raise RegistryError("容器不存在")
+            conn.execute('INSERT INTO websites (domain, container_id) VALUES (?, ?)',
+                         (domain, int(container_id)))
+            return True
+
+    def remove_website(self, container_id, domain):
+        with self._transaction() as conn:
+            cursor = conn.execute('DELETE FROM websites WHERE domain = ? AND container_id = ?',
+                                  (domain, int(container_id)))
+            return cursor.rowcount > 0
+
+    def save_snapshot(self, doc):
+        with self._transaction() as conn:
+            keep = [int(cid) for cid in doc.get('containers', {})]
+            conn.execute(f'DELETE FROM containers WHERE id NOT IN ({", ".join("?" * len(keep))})', keep)
+            for cid, info in doc.get('containers', {}).items():
+                self._write_container(conn, int(cid), info)
+            for key, value in doc.items():
+                if key != 'containers':
+                    self._set_meta(conn, key, value)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> Registry:
+    """根据配置获取全局注册表"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                from config import REGISTRY_BACKEND, REGISTRY_DB
+                if REGISTRY_BACKEND == 'sqlite':
+                    _registry = SqliteRegistry(REGISTRY_DB, json_path='containers.json')
+                else:
+                    _registry = JsonRegistry()
+    return _registry
+
+
+def migrate(json_path: str, db_path: str) -> int:
+    """将 containers.json 一次性导入 SQLite 注册表，返回导入的容器数量"""
+    with open(json_path, 'r') as f:
+        doc = json.load(f)
+    registry = SqliteRegistry(db_path)
+    registry._import(doc, source=json_path)
+    return registry.count()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='DotMachine 容器注册表工具')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    migrate_parser = subparsers.add_parser('migrate', help='从 containers.json 迁移到 SQLite')
+    migrate_parser.add_argument('--json', default='containers.json', help='JSON 配置文件路径')
+    migrate_parser.add_argument('--db', default='containers.db', help='SQLite 数据库路径')
+    args = parser.parse_args()
+
+    if args.command == 'migrate':
+        total = migrate(args.json, args.db)
+        print(f"已迁移 {total} 个容器到 {args.db}")
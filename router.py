@@ -0,0 +1,768 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import json
+import time
+import urllib.parse
+import urllib.request
+from typing import Callable, Dict, List, Optional, Tuple
+from edgecache import CacheEntry, EdgeCache
+from utils import merge_routes
+
+# 不转发给上游或客户端的逐跳头部
+HOP_HEADERS = {
+    'connection', 'keep-alive', 'proxy-connection', 'te', 'trailer', 'upgrade'
+}
+
+# 请求或响应头的最大长度
+MAX_HEAD_SIZE = 64 * 1024
+
+# 转发正文时每次读取的字节数
+RELAY_BLOCK = 64 * 1024
+
+
+class UpstreamError(Exception):
+    """连接上游或读取上游响应失败"""
+    pass
+
+
+class Request:
+    """解析后的请求头"""
+
+    def __init__(self, method: str, target: str, version: str, headers: List[Tuple[str, str]]):
+        self.method = method
+        self.target = target
+        self.version = version
+        self.headers = headers
+
+    def get(self, name: str, default: str = '') -> str:
+        name = name.lower()
+        for key, value in self.headers:
+            if key.lower() == name:
+                return value
+        return default
+
+    @property
+    def host(self) -> str:
+        """Host 头中的域名部分，小写"""
+        host = self.get('host').strip().lower()
+        if host.startswith('['):
+            return host.split(']', 1)[0] + ']'
+        return host.rsplit(':', 1)[0] if ':' in host else host
+
+    @property
+    def keep_alive(self) -> bool:
+        tokens = _tokens(self.get('connection'))
+        if self.version == 'HTTP/1.0':
+            return 'keep-alive' in tokens
+        return 'close' not in tokens
+
+    @property
+    def upgrade(self) -> bool:
+        return 'upgrade' in _tokens(self.get('connection')) and bool(self.get('upgrade'))
+
+
+class Response:
+    """解析后的上游响应头"""
+
+    def __init__(self, version: str, status: int, reason: str, headers: List[Tuple[str, str]]):
+        self.version = version
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+
+    def get(self, name: str, default: str = '') -> str:
+        name = name.lower()
+        for key, value in self.headers:
+            if key.lower() == name:
+                return value
+        return default
+
+
+def _tokens(value: str) -> List[str]:
+    return [token.strip().lower() for token in value.split(',') if token.strip()]
+
+
+def _parse_headers(lines: List[bytes]) -> List[Tuple[str, str]]:
+    headers = []
+    for line in lines:
+        if not line:
+            continue
+        name, sep, value = line.decode('latin-1').partition(':')
+        if not sep or not name or name != name.strip():
+            raise ValueError("无效的头部")
+        headers.append((name, value.strip()))
+    return headers
+
+
+def parse_request(head: bytes) -> Request:
+    lines = head.rstrip(b'\r\n').split(b'\r\n')
+    parts = lines[0].decode('latin-1').split(' ')
+    if len(parts) != 3 or not parts[2].startswith('HTTP/1.'):
+        raise ValueError("无效的请求行")
+    return Request(parts[0], parts[1], parts[2], _parse_headers(lines[1:]))
+
+
+def parse_response(head: bytes) -> Response:
+    lines = head.rstrip(b'\r\n').split(b'\r\n')
+    parts = lines[0].decode('latin-1').split(' ', 2)
+    if len(parts) < 2 or not parts[0].startswith('HTTP/1.') or not parts[1].isdigit():
+        raise ValueError("无效的状态行")
+    return Response(parts[0], int(parts[1]), parts[2] if len(parts) > 2 else '', _parse_headers(lines[1:]))
+
+
+def render_head(first_line: str, headers: List[Tuple[str, str]]) -> bytes:
+    lines = [first_line] + [f'{name}: {value}' for name, value in headers]
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+
+def simple_response(status: int, reason: str, body: bytes = b'', keep_alive: bool = True,
+                    headers: Optional[List[Tuple[str, str]]] = None) -> bytes:
+    """生成路由自身返回的响应"""
+    all_headers = [('Content-Length', str(len(body))),
+                   ('Connection', 'keep-alive' if keep_alive else 'close')]
+    if body:
+        all_headers.insert(0, ('Content-Type', 'text/plain; charset=utf-8'))
+    all_headers.extend(headers or [])
+    return render_head(f'HTTP/1.1 {status} {reason}', all_headers) + body
+
+
+async def read_head(reader: asyncio.StreamReader) -> Optional[bytes]:
+    """读取到空行为止的头部，连接在头部开始前关闭时返回 None"""
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.IncompleteReadError as e:
+        if not e.partial.strip():
+            return None
+        raise ValueError("头部不完整")
+    except asyncio.LimitOverrunError:
+        raise ValueError("头部过长")
+    # 兼容请求之间多余的空行
+    return head.lstrip(b'\r\n')
+
+
+def body_length(headers, method: str = '', status: int = 0) -> Optional[int]:
+    """正文长度：-1 表示分块传输，None 表示读到连接关闭为止"""
+    if method == 'HEAD' or 100 <= status < 200 or status in (204, 304):
+        return 0
+    if 'chunked' in _tokens(headers.get('transfer-encoding')):
+        return -1
+    length = headers.get('content-length')
+    if length:
+        if not length.isdigit():
+            raise ValueError("无效的 Content-Length")
+        return int(length)
+    return 0 if not status else None
+
+
+def check_framing(request: Request) -> None:
+    """拒绝前后端可能解析出不同正文边界的请求(请求走私)
+
+    同时带 Transfer-Encoding 和 Content-Length、最后的传输编码不是唯一的 chunked、
+    或有多个不同的 Content-Length 时抛出 ValueError。
+    """
+    codings = []
+    lengths = set()
+    for name, value in request.headers:
+        lower = name.lower()
+        if lower == 'transfer-encoding':
+            codings.extend(_tokens(value))
+        elif lower == 'content-length':
+            lengths.add(value.strip())
+    if codings and (lengths or codings[-1] != 'chunked' or codings.count('chunked') != 1):
+        raise ValueError("无效的 Transfer-Encoding")
+    if len(lengths) > 1:
+        raise ValueError("无效的 Content-Length")
+
+
+async def relay_body(reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                     length: Optional[int]) -> None:
+    """按 body_length 的结果原样转发正文"""
+    if length == -1:
+        while True:
+            line = await reader.readline()
+            if not line.endswith(b'\n'):
+                raise asyncio.IncompleteReadError(line, None)
+            writer.write(line)
+            size = int(line.split(b';', 1)[0].strip() or b'0', 16)
+            if size == 0:
+                # 尾部头部，以空行结束
+                while True:
+                    line = await reader.readline()
+                    if not line.endswith(b'\n'):
+                        raise asyncio.IncompleteReadError(line, None)
+                    writer.write(line)
+                    if line in (b'\r\n', b'\n'):
+                        break
+                break
+            while size:
+                block = await reader.readexactly(min(size, RELAY_BLOCK))
+                size -= len(block)
+                writer.write(block)
+                await writer.drain()
+            writer.write(await reader.readexactly(2))
+    elif length is None:
+        while True:
+            block = await reader.read(RELAY_BLOCK)
+            if not block:
+                break
+            writer.write(block)
+            await writer.drain()
+    else:
+        while length:
+            block = await reader.readexactly(min(length, RELAY_BLOCK))
+            length -= len(block)
+            writer.write(block)
+            await writer.drain()
+    await writer.drain()
+
+
+async def pipe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """单向转发直到对端关闭"""
+    try:
+        while True:
+            block = await reader.read(RELAY_BLOCK)
+            if not block:
+                break
+            writer.write(block)
+            await writer.drain()
+    except (ConnectionError, OSError):
+        pass
+    finally:
+        if not writer.is_closing():
+            try:
+                writer.write_eof()
+            except (OSError, RuntimeError):
+                writer.close()
+
+
+class _Discard:
+    """丢弃写入的数据，用于后台更新缓存"""
+
+    def write(self, data: bytes) -> None:
+        pass
+
+    async def drain(self) -> None:
+        pass
+
+
+class _Tee:
+    """写给客户端的同时保存一份正文，超过上限后不再保存"""
+
+    def __init__(self, writer, limit: int):
+        self.writer = writer
+        self.limit = limit
+        self.parts: List[bytes] = []
+        self.size = 0
+        self.overflow = False
+
+    def write(self, data: bytes) -> None:
+        self.writer.write(data)
+        if self.overflow:
+            return
+        self.size += len(data)
+        if self.size > self.limit:
+            self.overflow = True
+            self.parts = []
+        else:
+            self.parts.append(data)
+
+    async def drain(self) -> None:
+        await self.writer.drain()
+
+
+class DomainStats:
+    """单个域名的请求计数和耗时"""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.status: Dict[str, int] = {}
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.last_request = 0.0
+
+    def record(self, status: int, elapsed: float) -> None:
+        self.requests += 1
+        if status >= 500 or status == 0:
+            self.errors += 1
+        key = f'{status // 100}xx' if status else 'failed'
+        self.status[key] = self.status.get(key, 0) + 1
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+        self.last_request = time.time()
+
+    def to_dict(self) -> Dict:
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'status': dict(self.status),
+            'avg_ms': round(self.total_time / self.requests * 1000, 2) if self.requests else 0,
+            'max_ms': round(self.max_time * 1000, 2),
+            'last_request': self.last_request
+        }
+
+
+class UpstreamPool:
+    """按上游端口复用的空闲长连接"""
+
+    def __init__(self, host: str, max_idle: int, idle_timeout: float, connect_timeout: float):
+        self.host = host
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+        self._idle: Dict[int, List[Tuple[asyncio.StreamReader, asyncio.StreamWriter, float]]] = {}
+
+    async def acquire(self, port: int, fresh: bool = False) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter, bool]:
+        """返回 (reader, writer, 是否为复用的连接)"""
+        idle = self._idle.get(port)
+        now = time.monotonic()
+        while idle and not fresh:
+            reader, writer, since = idle.pop()
+            if writer.is_closing() or reader.at_eof() or now - since > self.idle_timeout:
+                writer.close()
+                continue
+            return reader, writer, True
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, port, limit=MAX_HEAD_SIZE), self.connect_timeout)
+        except (OSError, asyncio.TimeoutError) as e:
+            raise UpstreamError(f"无法连接上游 {self.host}:{port}: {str(e) or type(e).__name__}")
+        return reader, writer, False
+
+    def release(self, port: int, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        idle = self._idle.setdefault(port, [])
+        if len(idle) >= self.max_idle or writer.is_closing():
+            writer.close()
+            return
+        idle.append((reader, writer, time.monotonic()))
+
+    def prune(self) -> None:
+        """关闭超时的空闲连接"""
+        now = time.monotonic()
+        for port in list(self._idle):
+            keep = []
+            for reader, writer, since in self._idle[port]:
+                if writer.is_closing() or reader.at_eof() or now - since > self.idle_timeout:
+                    writer.close()
+                else:
+                    keep.append((reader, writer, since))
+            if keep:
+                self._idle[port] = keep
+            else:
+                del self._idle[port]
+
+    def stats(self) -> Dict[int, int]:
+        return {port: len(idle) for port, idle in self._idle.items()}
+
+
+class FrontRouter:
+    """基于 asyncio 的前端 HTTP 路由
+
+    按 Host 头在内存中的域名表里查找容器 HTTP 端口并转发，上游连接按端口复用。
+    域名表定期从注册表重新加载并整体替换，增删域名不需要重载任何进程；
+    管理端口提供每个域名的请求数、状态码分布和耗时统计。
+    配置了 cache 时，可缓存的 GET 响应由路由直接返回，同一地址同时只向上游请求一次。
+    """
+
+    def __init__(self, registry, pool: UpstreamPool, refresh_interval: float = 2,
+                 client_timeout: float = 60, upstream_timeout: float = 60,
+                 cache: Optional[EdgeCache] = None):
+        self.registry = registry
+        self.pool = pool
+        self.cache = cache
+        self._inflight: Dict[Tuple, asyncio.Future] = {}
+        self._background = set()
+        self.refresh_interval = refresh_interval
+        self.client_timeout = client_timeout
+        self.upstream_timeout = upstream_timeout
+        self.routes: Dict[str, int] = {}
+        self.stats: Dict[str, DomainStats] = {}
+        self.unrouted = 0
+        self.conflicts: List[str] = []
+        self._refresh_now: Optional[asyncio.Event] = None
+
+    # ---- 路由表 ----
+
+    def _load_routes(self) -> Dict[str, int]:
+        """域名按小写合并，不同实例以不同大小写登记的同一域名不路由，避免一方接管另一方的流量"""
+        routes, conflicts = merge_routes([(domain, info['http_port'])
+                                          for info in self.registry.list_containers().values()
+                                          for domain in info.get('websites', [])])
+        if conflicts != self.conflicts:
+            self.conflicts = conflicts
+            if conflicts:
+                print(f"以下域名被多个实例以不同大小写登记，已停止路由: {', '.join(conflicts)}")
+        return routes
+
+    def set_routes(self, routes: Dict[str, int]) -> None:
+        """整体替换域名表，已删除域名的统计随之清除"""
+        self.routes = routes
+        for domain in [domain for domain in self.stats if domain not in routes]:
+            del self.stats[domain]
+        if self.cache is not None:
+            self.cache.forget(routes)
+
+    async def refresh(self) -> None:
+        loop = asyncio.get_running_loop()
+        self.set_routes(await loop.run_in_executor(None, self._load_routes))
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"加载路由失败: {str(e)}")
+            self.pool.prune()
+            try:
+                await asyncio.wait_for(self._refresh_now.wait(), self.refresh_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._refresh_now.clear()
+
+    def record(self, domain: str, status: int, started: float) -> None:
+        stats = self.stats.get(domain)
+        if stats is None:
+            stats = self.stats[domain] = DomainStats()
+        stats.record(status, time.monotonic() - started)
+
+    # ---- 转发 ----
+
+    def upstream_head(self, request: Request, peer: str) -> bytes:
+        """生成发往上游的请求头：去掉逐跳头部，补充转发信息，要求保持连接"""
+        headers = []
+        forwarded_for = ''
+        for name, value in request.headers:
+            lower = name.lower()
+            if lower in HOP_HEADERS or lower in ('x-real-ip', 'expect'):
+                continue
+            if lower == 'x-forwarded-for':
+                forwarded_for = value
+                continue
+            headers.append((name, value))
+        headers.append(('X-Real-IP', peer))
+        headers.append(('X-Forwarded-For', f'{forwarded_for}, {peer}' if forwarded_for else peer))
+        headers.append(('X-Forwarded-Proto', 'http'))
+        if request.upgrade:
+            headers.append(('Connection', 'upgrade'))
+            headers.append(('Upgrade', request.get('upgrade')))
+        else:
+            headers.append(('Connection', 'keep-alive'))
+        return render_head(f'{request.method} {request.target} HTTP/1.1', headers)
+
+    async def _read_response(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                             client: asyncio.StreamWriter) -> Tuple[Response, bytes]:
+        """读取上游响应头，中间的 1xx 响应直接转给客户端"""
+        while True:
+            head = await asyncio.wait_for(read_head(reader), self.upstream_timeout)
+            if head is None:
+                raise asyncio.IncompleteReadError(b'', None)
+            response = parse_response(head)
+            if 100 <= response.status < 200 and response.status != 101:
+                client.write(head)
+                continue
+            return response, head
+
+    async def _exchange(self, port: int, request: Request, body_len: Optional[int], peer: str,
+                        reader: asyncio.StreamReader, client: asyncio.StreamWriter):
+        """发送请求并读取响应头，复用的连接已被上游关闭时(无正文的请求)换新连接重试一次"""
+        head = self.upstream_head(request, peer)
+        fresh = bool(request.upgrade)
+        while True:
+            up_reader, up_writer, reused = await self.pool.acquire(port, fresh=fresh)
+            try:
+                up_writer.write(head)
+                if body_len:
+                    await relay_body(reader, up_writer, body_len)
+                else:
+                    await up_writer.drain()
+                response, response_head = await self._read_response(up_reader, up_writer, client)
+                return up_reader, up_writer, response, response_head
+            except (asyncio.IncompleteReadError, ConnectionError) as e:
+                up_writer.close()
+                if reused and not body_len:
+                    fresh = True
+                    continue
+                raise UpstreamError(f"上游连接中断: {str(e) or type(e).__name__}")
+            except BaseException:
+                up_writer.close()
+                raise
+
+    async def proxy(self, request: Request, port: int, reader: asyncio.StreamReader,
+                    writer: asyncio.StreamWriter, peer: str,
+                    store: Optional[Callable[[CacheEntry], None]] = None) -> Tuple[int, bool]:
+        """转发一个请求，返回 (状态码, 客户端连接能否继续使用)
+
+        给出 store 且响应可以缓存时，转发的同时保存正文，完整读取后以 CacheEntry 交给 store。
+        """
+        body_len = body_length(request)
+        if body_len and '100-continue' in request.get('expect').lower():
+            writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+            await writer.drain()
+        up_reader, up_writer, response, response_head = await self._exchange(
+            port, request, body_len, peer, reader, writer)
+
+        if response.status == 101:
+            writer.write(response_head)
+            await writer.drain()
+            await asyncio.gather(pipe(reader, up_writer), pipe(up_reader, writer))
+            up_writer.close()
+            return 101, False
+
+        try:
+            length = body_length(response, request.method, response.status)
+        except ValueError:
+            up_writer.close()
+            raise UpstreamError("上游响应无效")
+        upstream_reusable = (length is not None and response.version == 'HTTP/1.1'
+                             and 'close' not in _tokens(response.get('connection')))
+        keep_alive = request.keep_alive and length is not None
+        headers = [(name, value) for name, value in response.headers if name.lower() not in HOP_HEADERS]
+        writer.write(render_head(f'HTTP/1.1 {response.status} {response.reason}',
+                                 headers + [('Connection', 'keep-alive' if keep_alive else 'close')]))
+        policy = self.cache.policy(response, request.get('accept-encoding')) if store is not None else None
+        body_writer = _Tee(writer, self.cache.max_object) if policy else writer
+        try:
+            await relay_body(up_reader, body_writer, length)
+        except BaseException:
+            up_writer.close()
+            raise
+        if upstream_reusable:
+            self.pool.release(port, up_reader, up_writer)
+        else:
+            up_writer.close()
+        if policy and not body_writer.overflow:
+            store(CacheEntry(request.host, response.status, response.reason, headers,
+                             b''.join(body_writer.parts), *policy))
+        return response.status, keep_alive
+
+    # ---- 缓存 ----
+
+    @staticmethod
+    def _serve(entry: CacheEntry, request: Request, writer: asyncio.StreamWriter, result: str) -> Tuple[int, bool]:
+        """用缓存项响应客户端"""
+        headers = list(entry.headers)
+        names = {name.lower() for name, _ in headers}
+        if 'content-length' not in names and 'transfer-encoding' not in names:
+            headers.append(('Content-Length', str(len(entry.body))))
+        headers.append(('Age', str(entry.age())))
+        headers.append(('X-Cache', result))
+        headers.append(('Connection', 'keep-alive' if request.keep_alive else 'close'))
+        writer.write(render_head(f'HTTP/1.1 {entry.status} {entry.reason}', headers) + entry.body)
+        return entry.status, request.keep_alive
+
+    async def _fetch(self, key: Tuple, request: Request, port: int, reader, writer, peer: str) -> Tuple[int, bool]:
+        """向上游请求并尝试缓存；等待同一地址的其他请求在完成后直接使用结果
+
+        发往上游的 Accept-Encoding 改写为缓存键中的压缩方式，使缓存的正文对同一键的所有客户端都可用。
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        stored: List[CacheEntry] = []
+        headers = [(name, value) for name, value in request.headers if name.lower() != 'accept-encoding']
+        if key[2]:
+            headers.append(('Accept-Encoding', key[2]))
+        upstream = Request(request.method, request.target, request.version, headers)
+        try:
+            return await self.proxy(upstream, port, reader, writer, peer, store=stored.append)
+        finally:
+            if stored:
+                self.cache.put(key, stored[0])
+            del self._inflight[key]
+            future.set_result(stored[0] if stored else None)
+
+    def _revalidate(self, key: Tuple, request: Request, port: int, peer: str) -> None:
+        """在后台更新已过期的缓存项"""
+        if key in self._inflight:
+            return
+        headers = [(name, value) for name, value in request.headers
+                   if name.lower() not in ('if-none-match', 'if-modified-since', 'connection')]
+        refresh = Request('GET', request.target, 'HTTP/1.1', headers)
+
+        async def run():
+            try:
+                await self._fetch(key, refresh, port, None, _Discard(), peer)
+            except Exception as e:
+                print(f"后台更新缓存失败 {request.host}{request.target}: {str(e) or type(e).__name__}")
+
+        task = asyncio.create_task(run())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def cached(self, request: Request, domain: str, port: int, reader: asyncio.StreamReader,
+                     writer: asyncio.StreamWriter, peer: str) -> Tuple[int, bool]:
+        """先查缓存再转发：新鲜的直接返回，过期但允许的先返回旧内容再后台更新，
+        其他请求正在获取同一地址时等待其结果"""
+        key = self.cache.key(domain, request)
+        if key is None or body_length(request) or request.upgrade:
+            return await self.proxy(request, port, reader, writer, peer)
+        if not self.cache.bypass(request):
+            entry, stale = self.cache.get(key)
+            if entry is not None:
+                self.cache.record(domain, 'stale' if stale else 'hit')
+                if stale:
+                    self._revalidate(key, request, port, peer)
+                return self._serve(entry, request, writer, 'STALE' if stale else 'HIT')
+            pending = self._inflight.get(key)
+            if pending is not None:
+                entry = await asyncio.shield(pending)
+                if entry is not None:
+                    self.cache.record(domain, 'hit')
+                    return self._serve(entry, request, writer, 'HIT')
+        self.cache.record(domain, 'miss')
+        if key in self._inflight:
+            return await self.proxy(request, port, reader, writer, peer)
+        return await self._fetch(key, request, port, reader, writer, peer)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """处理一个客户端连接上的所有请求"""
+        peer = (writer.get_extra_info('peername') or ('',))[0]
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(read_head(reader), self.client_timeout)
+                except asyncio.TimeoutError:
+                    break
+                except ValueError:
+                    writer.write(simple_response(400, 'Bad Request', keep_alive=False))
+                    break
+                if head is None:
+                    break
+                started = time.monotonic()
+                try:
+                    request = parse_request(head)
+                    check_framing(request)
+                    body_length(request)
+                except ValueError:
+                    writer.write(simple_response(400, 'Bad Request', keep_alive=False))
+                    break
+
+                domain = request.host
+                port = self.routes.get(domain)
+                if port is None:
+                    self.unrouted += 1
+                    writer.write(simple_response(404, 'Not Found', b'Not Found\n', keep_alive=False))
+                    break
+
+                try:
+                    if self.cache is not None:
+                        status, keep_alive = await self.cached(request, domain, port, reader, writer, peer)
+                    else:
+                        status, keep_alive = await self.proxy(request, port, reader, writer, peer)
+                except UpstreamError:
+                    self.record(domain, 502, started)
+                    writer.write(simple_response(502, 'Bad Gateway', b'Bad Gateway\n', keep_alive=False))
+                    break
+                except asyncio.TimeoutError:
+                    self.record(domain, 504, started)
+                    writer.write(simple_response(504, 'Gateway Timeout', b'Gateway Timeout\n', keep_alive=False))
+                    break
+                self.record(domain, status, started)
+                await writer.drain()
+                if not keep_alive:
+                    break
+            await writer.drain()
+        except (ValueError, ConnectionError, asyncio.IncompleteReadError, OSError):
+            pass
+        finally:
+            writer.close()
+
+    # ---- 管理接口 ----
+
+    def snapshot(self) -> Dict:
+        return {
+            'routes': len(self.routes),
+            'unrouted': self.unrouted,
+            'upstream_idle': self.pool.stats(),
+            'domains': {domain: stats.to_dict() for domain, stats in self.stats.items()},
+            'cache': self.cache.snapshot() if self.cache is not None else None
+        }
+
+    async def handle_admin(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """管理接口：GET /stats、GET /routes、POST /refresh(立即重新加载路由)、
+        POST /purge?domain=...&prefix=...(清除缓存)"""
+        try:
+            head = await asyncio.wait_for(read_head(reader), self.client_timeout)
+            if head is None:
+                return
+            request = parse_request(head)
+            path, _, query = request.target.partition('?')
+            params = urllib.parse.parse_qs(query)
+            if request.method == 'GET' and path == '/stats':
+                body = self.snapshot()
+            elif request.method == 'GET' and path == '/routes':
+                body = self.routes
+            elif request.method == 'POST' and path == '/refresh':
+                self._refresh_now.set()
+                body = {'success': True}
+            elif request.method == 'POST' and path == '/purge':
+                domain = params.get('domain', [''])[0].lower()
+                prefix = params.get('prefix', [''])[0]
+                purged = self.cache.purge(domain, prefix) if self.cache is not None and domain else 0
+                body = {'success': True, 'purged': purged}
+            else:
+                writer.write(simple_response(404, 'Not Found', keep_alive=False))
+                return
+            data = json.dumps(body, ensure_ascii=False).encode()
+            writer.write(render_head('HTTP/1.1 200 OK', [
+                ('Content-Type', 'application/json'),
+                ('Content-Length', str(len(data))),
+                ('Connection', 'close')
+            ]) + data)
+            await writer.drain()
+        except (ValueError, ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError, OSError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str, port: int, admin_host: str, admin_port: int) -> None:
+        self._refresh_now = asyncio.Event()
+        await self.refresh()
+        server = await asyncio.start_server(self.handle, host, port, limit=MAX_HEAD_SIZE)
+        admin = await asyncio.start_server(self.handle_admin, admin_host, admin_port, limit=MAX_HEAD_SIZE)
+        print(f"前端路由监听 {host}:{port}，管理接口 {admin_host}:{admin_port}，已加载 {len(self.routes)} 个域名")
+        refresher = asyncio.create_task(self._refresh_loop())
+        try:
+            async with server, admin:
+                await asyncio.gather(server.serve_forever(), admin.serve_forever())
+        finally:
+            refresher.cancel()
+
+
+def create_router() -> FrontRouter:
+    """按配置创建前端路由"""
+    from config import (ROUTER_UPSTREAM_HOST, ROUTER_UPSTREAM_MAX_IDLE, ROUTER_UPSTREAM_IDLE_TIMEOUT,
+                        ROUTER_CONNECT_TIMEOUT, ROUTER_REFRESH_INTERVAL, ROUTER_CLIENT_TIMEOUT,
+                        ROUTER_UPSTREAM_TIMEOUT, ROUTER_CACHE_SIZE, ROUTER_CACHE_DOMAIN_SIZE,
+                        ROUTER_CACHE_MAX_OBJECT)
+    from registry import get_registry
+    pool = UpstreamPool(ROUTER_UPSTREAM_HOST, ROUTER_UPSTREAM_MAX_IDLE, ROUTER_UPSTREAM_IDLE_TIMEOUT,
+                        ROUTER_CONNECT_TIMEOUT)
+    cache = EdgeCache(ROUTER_CACHE_SIZE, ROUTER_CACHE_DOMAIN_SIZE, ROUTER_CACHE_MAX_OBJECT) \
+        if ROUTER_CACHE_SIZE else None
+    return FrontRouter(get_registry(), pool, ROUTER_REFRESH_INTERVAL, ROUTER_CLIENT_TIMEOUT,
+                       ROUTER_UPSTREAM_TIMEOUT, cache)
+
+
+def admin_request(method: str, path: str, timeout: float = 5) -> Dict:
+    """调用本机前端路由的管理接口，路由未运行时抛出 OSError"""
+    from config import ROUTER_ADMIN_HOST, ROUTER_ADMIN_PORT
+    host = '127.0.0.1' if ROUTER_ADMIN_HOST in ('0.0.0.0', '') else ROUTER_ADMIN_HOST
+    req = urllib.request.Request(f'http://{host}:{ROUTER_ADMIN_PORT}{path}', method=method)
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        return json.loads(resp.read())
+
+
+if __name__ == '__main__':
+    from config import ROUTER_HOST, ROUTER_PORT, ROUTER_ADMIN_HOST, ROUTER_ADMIN_PORT
+    parser = argparse.ArgumentParser(description='DotMachine 前端 HTTP 路由')
+    parser.add_argument('--host', default=ROUTER_HOST, help='监听地址')
+    parser.add_argument('--port', type=int, default=ROUTER_PORT, help='监听端口')
+    parser.add_argument('--admin-host', default=ROUTER_ADMIN_HOST, help='管理接口监听地址')
+    parser.add_argument('--admin-port', type=int, default=ROUTER_ADMIN_PORT, help='管理接口端口')
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(create_router().serve(args.host, args.port, args.admin_host, args.admin_port))
+    except KeyboardInterrupt:
+        pass
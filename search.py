@@ -0,0 +1,173 @@
+import fnmatch
+import json
+import os
+import re
+import select
+import stat
+import subprocess
+import sys
+import time
+from typing import Dict, Iterator, List, Tuple
+from hostfs import is_binary
+from regexscan import scan_lines
+
+
+class SearchError(ValueError):
+    """搜索条件无效"""
+    pass
+
+
+class SearchTimeout(Exception):
+    """搜索超过时间上限"""
+    pass
+
+
+class RegexProcess:
+    """在子进程中执行正则匹配，等待结果超过截止时间时终止子进程"""
+
+    SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'regexscan.py')
+
+    def __init__(self, pattern: str, flags: int):
+        self.process = subprocess.Popen([sys.executable, self.SCRIPT], stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        self.process.stdin.write(json.dumps({'pattern': pattern, 'flags': flags}).encode() + b'\n')
+
+    def scan(self, data: bytes, line: int, limit: int, deadline: float) -> Tuple[int, List[Dict]]:
+        """返回 (下一块的起始行号, 匹配行)，超过 deadline 时抛出 SearchTimeout"""
+        try:
+            self.process.stdin.write(f'{len(data)} {line} {limit}\n'.encode() + data)
+            self.process.stdin.flush()
+        except BrokenPipeError:
+            raise SearchError("正则匹配进程异常退出")
+        ready, _, _ = select.select([self.process.stdout], [], [], max(deadline - time.monotonic(), 0))
+        if not ready:
+            raise SearchTimeout()
+        response = self.process.stdout.readline()
+        if not response:
+            raise SearchError("正则匹配进程异常退出")
+        result = json.loads(response)
+        return result['line'], result['matches']
+
+    def close(self) -> None:
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+        self.process.stdin.close()
+        self.process.stdout.close()
+
+
+class FileSearch:
+    """在主机侧遍历数据目录，按文件名通配符和内容(子串或正则)查找
+
+    结果以生成器逐条返回，最后一条为汇总信息；超过时间或结果数上限时提前结束。
+    内容按块扫描，不会把整个文件读入内存，二进制文件和超过 max_file_size 的文件不搜索内容。
+    正则表达式在 RegexProcess 子进程中匹配，回溯失控时随时间上限一起终止。
+    """
+
+    # 每个文件最多返回的匹配行数
+    MAX_LINE_MATCHES = 5
+
+    def __init__(self, name: str = '', content: str = '', regex: bool = False, ignore_case: bool = True,
+                 max_results: int = 500, time_limit: float = 10, max_file_size: int = 10 * 1024 * 1024):
+        if not name and not content:
+            raise SearchError("请提供文件名或内容")
+        flags = re.IGNORECASE if ignore_case else 0
+        self.name = re.compile(fnmatch.translate(name), flags) if name else None
+        try:
+            self.content = re.compile(content.encode() if regex else re.escape(content.encode()),
+                                      flags | re.MULTILINE) if content else None
+        except re.error as e:
+            raise SearchError(f"正则表达式无效: {str(e)}")
+        self.regex = regex and bool(content)
+        self.max_results = max_results
+        self.time_limit = time_limit
+        self.max_file_size = max_file_size
+        self._worker = None
+        self._deadline = 0.0
+
+    def _match_lines(self, chunks: Iterator[bytes]) -> list:
+        """按块扫描文件内容，返回 [{'line', 'text'}]；跨块的行由上一块的残余拼接"""
+        matches = []
+        carry = b''
+        line = 1
+        first = True
+        for block in chunks:
+            if first:
+                if is_binary(block):
+                    return []
+                first = False
+            data = carry + block
+            cut = data.rfind(b'\n') + 1
+            if not cut:
+                carry = data
+                continue
+            carry = data[cut:]
+            line = self._scan(data[:cut], line, matches)
+            if len(matches) >= self.MAX_LINE_MATCHES:
+                return matches
+        if carry:
+            self._scan(carry, line, matches)
+        return matches
+
+    def _scan(self, data: bytes, line: int, matches: list) -> int:
+        limit = self.MAX_LINE_MATCHES - len(matches)
+        if self._worker is None:
+            return scan_lines(self.content, data, line, matches, limit)
+        line, found = self._worker.scan(data, line, limit, self._deadline)
+        matches.extend(found)
+        return line
+
+    def run(self, walker, root: str) -> Iterator[Dict]:
+        """遍历 walker(DataDir.walk 的结果)，root 为结果路径的前缀"""
+        deadline = self._deadline = time.monotonic() + self.time_limit
+        if self.regex:
+            self._worker = RegexProcess(self.content.pattern.decode(), self.content.flags)
+        try:
+            yield from self._run(walker, root, deadline)
+        finally:
+            if self._worker is not None:
+                self._worker.close()
+                self._worker = None
+
+    def _run(self, walker, root: str, deadline: float) -> Iterator[Dict]:
+        results = scanned = 0
+        reason = None
+        for path, st, reader in walker:
+            scanned += 1
+            # 让出执行权，长时间搜索不阻塞同一进程中的其他请求
+            if scanned % 200 == 0:
+                time.sleep(0)
+            if time.monotonic() > deadline:
+                reason = 'time'
+                break
+            name = path.rsplit('/', 1)[-1]
+            if self.name is not None and not self.name.match(name):
+                continue
+            item = {
+                'path': f"{root.rstrip('/')}/{path}",
+                'type': 'd' if stat.S_ISDIR(st.st_mode) else 'l' if stat.S_ISLNK(st.st_mode) else 'f',
+                'size': st.st_size,
+                'mtime': st.st_mtime
+            }
+            if self.content is not None:
+                if reader is None or st.st_size > self.max_file_size:
+                    continue
+                chunks = reader()
+                try:
+                    item['matches'] = self._match_lines(chunks)
+                except SearchTimeout:
+                    reason = 'time'
+                    break
+                except OSError:
+                    continue
+                finally:
+                    chunks.close()
+                if not item['matches']:
+                    continue
+            yield item
+            results += 1
+            if results >= self.max_results:
+                reason = 'results'
+                break
+        yield {'done': True, 'results': results, 'scanned': scanned, 'truncated': reason}
+
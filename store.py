@@ -0,0 +1,275 @@
+import copy
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+CONFIG_FILE = 'containers.json'
+
+# 日志条目超过该数量后合并回主文件
+COMPACT_THRESHOLD = 64
+# 两次检查文件是否被外部修改的最小间隔(秒)
+RELOAD_CHECK_INTERVAL = 1.0
+
+
+def _empty_document() -> Dict:
+    return {'containers': {}, 'next_id': 0}
+
+
+def _apply_entry(doc: Dict, entry: Dict) -> None:
+    """将一条日志应用到文档"""
+    op = entry.get('op')
+    if op == 'set':
+        doc['containers'][entry['id']] = entry['value']
+    elif op == 'del':
+        doc['containers'].pop(entry['id'], None)
+    elif op == 'meta':
+        doc[entry['key']] = entry['value']
+    elif op == 'meta_del':
+        doc.pop(entry['key'], None)
+
+
+def _diff_documents(old: Dict, new: Dict) -> List[Dict]:
+    """计算两个文档之间的增量日志"""
+    entries = []
+    old_containers = old.get('containers', {})
+    new_containers = new.get('containers', {})
+    for cid, info in new_containers.items():
+        if old_containers.get(cid) != info:
+            entries.append({'op': 'set', 'id': cid, 'value': info})
+    for cid in old_containers:
+        if cid not in new_containers:
+            entries.append({'op': 'del', 'id': cid})
+    for key, value in new.items():
+        if key != 'containers' and old.get(key) != value:
+            entries.append({'op': 'meta', 'key': key, 'value': value})
+    for key in old:
+        if key != 'containers' and key not in new:
+            entries.append({'op': 'meta_del', 'key': key})
+    return entries
+
+
+class StateStore:
+    """容器状态存储
+
+    在进程内缓存 containers.json 的解析结果，并维护 user_id、域名、容器名
+    到容器ID的二级索引。写入时只追加增量日志，日志积累到一定数量后再通过
+    临时文件 + 原子重命名合并回主文件。文件被外部修改时按 mtime 重新加载。
+    """
+
+    def __init__(self, path: str = CONFIG_FILE,
+                 compact_threshold: int = COMPACT_THRESHOLD,
+                 check_interval: float = RELOAD_CHECK_INTERVAL):
+        self.path = path
+        self.journal_path = path + '.journal'
+        self.compact_threshold = compact_threshold
+        self.check_interval = check_interval
+        self._lock = threading.RLock()
+        self._doc = None
+        self._signature = None
+        self._last_check = 0.0
+        self._journal_entries = 0
+        self._by_user = {}
+        self._by_domain = {}
+        self._by_name = {}
+
+    # ---- 文件与缓存 ----
+
+    @staticmethod
+    def _stat(path: str) -> Optional[Tuple[int, int, int]]:
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def _current_signature(self) -> Tuple:
+        return (self._stat(self.path), self._stat(self.journal_path))
+
+    def _ensure_fresh(self) -> None:
+        """必要时重新加载文件，已缓存时每个检查间隔最多 stat 一次"""
+        now = time.monotonic()
+        if self._doc is not None and now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+        signature = self._current_signature()
+        if self._doc is not None and signature == self._signature:
+            return
+        self._load(signature)
+
+    def _load(self, signature: Tuple) -> None:
+        try:
+            with open(self.path, 'r') as f:
+                doc = json.load(f)
+        except FileNotFoundError:
+            doc = _empty_document()
+        doc.setdefault('containers', {})
+        doc.setdefault('next_id', 0)
+
+        entries = 0
+        try:
+            with open(self.journal_path, 'r') as f:
+                header = f.readline()
+                # 主文件在日志开始之后被外部改写过，日志已失效
+                if header and json.loads(header).get('base') == list(signature[0] or ()):
+                    for line in f:
+                        line = line.strip()
+                        if not line:
+                            continue
+                        try:
+                            entry = json.loads(line)
+                        except ValueError:
+                            # 最后一条写入不完整
+                            break
+                        _apply_entry(doc, entry)
+                        entries += 1
+        except (FileNotFoundError, ValueError):
+            pass
+
+        self._doc = doc
+        self._signature = signature
+        self._journal_entries = entries
+        self._rebuild_indexes()
+
+    def _write_journal(self, entries: List[Dict]) -> None:
+        lines = []
+        if self._stat(self.journal_path) is None:
+            lines.append(json.dumps({'base': list(self._stat(self.path) or ())}))
+        lines.extend(json.dumps(entry) for entry in entries)
+        with open(self.journal_path, 'a') as f:
+            f.write('\n'.join(lines) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal_entries += len(entries)
+
+    def _compact(self) -> None:
+        """将完整文档原子地写回主文件并清空日志"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        tmp_path = os.path.join(directory, f'.{os.path.basename(self.path)}.{os.getpid()}.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(self._doc, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        try:
+            os.unlink(self.journal_path)
+        except FileNotFoundError:
+            pass
+        self._journal_entries = 0
+
+    # ---- 索引 ----
+
+    def _rebuild_indexes(self) -> None:
+        self._by_user = {}
+        self._by_domain = {}
+        self._by_name = {}
+        for cid, info in self._doc['containers'].items():
+            self._index(cid, info)
+
+    def _index(self, cid: str, info: Dict) -> None:
+        if info.get('user_id') is not None:
+            self._by_user[info['user_id']] = cid
+        if info.get('name'):
+            self._by_name[info['name']] = cid
+        for domain in info.get('websites', []):
+            self._by_domain[domain.lower()] = cid
+
+    def _unindex(self, cid: str, info: Dict) -> None:
+        if self._by_user.get(info.get('user_id')) == cid:
+            del self._by_user[info['user_id']]
+        if self._by_name.get(info.get('name')) == cid:
+            del self._by_name[info['name']]
+        for domain in info.get('websites', []):
+            if self._by_domain.get(domain.lower()) == cid:
+                del self._by_domain[domain.lower()]
+
+    # ---- 读取 ----
+
+    def snapshot(self) -> Dict:
+        """返回完整文档的副本，调用方可以自由修改"""
+        with self._lock:
+            self._ensure_fresh()
+            return copy.deepcopy(self._doc)
+
+    def get_container(self, container_id: str) -> Optional[Dict]:
+        with self._lock:
+            self._ensure_fresh()
+            info = self._doc['containers'].get(container_id)
+            return copy.deepcopy(info) if info is not None else None
+
+    def owner_of(self, container_id: str) -> Optional[str]:
+        with self._lock:
+            self._ensure_fresh()
+            info = self._doc['containers'].get(container_id)
+            return info.get('user_id') if info else None
+
+    def find_by_user(self, user_id: str) -> Tuple[Optional[str], Optional[Dict]]:
+        with self._lock:
+            self._ensure_fresh()
+            cid = self._by_user.get(user_id)
+            if cid is None:
+                return None, None
+            return cid, copy.deepcopy(self._doc['containers'][cid])
+
+    def find_by_domain(self, domain: str) -> Optional[str]:
+        with self._lock:
+            self._ensure_fresh()
+            return self._by_domain.get(domain.lower())
+
+    def find_by_name(self, name: str) -> Optional[str]:
+        with self._lock:
+            self._ensure_fresh()
+            return self._by_name.get(name)
+
+    def count(self) -> int:
+        with self._lock:
+            self._ensure_fresh()
+            return len(self._doc['containers'])
+
+    # ---- 写入 ----
+
+    @contextmanager
+    def transaction(self):
+        """在锁内读取-修改-写入文档，退出时只保存发生变化的部分"""
+        with self._lock:
+            doc = self.snapshot()
+            yield doc
+            self.save(doc)
+
+    def save(self, config: Dict) -> None:
+        """保存文档，只把与缓存不同的部分写入日志"""
+        with self._lock:
+            self._ensure_fresh()
+            entries = _diff_documents(self._doc, config)
+            if not entries:
+                return
+            entries = copy.deepcopy(entries)
+            self._write_journal(entries)
+            for entry in entries:
+                if entry['op'] in ('set', 'del'):
+                    old = self._doc['containers'].get(entry['id'])
+                    if old is not None:
+                        self._unindex(entry['id'], old)
+                _apply_entry(self._doc, entry)
+                if entry['op'] == 'set':
+                    self._index(entry['id'], entry['value'])
+            if self._journal_entries >= self.compact_threshold:
+                self._compact()
+            self._signature = self._current_signature()
+            self._last_check = time.monotonic()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> StateStore:
+    """获取全局状态存储"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = StateStore()
+    return _store
@@ -0,0 +1,142 @@
+import codecs
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+
+class OutputPipeline:
+    """终端输出管线
+
+    - 使用增量 UTF-8 解码器，跨读取边界的多字节字符不会被截断
+    - 在 flush_interval 时间窗口内合并输出，每帧不超过 max_frame 个字符
+    - 每帧要求客户端确认，未确认的帧达到 max_inflight 时暂停读取终端(背压)，
+      超过 ack_timeout 仍未确认则视为丢失，避免旧客户端导致会话卡死
+    - position 记录已写入的字节序号，每次 flush 的最后一帧附带已解码到的序号，
+      客户端重连时据此只补发缺失的部分
+    """
+
+    def __init__(self, send: Callable[[str, Callable, Optional[int]], None],
+                 flush_interval: float = 0.02,
+                 max_frame: int = 32 * 1024,
+                 max_inflight: int = 4,
+                 ack_timeout: float = 10.0,
+                 position: int = 0):
+        self.send = send
+        self.position = position
+        self.flush_interval = flush_interval
+        self.max_frame = max_frame
+        self.max_inflight = max_inflight
+        self.ack_timeout = ack_timeout
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self._pending: List[str] = []
+        self._pending_size = 0
+        self._first_pending_at = None
+        self._inflight = 0
+        # 未确认的帧达到上限(或上限时最近一次收到确认)的时间，未达到上限时为 None
+        self._full_since: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def paused(self) -> bool:
+        """客户端积压过多时为 True，调用方应暂停读取"""
+        with self._lock:
+            if self._full_since is not None and time.monotonic() - self._full_since > self.ack_timeout:
+                self._inflight = 0
+                self._full_since = None
+            return self._inflight >= self.max_inflight
+
+    @property
+    def has_pending(self) -> bool:
+        return self._pending_size > 0
+
+    def feed(self, data: bytes) -> None:
+        """写入终端原始输出"""
+        self.position += len(data)
+        text = self._decoder.decode(data)
+        if not text:
+            return
+        with self._lock:
+            if self._first_pending_at is None:
+                self._first_pending_at = time.monotonic()
+            self._pending.append(text)
+            self._pending_size += len(text)
+
+    def timeout(self) -> float:
+        """距离下一次需要 flush 的秒数"""
+        if self._first_pending_at is None:
+            return self.flush_interval
+        return max(self._first_pending_at + self.flush_interval - time.monotonic(), 0)
+
+    def due(self) -> bool:
+        """合并窗口已到期或已攒满一帧"""
+        return self.has_pending and (self._pending_size >= self.max_frame or self.timeout() == 0)
+
+    def flush(self, final: bool = False) -> None:
+        """发送积压的输出；final 为 True 时同时冲刷解码器中的残余字节"""
+        if final:
+            tail = self._decoder.decode(b'', final=True)
+            if tail:
+                self._pending.append(tail)
+                self._pending_size += len(tail)
+        with self._lock:
+            if not self._pending:
+                return
+            text = ''.join(self._pending)
+            self._pending = []
+            self._pending_size = 0
+            self._first_pending_at = None
+            # 解码器中尚未组成完整字符的字节不计入已发送序号
+            position = self.position - len(self._decoder.getstate()[0])
+            frames = [text[i:i + self.max_frame] for i in range(0, len(text), self.max_frame)]
+            self._inflight += len(frames)
+            if self._inflight >= self.max_inflight and self._full_since is None:
+                self._full_since = time.monotonic()
+        for i, frame in enumerate(frames):
+            self.send(frame, self.ack, position if i == len(frames) - 1 else None)
+
+    def ack(self, *args) -> None:
+        """客户端确认收到一帧"""
+        with self._lock:
+            self._inflight = max(self._inflight - 1, 0)
+            self._full_since = time.monotonic() if self._inflight >= self.max_inflight else None
+
+
+class ScrollbackRing:
+    """终端输出的环形缓冲区
+
+    固定容量的 bytearray，按绝对字节序号寻址，写满后覆盖最旧的数据。
+    end 为已写入的总字节数，start 为仍可读取的最小序号。
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._buffer = bytearray(capacity)
+        self.end = 0
+
+    @property
+    def start(self) -> int:
+        return max(self.end - self.capacity, 0)
+
+    def write(self, data: bytes) -> None:
+        size = len(data)
+        view = memoryview(data)[max(size - self.capacity, 0):]
+        pos = (self.end + size - len(view)) % self.capacity
+        first = min(len(view), self.capacity - pos)
+        self._buffer[pos:pos + first] = view[:first]
+        self._buffer[:len(view) - first] = view[first:]
+        self.end += size
+
+    def read(self, offset: int, limit: int) -> Tuple[int, bytes]:
+        """从 offset 开始读取最多 limit 字节，返回 (实际起始序号, 数据)
+
+        offset 早于 start(已被覆盖)时从 start 开始，并跳过开头不完整的 UTF-8 字符。
+        """
+        if offset < self.start:
+            offset = self.start
+            while offset < self.end and self._buffer[offset % self.capacity] & 0xC0 == 0x80:
+                offset += 1
+        offset = min(offset, self.end)
+        size = min(self.end - offset, limit)
+        pos = offset % self.capacity
+        first = min(size, self.capacity - pos)
+        return offset, bytes(self._buffer[pos:pos + first]) + bytes(self._buffer[:size - first])
@@ -0,0 +1,234 @@
+import hashlib
+import json
+import os
+import posixpath
+import threading
+import time
+from typing import Dict, List, Optional
+from engine import tar_file_stream
+from hostfs import DataDir, FileOpError, SymlinkInPath, to_data_relative
+
+
+class UploadError(Exception):
+    """分块上传请求无效"""
+    pass
+
+
+def install_file(docker_manager, container_id: int, container_name: str, src_path: str,
+                 target: str, mode: int = 0o644) -> None:
+    """把主机上的文件放到容器内的 target，同时设置属主和权限
+
+    /data 下的目标经 DataDir 直接放到主机上的数据目录，属主继承所在目录；
+    其他路径(以及 /data 中经由符号链接的路径)以 tar 流写入容器，属主为 root。
+    """
+    relative = to_data_relative(target)
+    if relative is not None:
+        try:
+            DataDir(container_id).install_file(relative, src_path, mode)
+            return
+        except SymlinkInPath:
+            pass
+        except (FileNotFoundError, NotADirectoryError):
+            raise UploadError("目标目录不存在")
+        except FileOpError as e:
+            raise UploadError(str(e))
+    docker_manager.put_archive(
+        container_name,
+        posixpath.dirname(target) or '/',
+        tar_file_stream(src_path, posixpath.basename(target), mode=mode)
+    )
+
+
+class UploadSession:
+    """一个分块上传任务，数据写入暂存目录中的 .part 文件，进度保存在同名 .json 中"""
+
+    FIELDS = ('id', 'container_id', 'user_id', 'target', 'size', 'chunk_size', 'received', 'updated_at')
+
+    def __init__(self, root: str, **state):
+        self.root = root
+        self.id = state['id']
+        self.container_id = state['container_id']
+        self.user_id = state['user_id']
+        self.target = state['target']
+        self.size = state['size']
+        self.chunk_size = state['chunk_size']
+        self.received = set(state.get('received', []))
+        self.updated_at = state.get('updated_at', time.time())
+
+    @property
+    def part_path(self) -> str:
+        return os.path.join(self.root, f'{self.id}.part')
+
+    @property
+    def state_path(self) -> str:
+        return os.path.join(self.root, f'{self.id}.json')
+
+    @property
+    def chunk_count(self) -> int:
+        return max((self.size + self.chunk_size - 1) // self.chunk_size, 1)
+
+    def chunk_length(self, index: int) -> int:
+        return min(self.chunk_size, self.size - index * self.chunk_size)
+
+    def missing(self) -> List[int]:
+        return [i for i in range(self.chunk_count) if i not in self.received]
+
+    @property
+    def received_bytes(self) -> int:
+        return sum(self.chunk_length(i) for i in self.received)
+
+    def to_dict(self) -> Dict:
+        state = {field: getattr(self, field) for field in self.FIELDS}
+        state['received'] = sorted(self.received)
+        return state
+
+
+class UploadManager:
+    """分块、可续传的上传
+
+    客户端先 init 得到上传ID和分块大小，再以任意顺序(可并行)上传各块，
+    每块附带 SHA-256 校验，最后 commit 把文件放到目标位置。
+    上传ID由容器、用户、目标路径、大小和客户端提供的文件指纹确定，
+    中断后重新 init 会得到同一个上传并返回尚缺的分块。
+    """
+
+    def __init__(self, root: str, chunk_size: int, expire_after: float, cleanup_interval: float = 600):
+        self.root = root
+        self.chunk_size = chunk_size
+        self.expire_after = expire_after
+        self.cleanup_interval = cleanup_interval
+        self._sessions: Dict[str, UploadSession] = {}
+        self._lock = threading.Lock()
+        self._last_cleanup = 0.0
+        os.makedirs(root, exist_ok=True)
+
+    def _save(self, upload: UploadSession) -> None:
+        upload.updated_at = time.time()
+        tmp_path = upload.state_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(upload.to_dict(), f)
+        os.replace(tmp_path, upload.state_path)
+
+    def _load(self, upload_id: str) -> Optional[UploadSession]:
+        upload = self._sessions.get(upload_id)
+        if upload is not None:
+            return upload
+        try:
+            with open(os.path.join(self.root, f'{upload_id}.json'), 'r') as f:
+                upload = UploadSession(self.root, **json.load(f))
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        if not os.path.exists(upload.part_path):
+            return None
+        self._sessions[upload_id] = upload
+        return upload
+
+    def init(self, container_id: int, user_id: str, target: str, size: int, fingerprint: str = '') -> UploadSession:
+        """创建或恢复上传任务"""
+        if size < 0:
+            raise UploadError("文件大小无效")
+        self.cleanup()
+        key = f'{container_id}\0{user_id}\0{target}\0{size}\0{fingerprint}'
+        upload_id = hashlib.sha256(key.encode()).hexdigest()[:32]
+        with self._lock:
+            upload = self._load(upload_id)
+            if upload is None:
+                upload = UploadSession(
+                    self.root,
+                    id=upload_id,
+                    container_id=container_id,
+                    user_id=user_id,
+                    target=target,
+                    size=size,
+                    chunk_size=self.chunk_size
+                )
+                with open(upload.part_path, 'wb') as f:
+                    f.truncate(size)
+                self._save(upload)
+                self._sessions[upload_id] = upload
+            return upload
+
+    def get(self, upload_id: str, user_id: str) -> UploadSession:
+        with self._lock:
+            upload = self._load(upload_id)
+        if upload is None or upload.user_id != user_id:
+            raise UploadError("上传任务不存在或已过期")
+        return upload
+
+    def write_chunk(self, upload: UploadSession, index: int, stream, checksum: Optional[str] = None) -> None:
+        """把一个分块写入 .part 文件的对应偏移，校验通过后记录为已接收"""
+        if index < 0 or index >= upload.chunk_count:
+            raise UploadError("分块序号无效")
+        length = upload.chunk_length(index)
+        digest = hashlib.sha256()
+        written = 0
+        fd = os.open(upload.part_path, os.O_WRONLY)
+        try:
+            offset = index * upload.chunk_size
+            while written < length:
+                block = stream.read(min(1024 * 64, length - written))
+                if not block:
+                    break
+                digest.update(block)
+                os.pwrite(fd, block, offset + written)
+                written += len(block)
+        finally:
+            os.close(fd)
+        if written != length or stream.read(1):
+            raise UploadError("分块大小不匹配")
+        if checksum and digest.hexdigest() != checksum.lower():
+            raise UploadError("分块校验失败")
+        with self._lock:
+            upload.received.add(index)
+            self._save(upload)
+
+    def commit(self, upload: UploadSession) -> str:
+        """确认所有分块已接收，返回完整文件的路径；调用方放置文件后应调用 discard"""
+        missing = upload.missing()
+        if missing:
+            raise UploadError(f"还有 {len(missing)} 个分块未上传")
+        return upload.part_path
+
+    def discard(self, upload: UploadSession) -> None:
+        with self._lock:
+            self._sessions.pop(upload.id, None)
+        for path in (upload.part_path, upload.state_path):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def cleanup(self) -> None:
+        """删除长时间没有进展的上传"""
+        now = time.time()
+        if now - self._last_cleanup < self.cleanup_interval:
+            return
+        self._last_cleanup = now
+        try:
+            names = os.listdir(self.root)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.root, name)
+            try:
+                if now - os.path.getmtime(path) > self.expire_after:
+                    os.unlink(path)
+                    with self._lock:
+                        self._sessions.pop(name.split('.', 1)[0], None)
+            except OSError:
+                pass
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_upload_manager() -> UploadManager:
+    """获取全局分块上传管理器"""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                from config import UPLOAD_DIR, UPLOAD_CHUNK_SIZE, UPLOAD_EXPIRE
+                _manager = UploadManager(os.path.abspath(UPLOAD_DIR), UPLOAD_CHUNK_SIZE, UPLOAD_EXPIRE)
+    return _manager
@@ -1,10 +1,10 @@
 import random
 import string
 import os
-import json
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import re
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
+from registry import get_registry
 
 def generate_password(length: int = 12) -> str:
     """生成随机密码"""
@@ -19,6 +19,21 @@ def validate_domain(domain: str) -> bool:
     pattern = r'^[a-zA-Z0-9]([a-zA-Z0-9-]*[a-zA-Z0-9])?(\.[a-zA-Z0-9]([a-zA-Z0-9-]*[a-zA-Z0-9])?)*\.[a-zA-Z]{2,}$'
     return bool(re.match(pattern, domain))
 
+def merge_routes(routes: List[Tuple[str, int]]) -> Tuple[Dict[str, int], List[str]]:
+    """把 (域名, 端口) 合并为以小写域名为键的路由表，返回 (路由表, 冲突的域名)
+
+    域名不区分大小写，同一域名的不同大小写写法指向不同端口时无法判断归属，该域名不路由。
+    """
+    merged = {}
+    conflicts = set()
+    for domain, port in routes:
+        key = domain.lower()
+        if merged.setdefault(key, port) != port:
+            conflicts.add(key)
+    for key in conflicts:
+        del merged[key]
+    return merged, sorted(conflicts)
+
 def calculate_expiry(days: int = 5, from_date: Optional[datetime] = None) -> str:
     """计算过期时间"""
     if from_date is None:
@@ -26,29 +41,60 @@ def calculate_expiry(days: int = 5, from_date: Optional[datetime] = None) -> str
     expiry = from_date + timedelta(days=days)
     return expiry.isoformat() + 'Z'
 
-def ensure_data_dir(container_id: int) -> str:
-    """确保数据目录存在"""
+def parse_expiry(expires_at: str) -> float:
+    """把 calculate_expiry 生成的 UTC 时间解析为时间戳"""
+    expires_at_str = expires_at.rstrip('Z').split('.')[0]
+    return datetime.strptime(expires_at_str, '%Y-%m-%dT%H:%M:%S').replace(tzinfo=timezone.utc).timestamp()
+
+def get_container_id(container_name: str) -> int:
+    """根据容器名称解析容器ID"""
+    return int(container_name.rsplit('-', 1)[-1])
+
+def get_data_dir(container_id: int) -> str:
+    """获取容器数据目录在主机上的绝对路径"""
     from config import DATA_DIR
     # 获取当前工作目录的绝对路径
     base_dir = os.path.abspath(os.getcwd())
     # 构建数据目录的绝对路径
-    data_dir = os.path.join(base_dir, DATA_DIR.lstrip('./'), str(container_id))
+    return os.path.join(base_dir, DATA_DIR.lstrip('./'), str(container_id))
+
+def ensure_data_dir(container_id: int) -> str:
+    """确保数据目录存在"""
+    data_dir = get_data_dir(container_id)
     # 创建目录
     os.makedirs(data_dir, exist_ok=True)
     return data_dir
 
+def parse_storage_size(size: str) -> int:
+    """解析 '3G'、'512M' 这类容量配置为字节数"""
+    units = {'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3, 't': 1024 ** 4}
+    size = size.strip().lower().rstrip('b')
+    if size and size[-1] in units:
+        return int(float(size[:-1]) * units[size[-1]])
+    return int(size)
+
 def load_config() -> Dict:
-    """加载配置文件"""
-    try:
-        with open('containers.json', 'r') as f:
-            return json.loads(f.read())
-    except FileNotFoundError:
-        return {'containers': {}, 'next_id': 0}
+    """加载完整配置（返回副本）"""
+    return get_registry().snapshot()
 
 def save_config(config: Dict) -> None:
-    """保存配置文件"""
-    with open('containers.json', 'w') as f:
-        json.dump(config, f, indent=2)
+    """保存配置文件（整体覆盖，新代码应使用注册表的单行更新）"""
+    get_registry().save_snapshot(config)
+
+def get_container_info(container_id: str) -> Optional[Dict]:
+    """获取单个容器的配置信息"""
+    return get_registry().get_container(container_id)
+
+def get_user_container(user_id: str) -> Tuple[Optional[str], Optional[Dict]]:
+    """查找用户的容器，返回(容器ID, 容器信息)"""
+    return get_registry().find_by_user(user_id)
+
+# 主机端口对应的容器内端口
+CONTAINER_PORT_TARGETS = {
+    'ssh_port': 22,
+    'ftp_port': 21,
+    'http_port': 9000
+}
 
 def get_container_ports(container_id: int) -> Dict[str, int]:
     """获取容器端口映射"""
@@ -59,10 +105,10 @@ def get_container_ports(container_id: int) -> Dict[str, int]:
         'ftp_port': BASE_FTP_PORT + container_id
     }
 
-def validate_user_container(config: Dict, container_id: str, user_id: str) -> bool:
+def validate_user_container(container_id: str, user_id: str) -> bool:
     """验证容器是否属于用户"""
-    container_info = config['containers'].get(container_id)
-    return bool(container_info and container_info.get('user_id') == user_id)
+    owner = get_registry().owner_of(container_id)
+    return owner is not None and owner == user_id
 
 def get_container_type(container_info: Dict) -> str:
     """获取容器类型"""
@@ -81,10 +127,10 @@ def format_container_info(container_info: Dict) -> Dict:
             info[date_field] = date.strftime('%Y-%m-%d %H:%M:%S')
     return info
 
-def calculate_machine_stats(config: Dict) -> Dict:
+def calculate_machine_stats() -> Dict:
     """计算机器统计信息"""
     from config import MAX_MACHINES
-    total_machines = len(config['containers'])
+    total_machines = get_registry().count()
     return {
         'total': total_machines,
         'max': MAX_MACHINES,
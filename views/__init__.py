@@ -7,6 +7,7 @@ def init_views(app):
     from . import index as index_views
     from . import terminal as terminal_views
     from . import files as files_views
+    from . import jobs as jobs_views
     
     # 注册蓝图
     app.register_blueprint(instance_views.instance)
@@ -15,3 +16,4 @@ def init_views(app):
     app.register_blueprint(index_views.index)
     app.register_blueprint(terminal_views.terminal)
     app.register_blueprint(files_views.files)
+    app.register_blueprint(jobs_views.jobs)
@@ -1,15 +1,32 @@
-from flask import Blueprint, render_template, request, jsonify, send_file, session
+from flask import Blueprint, render_template, request, jsonify, send_file, session, Response
 from auth import login_required
-from utils import validate_user_container, get_container_name, load_config
+from utils import validate_user_container, get_container_name
 from models import DockerManager
+from engine import EngineError
+from diskusage import get_disk_accounting, QuotaExceeded
+from hostfs import (DataDir, to_data_relative, get_container_files, page_entries, is_binary, trim_utf8,
+                    SymlinkInPath, FileOpError, FileConflict)
+from uploads import get_upload_manager, install_file, UploadError
+from archives import ARCHIVE_FORMATS, ArchiveError
+from search import FileSearch, SearchError
 import os
-import subprocess
+import json
 import tempfile
 import shutil
 from werkzeug.utils import secure_filename
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
+from config import (LIST_PAGE_SIZE, LIST_PAGE_MAX, EDITOR_READ_SIZE, EDITOR_READ_MAX,
+                    ARCHIVE_MAX_SIZE, ARCHIVE_MAX_ENTRIES, SEARCH_MAX_RESULTS, SEARCH_TIME_LIMIT,
+                    SEARCH_MAX_FILE_SIZE)
 
 files = Blueprint('files', __name__, url_prefix='/files')
 docker_manager = DockerManager()
+disk = get_disk_accounting()
+uploads = get_upload_manager()
+
+def get_files(container_id):
+    """获取容器的文件操作对象，/data 下的操作直接在主机上完成"""
+    return get_container_files(docker_manager, int(container_id), get_container_name(int(container_id)))
 
 @files.route('/')
 @login_required
@@ -20,8 +37,7 @@ def files_view():
         user_id = str(session['user']['id'])
         
         # 验证容器所有权
-        config = load_config()
-        if not validate_user_container(config, container_id, user_id):
+        if not validate_user_container(container_id, user_id):
             return "无权操作此容器", 403
             
         return render_template('files/files.html',
@@ -33,95 +49,191 @@ def files_view():
 @files.route('/list')
 @login_required
 def list_files():
-    """列出目录内容"""
+    """列出目录内容
+
+    参数: sort(name/size/mtime/type)、order(asc/desc)、q(名称筛选)、
+    cursor(上一页返回的 next_cursor)、limit(每页条数)。
+    目录未变化时根据 If-None-Match 返回 304。
+    """
     try:
         container_id = request.args.get('container_id')
         path = request.args.get('path', '/data')
         user_id = str(session['user']['id'])
         
         # 验证容器所有权
-        config = load_config()
-        if not validate_user_container(config, container_id, user_id):
+        if not validate_user_container(container_id, user_id):
             return jsonify({'error': '无权操作此容器'}), 403
             
-        # 获取容器信息
-        container_name = get_container_name(int(container_id))
-        
-        # 列出目录内容
-        cmd = ['sudo', 'docker', 'exec', container_name, 'ls', '-la', path]
-        result = subprocess.run(cmd, capture_output=True, text=True)
+        limit = min(max(int(request.args.get('limit', LIST_PAGE_SIZE)), 1), LIST_PAGE_MAX)
+        offset = max(int(request.args.get('cursor') or 0), 0)
+        container_files = get_files(container_id)
         
-        if result.returncode != 0:
-            return jsonify({'error': '获取目录列表失败'}), 500
-            
-        # 解析ls输出
-        files = []
-        for line in result.stdout.strip().split('\n')[1:]:  # 跳过第一行(total)
-            parts = line.split()
-            if len(parts) >= 9:
-                name = ' '.join(parts[8:])
-                if name not in ['.', '..']:
-                    files.append({
-                        'name': name,
-                        'type': 'd' if parts[0].startswith('d') else 'f',
-                        'size': parts[4],
-                        'permissions': parts[0],
-                        'owner': parts[2],
-                        'group': parts[3],
-                        'modified': ' '.join(parts[5:8])
-                    })
+        # /data 下的目录只需一次 stat 即可判断是否变化
+        try:
+            etag = container_files.directory_etag(path)
+            if etag is not None and etag in request.if_none_match:
+                response = Response(status=304)
+                response.set_etag(etag)
+                return response
+            
+            # 列出目录内容
+            entries, etag = container_files.list_dir(path)
+        except FileOpError as e:
+            return jsonify({'error': f'获取目录列表失败: {str(e)}'}), 500
+        if etag in request.if_none_match:
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
         
-        return jsonify({'files': files})
+        response = jsonify(page_entries(
+            entries,
+            sort=request.args.get('sort', 'name'),
+            reverse=request.args.get('order') == 'desc',
+            query=request.args.get('q', ''),
+            offset=offset,
+            limit=limit
+        ))
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    except ValueError:
+        return jsonify({'error': '参数无效'}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @files.route('/download')
 @login_required
 def download_file():
-    """下载文件"""
+    """下载文件，支持 Range 断点续传"""
     try:
         container_id = request.args.get('container_id')
         path = request.args.get('path')
         user_id = str(session['user']['id'])
         
         # 验证容器所有权
-        config = load_config()
-        if not validate_user_container(config, container_id, user_id):
+        if not validate_user_container(container_id, user_id):
             return "无权操作此容器", 403
             
-        # 获取容器信息
-        container_name = get_container_name(int(container_id))
+        download_name = os.path.basename(path)
         
-        # 创建临时文件
-        with tempfile.NamedTemporaryFile(delete=False) as temp:
-            # 从容器复制文件
-            cmd = ['sudo', 'docker', 'cp', f'{container_name}:{path}', temp.name]
-            result = subprocess.run(cmd)
-            
-            if result.returncode != 0:
-                return "下载文件失败", 500
-            
-            # 发送文件
-            return send_file(
-                temp.name,
-                as_attachment=True,
-                download_name=os.path.basename(path)
-            )
+        # /data 下的文件经 DataDir 打开后直接从主机上的数据目录发送，经由符号链接的路径交给容器；
+        # open_file 以非阻塞方式打开并拒绝目录、FIFO 等非普通文件
+        relative = to_data_relative(path)
+        fd = None
+        if relative is not None:
+            try:
+                fd = DataDir(int(container_id)).open_file(relative)
+            except SymlinkInPath:
+                fd = None
+            except (OSError, FileOpError):
+                return "文件不存在", 404
+        if fd is not None:
+            st = os.fstat(fd)
+            response = send_file(os.fdopen(fd, 'rb'), as_attachment=True, download_name=download_name,
+                                 conditional=False, last_modified=st.st_mtime,
+                                 etag=f'{st.st_size}-{int(st.st_mtime)}')
+            response.content_length = st.st_size
+            return response.make_conditional(request, accept_ranges=True, complete_length=st.st_size)
+            
+        # 其他路径从容器归档接口流式读取
+        container_name = get_container_name(int(container_id))
+        try:
+            archive = docker_manager.open_file(container_name, path)
+        except EngineError:
+            return "下载文件失败", 500
+            
+        response = Response(archive.iter_chunks(), mimetype='application/octet-stream', direct_passthrough=True)
+        response.content_length = archive.size
+        response.last_modified = archive.mtime
+        response.set_etag(f'{archive.size}-{archive.mtime}')
+        response.headers.set('Content-Disposition', 'attachment', filename=download_name)
+        response.call_on_close(archive.close)
+        return response.make_conditional(request, accept_ranges=True, complete_length=archive.size)
+    except RequestedRangeNotSatisfiable as e:
+        return e
     except Exception as e:
         return f"下载文件失败: {str(e)}", 500
 
+@files.route('/download_archive')
+@login_required
+def download_archive():
+    """把目录打包为 tar.gz 或 zip 下载，边读边压缩"""
+    try:
+        container_id = request.args.get('container_id')
+        path = request.args.get('path', '/data')
+        fmt = request.args.get('format', 'tar.gz')
+        user_id = str(session['user']['id'])
+        
+        # 验证容器所有权
+        if not validate_user_container(container_id, user_id):
+            return "无权操作此容器", 403
+            
+        if fmt not in ARCHIVE_FORMATS:
+            return "不支持的归档格式", 400
+            
+        try:
+            chunks = get_files(container_id).archive(path, fmt)
+        except FileOpError as e:
+            return f"打包目录失败: {str(e)}", 500
+            
+        download_name = f"{os.path.basename(path.rstrip('/')) or 'root'}.{fmt}"
+        response = Response(chunks, mimetype=ARCHIVE_FORMATS[fmt], direct_passthrough=True)
+        response.headers.set('Content-Disposition', 'attachment', filename=download_name)
+        response.call_on_close(getattr(chunks, 'close', lambda: None))
+        return response
+    except Exception as e:
+        return f"打包目录失败: {str(e)}", 500
+
+@files.route('/upload_archive', methods=['POST'])
+@login_required
+def upload_archive():
+    """上传归档(zip、tar、tar.gz 等)并解压到目标目录"""
+    try:
+        container_id = request.form.get('container_id')
+        path = request.form.get('path', '/data')
+        user_id = str(session['user']['id'])
+        
+        # 验证容器所有权
+        if not validate_user_container(container_id, user_id):
+            return jsonify({'error': '无权操作此容器'}), 403
+            
+        if 'file' not in request.files or request.files['file'].filename == '':
+            return jsonify({'error': '没有选择文件'}), 400
+        file = request.files['file']
+            
+        # 检查存储空间
+        try:
+            disk.check_quota(int(container_id), request.content_length or 0)
+        except QuotaExceeded as e:
+            return jsonify({'error': str(e)}), 507
+            
+        # 解压后的大小事先未知，边解压边按剩余空间限制
+        max_size = min(ARCHIVE_MAX_SIZE, disk.remaining(int(container_id)))
+        try:
+            extracted, skipped = get_files(container_id).extract(
+                path, file.stream, file.filename, max_size, ARCHIVE_MAX_ENTRIES)
+        except ArchiveError as e:
+            return jsonify({'error': str(e)}), 400
+        except FileOpError as e:
+            return jsonify({'error': f'解压失败: {str(e)}'}), 500
+        finally:
+            disk.invalidate(int(container_id))
+            
+        return jsonify({'message': '解压成功', 'extracted': extracted, 'skipped': skipped})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @files.route('/upload', methods=['POST'])
 @login_required
 def upload_file():
-    """上传文件"""
+    """上传文件(单次请求)"""
     try:
         container_id = request.form.get('container_id')
         path = request.form.get('path', '/data')
         user_id = str(session['user']['id'])
         
         # 验证容器所有权
-        config = load_config()
-        if not validate_user_container(config, container_id, user_id):
+        if not validate_user_container(container_id, user_id):
             return jsonify({'error': '无权操作此容器'}), 403
             
         if 'file' not in request.files:
@@ -131,27 +243,141 @@ def upload_file():
         if file.filename == '':
             return jsonify({'error': '没有选择文件'}), 400
             
+        # 检查存储空间
+        try:
+            disk.check_quota(int(container_id), request.content_length or 0)
+        except QuotaExceeded as e:
+            return jsonify({'error': str(e)}), 507
+            
         # 获取容器信息
         container_name = get_container_name(int(container_id))
         
-        # 保存文件到临时目录
-        filename = secure_filename(file.filename)
-        with tempfile.NamedTemporaryFile(delete=False) as temp:
-            file.save(temp.name)
+        # 保存到暂存目录后放到目标位置，同时设置属主和权限
+        target_path = os.path.join(path, secure_filename(file.filename))
+        fd, temp_path = tempfile.mkstemp(dir=uploads.root, suffix='.upload')
+        try:
+            with os.fdopen(fd, 'wb') as temp:
+                shutil.copyfileobj(file.stream, temp, 1024 * 64)
+            install_file(docker_manager, int(container_id), container_name, temp_path, target_path)
+        except UploadError as e:
+            return jsonify({'error': str(e)}), 400
+        except EngineError:
+            return jsonify({'error': '上传文件失败'}), 500
+        finally:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+        disk.invalidate(int(container_id))
+            
+        return jsonify({'message': '文件上传成功'})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@files.route('/upload/init', methods=['POST'])
+@login_required
+def upload_init():
+    """创建或恢复分块上传，返回尚未上传的分块"""
+    try:
+        container_id = request.form.get('container_id')
+        path = request.form.get('path', '/data')
+        filename = request.form.get('filename', '')
+        user_id = str(session['user']['id'])
+        
+        # 验证容器所有权
+        if not validate_user_container(container_id, user_id):
+            return jsonify({'error': '无权操作此容器'}), 403
+            
+        if not secure_filename(filename):
+            return jsonify({'error': '没有选择文件'}), 400
+            
+        upload = uploads.init(
+            int(container_id),
+            user_id,
+            os.path.join(path, secure_filename(filename)),
+            int(request.form.get('size', -1)),
+            request.form.get('fingerprint', '')
+        )
+        
+        # 检查存储空间
+        try:
+            disk.check_quota(int(container_id), upload.size - upload.received_bytes)
+        except QuotaExceeded as e:
+            uploads.discard(upload)
+            return jsonify({'error': str(e)}), 507
+            
+        return jsonify({
+            'upload_id': upload.id,
+            'chunk_size': upload.chunk_size,
+            'missing': upload.missing()
+        })
+    except (UploadError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@files.route('/upload/chunk', methods=['POST'])
+@login_required
+def upload_chunk():
+    """上传一个分块，请求体为分块原始数据，X-Chunk-Sha256 头为其校验值"""
+    try:
+        container_id = request.args.get('container_id')
+        user_id = str(session['user']['id'])
+        
+        # 验证容器所有权
+        if not validate_user_container(container_id, user_id):
+            return jsonify({'error': '无权操作此容器'}), 403
             
-            # 复制文件到容器
-            target_path = os.path.join(path, filename)
-            cmd = ['sudo', 'docker', 'cp', temp.name, f'{container_name}:{target_path}']
-            result = subprocess.run(cmd)
+        upload = uploads.get(request.args.get('upload_id', ''), user_id)
+        if upload.container_id != int(container_id):
+            return jsonify({'error': '上传任务不存在或已过期'}), 404
             
-            if result.returncode != 0:
-                return jsonify({'error': '上传文件失败'}), 500
+        uploads.write_chunk(upload, int(request.args.get('index', -1)), request.stream,
+                            request.headers.get('X-Chunk-Sha256'))
+        return jsonify({'received': len(upload.received), 'total': upload.chunk_count})
+    except (UploadError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@files.route('/upload/commit', methods=['POST'])
+@login_required
+def upload_commit():
+    """所有分块上传完成后放置文件"""
+    try:
+        container_id = request.form.get('container_id')
+        user_id = str(session['user']['id'])
+        
+        # 验证容器所有权
+        if not validate_user_container(container_id, user_id):
+            return jsonify({'error': '无权操作此容器'}), 403
             
-            # 设置文件权限
-            cmd = ['sudo', 'docker', 'exec', container_name, 'chmod', '644', target_path]
-            subprocess.run(cmd)
+        upload = uploads.get(request.form.get('upload_id', ''), user_id)
+        if upload.container_id != int(container_id):
+            return jsonify({'error': '上传任务不存在或已过期'}), 404
             
+        # extract 为真时把上传的归档解压到目标所在目录
+        if request.form.get('extract') in ('1', 'true'):
+            max_size = min(ARCHIVE_MAX_SIZE, disk.remaining(int(container_id)))
+            with open(uploads.commit(upload), 'rb') as archive:
+                extracted, skipped = get_files(container_id).extract(
+                    os.path.dirname(upload.target) or '/', archive, os.path.basename(upload.target),
+                    max_size, ARCHIVE_MAX_ENTRIES)
+            uploads.discard(upload)
+            disk.invalidate(int(container_id))
+            return jsonify({'message': '解压成功', 'extracted': extracted, 'skipped': skipped})
+            
+        container_name = get_container_name(int(container_id))
+        try:
+            install_file(docker_manager, int(container_id), container_name, uploads.commit(upload), upload.target)
+        except EngineError:
+            return jsonify({'error': '上传文件失败'}), 500
+        uploads.discard(upload)
+        disk.invalidate(int(container_id))
+        
         return jsonify({'message': '文件上传成功'})
+    except (UploadError, ArchiveError) as e:
+        return jsonify({'error': str(e)}), 400
+    except FileOpError as e:
+        return jsonify({'error': f'解压失败: {str(e)}'}), 500
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -166,20 +392,14 @@ def create_folder():
         user_id = str(session['user']['id'])
         
         # 验证容器所有权
-        config = load_config()
-        if not validate_user_container(config, container_id, user_id):
+        if not validate_user_container(container_id, user_id):
             return jsonify({'error': '无权操作此容器'}), 403
             
-        # 获取容器信息
-        container_name = get_container_name(int(container_id))
-        
         # 创建文件夹
-        folder_path = os.path.join(path, name)
-        cmd = ['sudo', 'docker', 'exec', container_name, 'mkdir', '-p', folder_path]
-        result = subprocess.run(cmd)
-        
-        if result.returncode != 0:
-            return jsonify({'error': '创建文件夹失败'}), 500
+        try:
+            get_files(container_id).make_dir(os.path.join(path, name))
+        except FileOpError as e:
+            return jsonify({'error': f'创建文件夹失败: {str(e)}'}), 500
             
         return jsonify({'message': '文件夹创建成功'})
     except Exception as e:
@@ -195,84 +415,194 @@ def delete_item():
         user_id = str(session['user']['id'])
         
         # 验证容器所有权
-        config = load_config()
-        if not validate_user_container(config, container_id, user_id):
+        if not validate_user_container(container_id, user_id):
             return jsonify({'error': '无权操作此容器'}), 403
             
-        # 获取容器信息
-        container_name = get_container_name(int(container_id))
-        
         # 删除文件或文件夹
-        cmd = ['sudo', 'docker', 'exec', container_name, 'rm', '-rf', path]
-        result = subprocess.run(cmd)
-        
-        if result.returncode != 0:
-            return jsonify({'error': '删除失败'}), 500
+        try:
+            get_files(container_id).delete(path)
+        except FileOpError as e:
+            return jsonify({'error': f'删除失败: {str(e)}'}), 500
+        disk.invalidate(int(container_id))
             
         return jsonify({'message': '删除成功'})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@files.route('/search')
+@login_required
+def search_files():
+    """在 /data 下按文件名和内容搜索
+
+    结果以换行分隔的 JSON 逐条返回，最后一行为 {"done": true, ...} 汇总，
+    truncated 为 time 或 results 时表示因达到上限提前结束。
+    """
+    try:
+        container_id = request.args.get('container_id')
+        path = request.args.get('path', '/data')
+        user_id = str(session['user']['id'])
+        
+        # 验证容器所有权
+        if not validate_user_container(container_id, user_id):
+            return jsonify({'error': '无权操作此容器'}), 403
+            
+        try:
+            search = FileSearch(
+                name=request.args.get('name', ''),
+                content=request.args.get('content', ''),
+                regex=request.args.get('regex') in ('1', 'true'),
+                ignore_case=request.args.get('case') not in ('1', 'true'),
+                max_results=min(int(request.args.get('limit', SEARCH_MAX_RESULTS)), SEARCH_MAX_RESULTS),
+                time_limit=SEARCH_TIME_LIMIT,
+                max_file_size=SEARCH_MAX_FILE_SIZE
+            )
+            walker = get_files(container_id).walk(path)
+        except (SearchError, ValueError) as e:
+            return jsonify({'error': str(e)}), 400
+        except FileOpError as e:
+            return jsonify({'error': f'搜索失败: {str(e)}'}), 400
+            
+        lines = (json.dumps(item, ensure_ascii=False) + '\n' for item in search.run(walker, path))
+        response = Response(lines, mimetype='application/x-ndjson')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @files.route('/read', methods=['GET'])
 @login_required
 def read_file():
-    """读取文件内容"""
+    """读取文件内容
+
+    按字节区间(offset/length)或按行(line/lines)读取，大文件可分段加载。
+    从头读取时返回整个文件的 sha256，保存时作为基准版本。
+    """
     try:
         container_id = request.args.get('container_id')
         path = request.args.get('path')
         user_id = str(session['user']['id'])
         
         # 验证容器所有权
-        config = load_config()
-        if not validate_user_container(config, container_id, user_id):
+        if not validate_user_container(container_id, user_id):
             return jsonify({'error': '无权操作此容器'}), 403
-            
-        # 获取容器信息
-        container_name = get_container_name(int(container_id))
-        
-        # 读取文件内容
-        cmd = ['sudo', 'docker', 'exec', container_name, 'cat', path]
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        
-        if result.returncode != 0:
-            return jsonify({'error': '读取文件失败'}), 500
-            
-        return jsonify({'content': result.stdout})
+
+        try:
+            length = min(int(request.args.get('length', EDITOR_READ_SIZE)), EDITOR_READ_MAX)
+            offset = int(request.args.get('offset', 0))
+            line = request.args.get('line', type=int)
+            lines = int(request.args.get('lines', 1000))
+            if length < 0 or offset < 0 or lines < 1 or (line is not None and line < 1):
+                raise ValueError
+        except ValueError:
+            return jsonify({'error': '读取范围无效'}), 400
+
+        container_files = get_files(container_id)
+        try:
+            if line is not None:
+                content, offset, more = container_files.read_lines(path, line, lines, length)
+                size = None
+            else:
+                content, size = container_files.read_range(path, offset, length)
+                more = offset + len(content) < size
+            sha256 = container_files.file_hash(path) if offset == 0 else None
+        except FileOpError as e:
+            return jsonify({'error': f'读取文件失败: {str(e)}'}), 500
+
+        if is_binary(content) and offset == 0:
+            return jsonify({'binary': True, 'size': size, 'sha256': sha256})
+        if more:
+            content = trim_utf8(content)
+        text = content.decode(errors='replace')
+        return jsonify({
+            'content': text,
+            'offset': offset,
+            'length': len(content),
+            'size': size,
+            'eof': not more,
+            'next_offset': offset + len(content) if more and offset is not None else None,
+            'binary': False,
+            # 含有无效 UTF-8 时解码结果与原始字节不一致，客户端不应按字节偏移修改
+            'lossless': text.encode() == content,
+            'sha256': sha256
+        })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @files.route('/write', methods=['POST'])
 @login_required
 def write_file():
-    """写入文件内容"""
+    """写入文件内容，提供 base_sha256 时文件已被修改则返回 409"""
     try:
         container_id = request.form.get('container_id')
         path = request.form.get('path')
         content = request.form.get('content')
+        base_sha256 = request.form.get('base_sha256') or None
         user_id = str(session['user']['id'])
         
         # 验证容器所有权
-        config = load_config()
-        if not validate_user_container(config, container_id, user_id):
+        if not validate_user_container(container_id, user_id):
             return jsonify({'error': '无权操作此容器'}), 403
             
-        # 获取容器信息
-        container_name = get_container_name(int(container_id))
-        
-        # 创建临时文件
-        with tempfile.NamedTemporaryFile(mode='w', delete=False) as temp:
-            temp.write(content)
+        # 检查存储空间
+        try:
+            disk.check_quota(int(container_id), len(content.encode()))
+        except QuotaExceeded as e:
+            return jsonify({'error': str(e)}), 507
             
-        # 复制文件到容器
-        cmd = ['sudo', 'docker', 'cp', temp.name, f'{container_name}:{path}']
-        result = subprocess.run(cmd)
-        
-        # 删除临时文件
-        os.unlink(temp.name)
-        
-        if result.returncode != 0:
-            return jsonify({'error': '写入文件失败'}), 500
+        # 写入文件
+        try:
+            sha256 = get_files(container_id).write_file(path, content.encode(), base_sha256)
+        except FileConflict as e:
+            return jsonify({'error': '文件已被修改', 'sha256': e.current_sha256}), 409
+        except FileOpError as e:
+            return jsonify({'error': f'写入文件失败: {str(e)}'}), 500
             
-        return jsonify({'message': '保存成功'})
+        return jsonify({'message': '保存成功', 'sha256': sha256})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@files.route('/patch', methods=['POST'])
+@login_required
+def patch_file():
+    """以补丁方式保存文件
+
+    请求体为 JSON: {container_id, path, base_sha256, patches: [{offset, length, text}]}，
+    offset/length 为原文件中的字节位置。文件已被修改时返回 409 和当前的 sha256。
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        container_id = data.get('container_id')
+        path = data.get('path')
+        base_sha256 = data.get('base_sha256')
+        patches = data.get('patches')
+        user_id = str(session['user']['id'])
+
+        # 验证容器所有权
+        if not validate_user_container(container_id, user_id):
+            return jsonify({'error': '无权操作此容器'}), 403
+
+        if not path or not base_sha256 or not isinstance(patches, list):
+            return jsonify({'error': '参数不完整'}), 400
+
+        # 检查存储空间
+        try:
+            growth = sum(len(p.get('text', '').encode()) - int(p.get('length', 0)) for p in patches)
+            disk.check_quota(int(container_id), max(growth, 0))
+        except QuotaExceeded as e:
+            return jsonify({'error': str(e)}), 507
+        except (AttributeError, TypeError, ValueError):
+            return jsonify({'error': '补丁格式无效'}), 400
+
+        try:
+            sha256 = get_files(container_id).patch_file(path, patches, base_sha256)
+        except FileConflict as e:
+            return jsonify({'error': '文件已被修改', 'sha256': e.current_sha256}), 409
+        except (KeyError, TypeError, ValueError):
+            return jsonify({'error': '补丁格式无效'}), 400
+        except FileOpError as e:
+            return jsonify({'error': f'写入文件失败: {str(e)}'}), 500
+
+        return jsonify({'message': '保存成功', 'sha256': sha256})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -2,41 +2,62 @@ from flask import Blueprint, request, redirect, url_for, render_template, sessio
 from auth import login_required
 from models import ContainerManager
 from utils import validate_user_container
+from registry import get_registry
+from jobs import get_job_queue, Job
+from expiry import get_expiry_reaper
 
 instance = Blueprint('instance', __name__, url_prefix='/instance')
 container_manager = ContainerManager()
+job_queue = get_job_queue()
 
 @instance.route('/create', methods=['POST'])
 @login_required
 def create():
-    """创建实例"""
+    """创建实例：提交后台任务后跳转到进度页面"""
     try:
         container_type = request.form.get('type', 'base')
         user_id = str(session['user']['id'])
         username = f"dotm-{session['user']['username']}"
         
-        # 创建容器
-        container_info, password = container_manager.create_container(
-            user_id=user_id,
-            username=username,
-            container_type=container_type
-        )
+        if get_registry().find_by_user(user_id)[0] is not None:
+            return "用户已经创建了一个实例", 400
         
-        return render_template('instance/success.html',
-            username=container_info['username'],
-            password=password,
-            ssh_port=container_info['ssh_port'],
-            ftp_port=container_info['ftp_port'],
-            http_port=container_info['http_port'],
-            user=session['user'],
-            user_container=True
-        )
-            
-    except ValueError as e:
-        return str(e), 400
+        def run(ctx):
+            with ctx.docker():
+                container_info, password = container_manager.create_container(
+                    user_id=user_id,
+                    username=username,
+                    container_type=container_type,
+                    progress=ctx.progress
+                )
+            return {
+                'username': container_info['username'],
+                'password': password,
+                'ssh_port': container_info['ssh_port'],
+                'ftp_port': container_info['ftp_port'],
+                'http_port': container_info['http_port']
+            }
+        
+        job = Job('create', user_id, '创建实例')
+        job.result_url = url_for('instance.created', job_id=job.id)
+        job_queue.submit(job, run)
+        return redirect(url_for('jobs.job_view', job_id=job.id))
     except Exception as e:
         return f"创建实例失败: {str(e)}", 500
 
+@instance.route('/created/<job_id>')
+@login_required
+def created(job_id):
+    """实例创建完成，显示登录信息"""
+    job = job_queue.get(job_id, str(session['user']['id']))
+    if job is None or job.kind != 'create' or job.status != 'succeeded':
+        return "任务不存在或已过期", 404
+    return render_template('instance/success.html',
+        **job.result,
+        user=session['user'],
+        user_container=True
+    )
+
 @instance.route('/remove', methods=['POST'])
 @login_required
 def remove():
@@ -60,31 +81,28 @@ def renew():
     """续期实例"""
     try:
         from datetime import datetime, timedelta
-        from utils import load_config, save_config, calculate_expiry
+        from utils import calculate_expiry
         
         container_id = request.form.get('container_id')
         user_id = str(session['user']['id'])
         
-        config = load_config()
-        if not validate_user_container(config, container_id, user_id):
+        if not validate_user_container(container_id, user_id):
             return "无权操作此容器", 403
             
-        container_info = config['containers'][container_id]
-        
-        # 计算新的过期时间
-        expires_at_str = container_info['expires_at'].rstrip('Z').split('.')[0]
-        expires_at = datetime.strptime(expires_at_str, '%Y-%m-%dT%H:%M:%S')
-        now = datetime.utcnow()
-        
-        # 如果已过期，从当前时间开始计算
-        if expires_at < now:
-            new_expires_at = calculate_expiry(days=5)
-        else:
+        def renew_expiry(container_info):
+            # 计算新的过期时间
+            expires_at_str = container_info['expires_at'].rstrip('Z').split('.')[0]
+            expires_at = datetime.strptime(expires_at_str, '%Y-%m-%dT%H:%M:%S')
+            now = datetime.utcnow()
+            
+            # 如果已过期，从当前时间开始计算
+            if expires_at < now:
+                return {'expires_at': calculate_expiry(days=5)}
             # 如果未过期，从原有期限开始追加
-            new_expires_at = calculate_expiry(days=5, from_date=expires_at)
+            return {'expires_at': calculate_expiry(days=5, from_date=expires_at)}
             
-        config['containers'][container_id]['expires_at'] = new_expires_at
-        save_config(config)
+        container_info = get_registry().update_container(container_id, renew_expiry)
+        get_expiry_reaper().schedule(container_id, container_info['expires_at'])
         
         return redirect(url_for('index.index_view'))
     except Exception as e:
@@ -0,0 +1,38 @@
+from flask import Blueprint, render_template, session, jsonify
+from flask_socketio import emit, join_room
+from auth import login_required
+from app import socketio
+from jobs import get_job_queue, JobQueue
+
+jobs = Blueprint('jobs', __name__, url_prefix='/jobs')
+job_queue = get_job_queue()
+
+@jobs.route('/<job_id>')
+@login_required
+def job_view(job_id):
+    """任务进度页面，完成后跳转到结果页面"""
+    job = job_queue.get(job_id, str(session['user']['id']))
+    if job is None:
+        return "任务不存在或已过期", 404
+    return render_template('jobs/progress.html', job=job.to_dict(), user=session['user'])
+
+@jobs.route('/<job_id>/status')
+@login_required
+def job_status(job_id):
+    """查询任务状态"""
+    job = job_queue.get(job_id, str(session['user']['id']))
+    if job is None:
+        return jsonify({'error': '任务不存在或已过期'}), 404
+    return jsonify(job.to_dict())
+
+@socketio.on('job_subscribe')
+def handle_job_subscribe(data):
+    """订阅任务进度，订阅后立即推送一次当前状态"""
+    if 'user' not in session:
+        return
+    job = job_queue.get(str(data.get('job_id')), str(session['user']['id']))
+    if job is None:
+        emit('job_error', {'error': '任务不存在或已过期'})
+        return
+    join_room(JobQueue.room(job.id))
+    emit('job_progress', job.to_dict())
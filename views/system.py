@@ -1,24 +1,24 @@
 from flask import Blueprint, request, redirect, url_for, render_template, session, jsonify
-from flask_socketio import emit
+from flask_socketio import emit, join_room
 from auth import login_required
 from app import socketio
-import threading
-import time
-import subprocess
 from models import DockerManager
+from engine import EngineError
+from collector import get_collector
+from config import COLLECTOR_INTERVAL
 from utils import (
     validate_user_container,
     get_container_name,
     generate_password,
-    load_config,
-    save_config
+    get_container_info
 )
+from registry import get_registry
+from jobs import get_job_queue, Job, JobError
 
 system = Blueprint('system', __name__, url_prefix='/system')
 docker_manager = DockerManager()
-
-# 存储状态更新线程
-status_threads = {}
+collector = get_collector()
+job_queue = get_job_queue()
 
 @system.route('/dashboard')
 @login_required
@@ -29,8 +29,7 @@ def dashboard():
         user_id = str(session['user']['id'])
         
         # 验证容器所有权
-        config = load_config()
-        if not validate_user_container(config, container_id, user_id):
+        if not validate_user_container(container_id, user_id):
             return "无权操作此容器", 403
             
         return render_template('system/dashboard.html',
@@ -49,37 +48,17 @@ def get_status():
         user_id = str(session['user']['id'])
         
         # 验证容器所有权
-        config = load_config()
-        if not validate_user_container(config, container_id, user_id):
+        if not validate_user_container(container_id, user_id):
             return jsonify({'error': '无权操作此容器'}), 403
             
-        container_name = get_container_name(int(container_id))
-        status = docker_manager.get_container_status(container_name)
+        # 优先使用采集器缓存的快照
+        status = collector.get(container_id, max_age=COLLECTOR_INTERVAL * 2)
+        if status is None:
+            status = collector.sample(container_id)
         return jsonify(status)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-def send_status_updates(container_id: str, user_id: str):
-    """定时发送状态更新"""
-    while True:
-        try:
-            # 验证容器所有权
-            config = load_config()
-            if not validate_user_container(config, container_id, user_id):
-                break
-                
-            container_name = get_container_name(int(container_id))
-            status = docker_manager.get_container_status(container_name)
-            
-            # 发送状态更新
-            socketio.emit(f'status_update_{container_id}', status, room=user_id)
-            
-            # 每3秒更新一次
-            time.sleep(3)
-        except Exception as e:
-            print(f"状态更新错误: {str(e)}")
-            break
-
 @socketio.on('connect')
 def handle_connect():
     """处理websocket连接"""
@@ -97,39 +76,18 @@ def handle_join(data):
     user_id = str(session['user']['id'])
     
     # 验证容器所有权
-    config = load_config()
-    if not validate_user_container(config, container_id, user_id):
+    if not validate_user_container(container_id, user_id):
         return
         
-    # 加入用户专属房间
+    # 加入容器状态房间，由全局采集器统一推送
+    join_room(collector.room(container_id))
     emit('join', {'status': 'success'})
+    collector.start(socketio)
     
-    # 停止已存在的状态更新线程
-    thread_key = f"{container_id}_{user_id}"
-    if thread_key in status_threads:
-        status_threads[thread_key] = False
-    
-    # 启动新的状态更新线程
-    status_thread = threading.Thread(
-        target=send_status_updates,
-        args=(container_id, user_id)
-    )
-    status_thread.daemon = True
-    status_threads[thread_key] = True
-    status_thread.start()
-
-@socketio.on('disconnect')
-def handle_disconnect():
-    """处理断开连接"""
-    if 'user' not in session:
-        return
-        
-    user_id = str(session['user']['id'])
-    
-    # 停止所有该用户的状态更新线程
-    for thread_key in list(status_threads.keys()):
-        if thread_key.endswith(user_id):
-            status_threads[thread_key] = False
+    # 立即发送最近一次的快照
+    status = collector.get(container_id)
+    if status is not None:
+        emit(collector.event(container_id), status)
 
 @system.route('/reset_password', methods=['POST'])
 @login_required
@@ -140,11 +98,10 @@ def reset_password():
         user_id = str(session['user']['id'])
         
         # 验证容器所有权
-        config = load_config()
-        if not validate_user_container(config, container_id, user_id):
+        if not validate_user_container(container_id, user_id):
             return "无权操作此容器", 403
             
-        container_info = config['containers'][container_id]
+        container_info = get_container_info(container_id)
         
         # 生成新密码
         new_password = generate_password()
@@ -156,13 +113,12 @@ def reset_password():
             return "容器不存在", 404
             
         try:
-            subprocess.run(['sudo', 'docker', 'exec', container_name, '/usr/local/bin/create_user.sh', container_info['username'], new_password], check=True)
-        except subprocess.CalledProcessError as e:
-            return f"重置密码失败: {e.stderr.decode() if e.stderr else str(e)}", 500
+            docker_manager.check_exec(container_name, ['/usr/local/bin/create_user.sh', container_info['username'], new_password])
+        except EngineError as e:
+            return f"重置密码失败: {str(e)}", 500
         
         # 更新配置中的密码
-        config['containers'][container_id]['password'] = new_password
-        save_config(config)
+        get_registry().update_container(container_id, {'password': new_password})
         
         return render_template('system/password_reset.html',
                              username=container_info['username'],
@@ -175,59 +131,63 @@ def reset_password():
 @system.route('/reset', methods=['POST'])
 @login_required
 def reset_system():
-    """重置系统"""
+    """重置系统：提交后台任务后跳转到进度页面"""
     try:
         container_id = request.form.get('container_id')
         user_id = str(session['user']['id'])
         
         # 验证容器所有权
-        config = load_config()
-        if not validate_user_container(config, container_id, user_id):
+        if not validate_user_container(container_id, user_id):
             return "无权操作此容器", 403
             
-        container_info = config['containers'][container_id]
+        container_info = get_container_info(container_id)
         container_name = get_container_name(int(container_id))
         
-        # 停止并删除旧容器
-        old_container = docker_manager.get_container(container_name)
-        if old_container:
-            try:
-                subprocess.run(['sudo', 'docker', 'stop', container_name], check=True)
-                subprocess.run(['sudo', 'docker', 'rm', container_name], check=True)
-            except subprocess.CalledProcessError as e:
-                return f"停止并删除旧容器失败: {e.stderr.decode() if e.stderr else str(e)}", 500
-        
-        # 生成新密码
-        new_password = generate_password()
-        
-        # 创建新容器
-        container_type = container_info.get('type', 'base')
-        image_name = f'dotmachine-{container_type}'
-        
-        # 创建数据目录
-        from utils import ensure_data_dir
-        data_dir = ensure_data_dir(int(container_id))
-        
-        # 创建新容器
-        container = docker_manager.create_container(
-            container_id=int(container_id),
-            username=container_info['username'],
-            password=new_password,
-            container_type=container_type
-        )
-        
-        # 更新配置中的密码
-        config['containers'][container_id]['password'] = new_password
-        save_config(config)
-        
-        return render_template('system/system_reset.html',
-                             username=container_info['username'],
-                             password=new_password,
-                             user=session['user'],
-                             user_container=True)
+        def run(ctx):
+            with ctx.docker():
+                # 停止并删除旧容器
+                ctx.progress(10, '正在删除旧容器')
+                old_container = docker_manager.get_container(container_name)
+                if old_container:
+                    try:
+                        old_container.stop()
+                        old_container.remove()
+                    except EngineError as e:
+                        raise JobError(f"停止并删除旧容器失败: {str(e)}")
+                
+                # 生成新密码并创建新容器
+                ctx.progress(40, '正在创建新容器')
+                new_password = generate_password()
+                docker_manager.create_container(
+                    container_id=int(container_id),
+                    username=container_info['username'],
+                    password=new_password,
+                    container_type=container_info.get('type', 'base')
+                )
+            
+            # 更新配置中的密码
+            get_registry().update_container(container_id, {'password': new_password})
+            return {'username': container_info['username'], 'password': new_password}
+        
+        job = Job('reset', user_id, '重置系统')
+        job.result_url = url_for('system.reset_result', job_id=job.id)
+        job_queue.submit(job, run)
+        return redirect(url_for('jobs.job_view', job_id=job.id))
     except Exception as e:
         return f"重置系统失败: {str(e)}", 500
 
+@system.route('/reset/<job_id>')
+@login_required
+def reset_result(job_id):
+    """系统重置完成，显示新的登录信息"""
+    job = job_queue.get(job_id, str(session['user']['id']))
+    if job is None or job.kind != 'reset' or job.status != 'succeeded':
+        return "任务不存在或已过期", 404
+    return render_template('system/system_reset.html',
+                         **job.result,
+                         user=session['user'],
+                         user_container=True)
+
 @system.route('/power/<action>', methods=['POST'])
 @login_required
 def power_action(action):
@@ -237,29 +197,29 @@ def power_action(action):
         user_id = str(session['user']['id'])
         
         # 验证容器所有权
-        config = load_config()
-        if not validate_user_container(config, container_id, user_id):
+        if not validate_user_container(container_id, user_id):
             return "无权操作此容器", 403
             
+        if action not in ('start', 'stop', 'restart'):
+            return "无效的操作", 400
+            
         # 获取容器
         container_name = get_container_name(int(container_id))
         container = docker_manager.get_container(container_name)
         if not container:
             return "容器不存在", 404
             
-        # 执行操作
-        try:
-            if action == 'start':
-                subprocess.run(['sudo', 'docker', 'start', container_name], check=True)
-            elif action == 'stop':
-                subprocess.run(['sudo', 'docker', 'stop', container_name], check=True)
-            elif action == 'restart':
-                subprocess.run(['sudo', 'docker', 'restart', container_name], check=True)
-            else:
-                return "无效的操作", 400
-        except subprocess.CalledProcessError as e:
-            return f"操作失败: {e.stderr.decode() if e.stderr else str(e)}", 500
-        
-        return redirect(url_for('index.index_view'))
+        def run(ctx):
+            ctx.progress(20, {'start': '正在启动', 'stop': '正在停止', 'restart': '正在重启'}[action])
+            try:
+                with ctx.docker():
+                    getattr(container, action)()
+            except EngineError as e:
+                raise JobError(f"操作失败: {str(e)}")
+        
+        titles = {'start': '启动实例', 'stop': '停止实例', 'restart': '重启实例'}
+        job = Job('power', user_id, titles[action], url_for('index.index_view'))
+        job_queue.submit(job, run)
+        return redirect(url_for('jobs.job_view', job_id=job.id))
     except Exception as e:
         return f"操作失败: {str(e)}", 500
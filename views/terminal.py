@@ -1,23 +1,27 @@
-from flask import Blueprint, render_template, session, request
-from flask_socketio import emit, join_room, leave_room
+from flask import Blueprint, render_template, session, request, jsonify
+from flask_socketio import emit
 from auth import login_required
 from app import socketio
-from utils import validate_user_container, get_container_name, load_config
+from utils import validate_user_container, get_container_name, get_container_info
 from models import DockerManager
-import pty
-import os
-import termios
-import struct
-import fcntl
-import subprocess
-import select
-import threading
+from engine import EngineError
+from termio import OutputPipeline
+from ptymux import TerminalSession, TerminalViewer, open_terminal, get_multiplexer
+from config import (TERMINAL_FLUSH_INTERVAL, TERMINAL_MAX_FRAME, TERMINAL_MAX_INFLIGHT,
+                    TERMINAL_SCROLLBACK, TERMINAL_MAX_SESSIONS)
 
 terminal = Blueprint('terminal', __name__, url_prefix='/terminal')
 docker_manager = DockerManager()
 
-# 存储终端进程
-terminals = {}
+# 终端会话由多路复用器统一管理，以会话ID为键，连接断开后会话保留，可重新附加
+multiplexer = get_multiplexer()
+
+CLOSE_MESSAGES = {
+    'exited': '终端进程已退出',
+    'idle': '终端长时间无操作，已自动断开',
+    'detached': '终端长时间无连接，已自动关闭',
+    'evicted': '终端会话过多，已关闭最早的会话'
+}
 
 @terminal.route('/')
 @login_required
@@ -28,8 +32,7 @@ def terminal_view():
         user_id = str(session['user']['id'])
         
         # 验证容器所有权
-        config = load_config()
-        if not validate_user_container(config, container_id, user_id):
+        if not validate_user_container(container_id, user_id):
             return "无权操作此容器", 403
             
         return render_template('terminal/terminal.html',
@@ -38,147 +41,142 @@ def terminal_view():
     except Exception as e:
         return f"加载终端失败: {str(e)}", 500
 
-def set_winsize(fd, row, col, xpix=0, ypix=0):
-    """设置终端窗口大小"""
-    winsize = struct.pack('HHHH', row, col, xpix, ypix)
-    fcntl.ioctl(fd, termios.TIOCSWINSZ, winsize)
+@terminal.route('/stats')
+@login_required
+def terminal_stats():
+    """当前用户的终端会话数量统计"""
+    return jsonify(multiplexer.stats(user_id=str(session['user']['id'])))
 
-def read_and_forward_terminal_output(fd, pid, container_id, user_id):
-    """读取并转发终端输出"""
-    max_read_bytes = 1024 * 20
-    thread_key = f"{container_id}_{user_id}"
-    
-    while thread_key in terminals:
-        timeout_sec = 0.1
-        (data_ready, _, _) = select.select([fd], [], [], timeout_sec)
-        if data_ready:
-            try:
-                output = os.read(fd, max_read_bytes)
-                socketio.emit(
-                    f'terminal_output_{container_id}',
-                    {'output': output.decode()},
-                    room=user_id
-                )
-            except Exception as e:
-                print(f"读取终端输出错误: {str(e)}")
-                break
+def get_owned_session(session_id, container_id):
+    """返回属于当前用户和容器的终端会话，不存在或无权访问时返回 None"""
+    if 'user' not in session or not session_id:
+        return None
+    term_session = multiplexer.get(session_id)
+    if term_session is None or term_session.closed:
+        return None
+    if term_session.info.get('container_id') != str(container_id) or \
+            term_session.info.get('user_id') != str(session['user']['id']):
+        return None
+    return term_session
+
+def get_session_key(data):
+    """返回当前连接已附加的终端会话ID，未附加时返回 None"""
+    term_session = get_owned_session(data.get('session_id'), data.get('container_id'))
+    if term_session is None or not term_session.has_viewer(request.sid):
+        return None
+    return term_session.key
+
+def create_viewer(container_id):
+    """为当前连接创建观看者，输出合并成帧后只发给该连接，客户端写入终端后确认"""
+    sid = request.sid
+    def send_frame(text, ack, offset):
+        socketio.emit(f'terminal_output_{container_id}', {'output': text, 'offset': offset},
+                      to=sid, callback=ack)
+    pipeline = OutputPipeline(
+        send_frame,
+        flush_interval=TERMINAL_FLUSH_INTERVAL,
+        max_frame=TERMINAL_MAX_FRAME,
+        max_inflight=TERMINAL_MAX_INFLIGHT
+    )
+    return TerminalViewer(sid, pipeline)
+
+def notify_closed(term_session, reason):
+    """通知会话的所有观看者终端已关闭"""
+    message = CLOSE_MESSAGES.get(reason)
+    if not message:
+        return
+    for sid in list(term_session.viewers):
+        socketio.emit('terminal_closed', {'session_id': term_session.key, 'reason': reason, 'message': message}, to=sid)
 
 @socketio.on('terminal_input')
 def handle_terminal_input(data):
     """处理终端输入"""
-    if 'user' not in session:
-        return
-        
-    container_id = data.get('container_id')
-    user_id = str(session['user']['id'])
-    
-    # 验证容器所有权
-    config = load_config()
-    if not validate_user_container(config, container_id, user_id):
-        return
-        
-    thread_key = f"{container_id}_{user_id}"
-    if thread_key in terminals:
-        fd = terminals[thread_key].get('fd')
-        if fd:
-            os.write(fd, data['input'].encode())
+    key = get_session_key(data)
+    if key:
+        multiplexer.write(key, data['input'].encode())
 
 @socketio.on('terminal_resize')
 def handle_terminal_resize(data):
     """处理终端大小调整"""
-    if 'user' not in session:
-        return
-        
-    container_id = data.get('container_id')
-    user_id = str(session['user']['id'])
-    
-    # 验证容器所有权
-    config = load_config()
-    if not validate_user_container(config, container_id, user_id):
-        return
-        
-    thread_key = f"{container_id}_{user_id}"
-    if thread_key in terminals:
-        fd = terminals[thread_key].get('fd')
-        if fd:
-            set_winsize(fd, data['rows'], data['cols'])
+    key = get_session_key(data)
+    if key:
+        multiplexer.resize(key, data['rows'], data['cols'])
 
 @socketio.on('terminal_connect')
 def handle_terminal_connect(data):
-    """处理终端连接"""
+    """处理终端连接，携带会话ID时重新附加到已有会话"""
     if 'user' not in session:
         return
         
-    container_id = data.get('container_id')
+    container_id = str(data.get('container_id'))
     user_id = str(session['user']['id'])
     
     # 验证容器所有权
-    config = load_config()
-    if not validate_user_container(config, container_id, user_id):
+    if not validate_user_container(container_id, user_id):
+        return
+    
+    multiplexer.start(socketio)
+    
+    # 重新附加: 只补发客户端 offset 之后的输出
+    term_session = get_owned_session(data.get('session_id'), container_id)
+    if term_session is not None:
+        multiplexer.attach(term_session.key, create_viewer(container_id), int(data.get('offset') or 0))
+        multiplexer.resize(term_session.key, data['rows'], data['cols'])
+        emit('terminal_connected', {'status': 'success', 'session_id': term_session.key, 'resumed': True})
         return
         
     # 获取容器信息
-    container_info = config['containers'][container_id]
+    container_info = get_container_info(container_id)
     container_name = get_container_name(int(container_id))
     
-    # 创建伪终端
-    parent_fd, child_fd = pty.openpty()
-    
-    # 在容器中启动shell
     container = docker_manager.get_container(container_name)
     if not container:
         emit('terminal_error', {'error': '容器不存在'})
         return
-        
-    # 使用docker exec启动shell
-    cmd = ['sudo', 'docker', 'exec', '-it', container_name, 'su', '-', container_info['username']]
-    p = subprocess.Popen(
-        cmd,
-        stdin=child_fd,
-        stdout=child_fd,
-        stderr=child_fd,
-        preexec_fn=os.setsid
-    )
     
-    # 设置终端大小
-    set_winsize(parent_fd, data['rows'], data['cols'])
-    
-    # 存储终端信息
-    thread_key = f"{container_id}_{user_id}"
-    terminals[thread_key] = {
-        'fd': parent_fd,
-        'pid': p.pid,
-        'container_name': container_name
-    }
+    # 会话数达到上限时关闭最早的无连接会话
+    existing = multiplexer.find(container_id=container_id)
+    if len(existing) >= TERMINAL_MAX_SESSIONS:
+        detached = sorted((s for s in existing if not s.viewers), key=lambda s: s.created_at)
+        if not detached:
+            emit('terminal_error', {'error': f'每个容器最多同时打开 {TERMINAL_MAX_SESSIONS} 个终端'})
+            return
+        multiplexer.close(detached[0].key, 'evicted')
+        
+    # 以容器用户身份启动登录shell
+    try:
+        channel = open_terminal(docker_manager.engine, container_name, container_info['username'],
+                                data['rows'], data['cols'])
+    except (EngineError, OSError) as e:
+        emit('terminal_error', {'error': f'启动终端失败: {str(e)}'})
+        return
     
-    # 启动输出转发线程
-    terminal_thread = threading.Thread(
-        target=read_and_forward_terminal_output,
-        args=(parent_fd, p.pid, container_id, user_id)
+    term_session = TerminalSession(
+        channel, TERMINAL_SCROLLBACK, notify_closed,
+        container_id=container_id,
+        user_id=user_id,
+        container_name=container_name
     )
-    terminal_thread.daemon = True
-    terminal_thread.start()
+    multiplexer.open(term_session)
+    multiplexer.attach(term_session.key, create_viewer(container_id))
     
-    emit('terminal_connected', {'status': 'success'})
+    emit('terminal_connected', {'status': 'success', 'session_id': term_session.key, 'resumed': False})
 
 @socketio.on('terminal_disconnect')
 def handle_terminal_disconnect(data):
-    """处理终端断开连接"""
-    if 'user' not in session:
-        return
-        
-    container_id = data.get('container_id')
-    user_id = str(session['user']['id'])
-    thread_key = f"{container_id}_{user_id}"
-    
-    if thread_key in terminals:
-        # 关闭终端
-        try:
-            fd = terminals[thread_key].get('fd')
-            if fd:
-                os.close(fd)
-        except Exception as e:
-            print(f"关闭终端错误: {str(e)}")
-            
-        # 移除终端信息
-        del terminals[thread_key]
+    """处理终端断开连接，会话保留以便重新附加"""
+    key = get_session_key(data)
+    if key:
+        multiplexer.detach(key, request.sid)
+
+@socketio.on('terminal_close')
+def handle_terminal_close(data):
+    """结束终端会话"""
+    key = get_session_key(data)
+    if key:
+        multiplexer.close(key)
+
+@socketio.on('disconnect')
+def handle_disconnect():
+    """连接断开时离开其附加的终端会话"""
+    multiplexer.detach_all(request.sid)
@@ -1,16 +1,21 @@
-from flask import Blueprint, request, redirect, url_for, render_template, session
+import urllib.parse
+from flask import Blueprint, request, redirect, url_for, render_template, session, jsonify
 from auth import login_required
 from models import DockerManager
 from utils import (
     validate_domain,
     validate_user_container,
     get_container_name,
-    load_config,
-    save_config
+    get_container_info
 )
+from registry import get_registry, RegistryError
+from jobs import get_job_queue, Job, JobError
+from hostproxy import get_route_table
+from router import admin_request
 
 website = Blueprint('website', __name__, url_prefix='/website')
 docker_manager = DockerManager()
+job_queue = get_job_queue()
 
 @website.route('/add', methods=['POST'])
 @login_required
@@ -18,7 +23,8 @@ def add():
     """添加网站"""
     try:
         container_id = request.form.get('container_id')
-        domain = request.form.get('domain')
+        # 域名不区分大小写，统一以小写登记
+        domain = (request.form.get('domain') or '').strip().lower()
         user_id = str(session['user']['id'])
         
         # 验证域名格式
@@ -26,8 +32,7 @@ def add():
             return "无效的域名格式", 400
             
         # 验证容器所有权
-        config = load_config()
-        if not validate_user_container(config, container_id, user_id):
+        if not validate_user_container(container_id, user_id):
             return "无权操作此容器", 403
             
         # 获取容器
@@ -36,19 +41,26 @@ def add():
         if not container:
             return "容器不存在", 404
             
-        # 在容器中创建网站配置
-        result = container.exec_run(['/usr/local/bin/generate_nginx_config.sh', domain])
-        if result.exit_code != 0:
-            return f"创建网站配置失败: {result.output.decode()}", 500
+        # 先登记域名，域名已被其他实例占用时直接返回
+        registry = get_registry()
+        added = registry.add_website(container_id, domain)
             
-        # 更新配置
-        if 'websites' not in config['containers'][container_id]:
-            config['containers'][container_id]['websites'] = []
-        if domain not in config['containers'][container_id]['websites']:
-            config['containers'][container_id]['websites'].append(domain)
-            save_config(config)
+        # 在容器中创建网站配置
+        def run(ctx):
+            ctx.progress(30, '正在生成网站配置')
+            result = container.exec_run(['/usr/local/bin/generate_nginx_config.sh', domain])
+            if result.exit_code != 0:
+                if added:
+                    registry.remove_website(container_id, domain)
+                raise JobError(f"创建网站配置失败: {result.output.decode(errors='replace')}")
+            # 主机路由表合并短时间内的多次变化，只重载一次
+            get_route_table().schedule()
         
-        return redirect(url_for('index.index_view'))
+        job = Job('website', user_id, f'添加网站 {domain}', url_for('index.index_view'))
+        job_queue.submit(job, run)
+        return redirect(url_for('jobs.job_view', job_id=job.id))
+    except RegistryError as e:
+        return str(e), 409
     except Exception as e:
         return f"添加网站失败: {str(e)}", 500
 
@@ -62,8 +74,7 @@ def remove():
         user_id = str(session['user']['id'])
         
         # 验证容器所有权
-        config = load_config()
-        if not validate_user_container(config, container_id, user_id):
+        if not validate_user_container(container_id, user_id):
             return "无权操作此容器", 403
             
         # 获取容器
@@ -72,21 +83,51 @@ def remove():
         if not container:
             return "容器不存在", 404
             
-        # 删除网站配置和目录
-        container.exec_run(['rm', '-f', f'/etc/nginx/sites-enabled/{domain}.conf'])
-        container.exec_run(['rm', '-rf', f'/data/www/{domain}'])
-        container.exec_run(['nginx', '-s', 'reload'])
+        # 只能删除已登记的域名，避免拼出任意路径
+        if not validate_domain(domain):
+            return "无效的域名格式", 400
+        if domain not in get_container_info(container_id).get('websites', []):
+            return "网站不存在", 404
+            
+        # 删除网站配置和目录，一次 exec 完成
+        container.exec_run(['sh', '-c',
+                            'rm -f "/etc/nginx/sites-enabled/$1.conf" && rm -rf "/data/www/$1" && nginx -s reload',
+                            'sh', domain])
         
         # 更新配置
-        if 'websites' in config['containers'][container_id]:
-            if domain in config['containers'][container_id]['websites']:
-                config['containers'][container_id]['websites'].remove(domain)
-                save_config(config)
+        get_registry().remove_website(container_id, domain)
+        get_route_table().schedule()
         
         return redirect(url_for('index.index_view'))
     except Exception as e:
         return f"删除网站失败: {str(e)}", 500
 
+@website.route('/purge_cache', methods=['POST'])
+@login_required
+def purge_cache():
+    """清除前端路由中该网站的缓存"""
+    try:
+        container_id = request.form.get('container_id')
+        domain = request.form.get('domain', '')
+        prefix = request.form.get('prefix', '')
+        user_id = str(session['user']['id'])
+        
+        # 验证容器所有权和域名归属
+        if not validate_user_container(container_id, user_id):
+            return jsonify({'error': '无权操作此容器'}), 403
+        if domain not in get_container_info(container_id).get('websites', []):
+            return jsonify({'error': '网站不存在'}), 404
+            
+        query = urllib.parse.urlencode({'domain': domain, 'prefix': prefix})
+        try:
+            result = admin_request('POST', f'/purge?{query}')
+        except OSError:
+            return jsonify({'error': '前端路由未运行'}), 503
+        
+        return jsonify({'success': True, 'purged': result.get('purged', 0)})
+    except Exception as e:
+        return jsonify({'error': f'清除缓存失败: {str(e)}'}), 500
+
 @website.route('/list', methods=['GET'])
 @login_required
 def list_websites():
@@ -96,12 +137,11 @@ def list_websites():
         user_id = str(session['user']['id'])
         
         # 验证容器所有权
-        config = load_config()
-        if not validate_user_container(config, container_id, user_id):
+        if not validate_user_container(container_id, user_id):
             return "无权操作此容器", 403
             
         # 获取网站列表
-        websites = config['containers'][container_id].get('websites', [])
+        websites = get_container_info(container_id).get('websites', [])
         
         return render_template('website/list.html', 
                              websites=websites, 